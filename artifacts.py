@@ -0,0 +1,303 @@
+"""
+上传文件和转换结果的索引与保留清理
+
+每次上传分配一个不会冲突的文件ID，索引中记录该ID下的各个文件（原文件、原始文本、
+Markdown、翻译）及其总大小，下载时按ID直接查找，无需扫描上传目录。
+
+后台清理线程定期删除超过保留时间的文件，并在总大小超过上限时从最早的上传开始删除；
+索引之外的遗留文件（如索引建立前上传的文件）也按保留时间清理。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+from utils import clean_temp_files
+
+
+def new_file_id() -> str:
+    """生成文件ID：时间戳便于阅读，随机后缀保证同一秒内的上传也不会冲突"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+class SQLiteArtifactIndex:
+    """本地SQLite索引，同一台机器上的多个Web进程可以共用"""
+
+    def __init__(self, path: str):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    file_id TEXT PRIMARY KEY,
+                    files TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    content_hash TEXT
+                );
+                CREATE INDEX IF NOT EXISTS artifacts_created ON artifacts (created_at);
+            """)
+            columns = [row[1] for row in self._conn.execute('PRAGMA table_info(artifacts)')]
+            if 'content_hash' not in columns:
+                # 旧版索引没有内容哈希列
+                self._conn.execute('ALTER TABLE artifacts ADD COLUMN content_hash TEXT')
+
+    def put(self, file_id: str, record: Dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO artifacts (file_id, files, size, created_at, completed, content_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (file_id, json.dumps(record['files']), record['size'], record['created_at'],
+                 int(record['completed']), record.get('content_hash'))
+            )
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT files, size, created_at, completed, content_hash FROM artifacts WHERE file_id = ?',
+                (file_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'files': json.loads(row[0]), 'size': row[1], 'created_at': row[2], 'completed': bool(row[3]),
+                'content_hash': row[4]}
+
+    def delete(self, file_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM artifacts WHERE file_id = ?', (file_id,))
+
+    def list_oldest(self) -> List[tuple]:
+        """按上传时间从早到晚返回 (文件ID, 大小, 上传时间, 是否完成)"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT file_id, size, created_at, completed FROM artifacts ORDER BY created_at'
+            ).fetchall()
+
+
+class RedisArtifactIndex:
+    """Redis索引，多个Web进程共享（上传目录需位于共享存储上）"""
+
+    def __init__(self, client, prefix: str = 'artifact'):
+        """
+        Args:
+            client: Redis连接（decode_responses=True）
+            prefix: 键前缀
+        """
+        self.client = client
+        self.prefix = f'{prefix}:'
+        self.created_key = f'{prefix}:created'
+
+    def put(self, file_id: str, record: Dict) -> None:
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + file_id, json.dumps(record))
+        pipe.zadd(self.created_key, {file_id: record['created_at']})
+        pipe.execute()
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        data = self.client.get(self.prefix + file_id)
+        return json.loads(data) if data else None
+
+    def delete(self, file_id: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.delete(self.prefix + file_id)
+        pipe.zrem(self.created_key, file_id)
+        pipe.execute()
+
+    def list_oldest(self) -> List[tuple]:
+        file_ids = self.client.zrange(self.created_key, 0, -1)
+        if not file_ids:
+            return []
+        records = self.client.mget([self.prefix + file_id for file_id in file_ids])
+        rows = []
+        for file_id, data in zip(file_ids, records):
+            if data is None:
+                self.client.zrem(self.created_key, file_id)
+                continue
+            record = json.loads(data)
+            rows.append((file_id, record['size'], record['created_at'], record['completed']))
+        return rows
+
+
+class ArtifactStore:
+    """上传目录中各次上传的文件"""
+
+    def __init__(self, directory: str, index, max_age: float, max_total_size: int):
+        """
+        Args:
+            directory: 上传目录
+            index: SQLiteArtifactIndex 或 RedisArtifactIndex
+            max_age: 保留时间（秒）
+            max_total_size: 已完成转换的文件总大小上限（字节）
+        """
+        self.directory = directory
+        self.index = index
+        self.max_age = max_age
+        self.max_total_size = max_total_size
+        self._sweeper = None
+
+    def register(self, file_id: str, files: Dict[str, str], completed: bool = False,
+                 content_hash: Optional[str] = None) -> None:
+        """
+        记录（或更新）一次上传的文件
+
+        Args:
+            file_id: 文件ID
+            files: 文件类型（source、raw、markdown、translated）到上传目录中文件名的映射
+            completed: 转换是否已完成；只有已完成的上传会因总大小超限被删除
+            content_hash: 原文件的内容哈希（缩略图缓存使用）
+        """
+        record = self.index.get(file_id) or {'files': {}, 'created_at': time.time()}
+        record['files'].update(files)
+        record['completed'] = completed
+        if content_hash is not None:
+            record['content_hash'] = content_hash
+        record['size'] = sum(
+            os.path.getsize(path) for path in map(self._path, record['files'].values()) if os.path.exists(path)
+        )
+        self.index.put(file_id, record)
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        """获取一次上传的索引记录，不存在时返回None"""
+        return self.index.get(file_id)
+
+    def find(self, file_id: str, file_type: str) -> Optional[str]:
+        """
+        查找文件路径
+
+        Args:
+            file_id: 文件ID
+            file_type: 文件类型，或该上传下的完整文件名
+
+        Returns:
+            文件路径，不存在时返回None
+        """
+        record = self.index.get(file_id)
+        if record is None:
+            return None
+        files = record['files']
+        filename = files.get(file_type) or (file_type if file_type in files.values() else None)
+        if filename is None:
+            return None
+        path = self._path(filename)
+        return os.path.abspath(path) if os.path.exists(path) else None
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def remove(self, file_id: str) -> None:
+        """删除一次上传的所有文件（都以文件ID为前缀）"""
+        clean_temp_files(self.directory, f'{file_id}_*')
+        self.index.delete(file_id)
+
+    def sweep(self) -> int:
+        """
+        删除过期的上传，并在总大小超限时从最早的已完成上传开始删除
+
+        Returns:
+            删除的上传数
+        """
+        expire_before = time.time() - self.max_age
+        removed = 0
+        kept = []
+        indexed = set()
+        for file_id, size, created_at, completed in self.index.list_oldest():
+            if created_at < expire_before:
+                self.remove(file_id)
+                removed += 1
+                continue
+            indexed.add(file_id)
+            if completed:
+                kept.append((file_id, size))
+
+        total_size = sum(size for _, size in kept)
+        for file_id, size in kept:
+            if total_size <= self.max_total_size:
+                break
+            self.remove(file_id)
+            total_size -= size
+            removed += 1
+
+        self._sweep_unindexed(indexed, expire_before)
+        if removed:
+            print(f"已清理 {removed} 次上传的文件")
+        return removed
+
+    def _sweep_unindexed(self, indexed: set, expire_before: float) -> int:
+        """
+        删除索引之外的过期遗留文件（如索引建立前上传的文件）
+
+        文件名以文件ID加下划线开头时属于索引中的上传（可能仍在转换，原文件的修改时间
+        早于保留时间），由索引按上传时间清理，这里跳过
+
+        Returns:
+            删除的文件数
+        """
+        removed = 0
+        for entry in os.scandir(self.directory):
+            parts = entry.name.split('_')
+            if any('_'.join(parts[:count]) in indexed for count in range(1, len(parts))):
+                continue
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expire_before:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def start_sweeper(self, interval: float, extra_tasks: Sequence[Callable[[], object]] = ()) -> None:
+        """
+        启动后台清理线程
+
+        Args:
+            interval: 清理间隔（秒）
+            extra_tasks: 每次清理后一并执行的其他清理函数（如缩略图缓存）
+        """
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                for task in (self.sweep, *extra_tasks):
+                    try:
+                        task()
+                    except Exception as e:
+                        print(f"清理上传文件失败: {str(e)}")
+                time.sleep(interval)
+
+        self._sweeper = threading.Thread(target=run, name='artifact-sweeper', daemon=True)
+        self._sweeper.start()
+
+
+def create_artifact_store(directory: str, config: Dict, redis_client=None) -> ArtifactStore:
+    """
+    根据配置创建上传文件存储
+
+    Args:
+        directory: 上传目录
+        config: ARTIFACT_CONFIG
+        redis_client: Redis连接，使用redis索引时必需
+
+    Returns:
+        ArtifactStore
+    """
+    if config['BACKEND'] == 'redis':
+        if redis_client is None:
+            raise ValueError("redis索引需要提供Redis连接")
+        index = RedisArtifactIndex(redis_client)
+    elif config['BACKEND'] == 'local':
+        index = SQLiteArtifactIndex(config['INDEX_PATH'])
+    else:
+        raise ValueError(f"不支持的文件索引后端: {config['BACKEND']}")
+    return ArtifactStore(
+        directory, index,
+        config['MAX_AGE_HOURS'] * 3600,
+        config['MAX_TOTAL_MB'] * 1024 * 1024
+    )
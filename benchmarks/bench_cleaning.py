@@ -0,0 +1,183 @@
+"""
+文本清理吞吐量基准测试
+
+对比逐条执行 re.sub 的旧实现与预编译、合并扫描的新实现，
+并校验两者输出一致；逐行清理的变体只统计吞吐量
+输出 clean_text 和 clean_markdown_format 的处理速度（MB/s）
+
+用法：
+    python benchmarks/bench_cleaning.py [--size-mb 4] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_to_markdown import PDFToMarkdown  # noqa: E402
+from utils import clean_markdown_format, iter_clean_markdown_lines  # noqa: E402
+
+# 旧版 _init_language_patterns 中的模式字符串
+LEGACY_PATTERNS = {
+    'zh': {
+        'space': r'([^\u4e00-\u9fff])\s+([^\u4e00-\u9fff])',
+        'punctuation': r'[""'']+',
+        'noise': r'[·・︰]',
+        'level2': r'[^\u4e00-\u9fff\u3000-\u303f\uff00-\uffef\u0020-\u007f\n]'
+    },
+    'ja': {
+        'space': r'([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff])\s+([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff])',
+        'punctuation': r'[""'']+',
+        'noise': r'[·・︰]',
+        'level2': r'[^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\u3000-\u303f\uff00-\uffef\u0020-\u007f\n]'
+    },
+    'default': {
+        'space': r'\s+',
+        'punctuation': r'[""'']+',
+        'noise': r'[·・︰]',
+        'level2': r'[^\x20-\x7f\n]'
+    }
+}
+
+
+def legacy_clean_text(text: str, lang_code: str, clean_level: int = 1) -> str:
+    """旧版 clean_text：每次调用都使用模式字符串，逐条执行替换"""
+    if clean_level == 0:
+        return text
+    patterns = LEGACY_PATTERNS.get(lang_code, LEGACY_PATTERNS['default'])
+    text = re.sub(r'\r\n', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    if lang_code in ['zh', 'ja']:
+        text = re.sub(patterns['space'], r'\1\2', text)
+    else:
+        text = re.sub(patterns['space'], ' ', text)
+    text = re.sub(patterns['punctuation'], '"', text)
+    if clean_level >= 1:
+        text = re.sub(patterns['noise'], '', text)
+    if clean_level >= 2:
+        text = re.sub(patterns['level2'], '', text)
+    return text.strip()
+
+
+def legacy_clean_markdown_format(text: str) -> str:
+    """旧版 clean_markdown_format：九次独立的全文替换"""
+    text = re.sub(r'```\s*markdown\s*\n', '', text)
+    text = re.sub(r'```\s*\n', '', text)
+    text = re.sub(r'```\s*$', '', text)
+    text = text.replace('\r\n', '\n')
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r'(#+\s+.+)\n([^#\n])', r'\1\n\n\2', text)
+    text = re.sub(r'^\s*[-*+]\s+', '- ', text, flags=re.MULTILINE)
+    text = re.sub(r'^(#+)([^#\s])', r'\1 \2', text, flags=re.MULTILINE)
+    text = re.sub(r' +$', '', text, flags=re.MULTILINE)
+    return text.strip() + '\n'
+
+
+def make_ocr_text(size: int, seed: int = 0) -> str:
+    """生成近似OCR输出的中英混排文本"""
+    rng = random.Random(seed)
+    words = ['附件', '通知', '关于', '报告', 'report', 'appendix', 'data', '2024',
+             '第一条', '・', '·', '"', 'Section', '（一）', 'é', '︰']
+    lines = []
+    total = 0
+    while total < size:
+        line = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 14)))
+        if rng.random() < 0.1:
+            line += '\n\n\n'
+        lines.append(line)
+        total += len(line.encode('utf-8')) + 1
+    return '\r\n'.join(lines)
+
+
+def make_markdown_text(size: int, seed: int = 0) -> str:
+    """生成近似LLM输出的Markdown文本"""
+    rng = random.Random(seed)
+    blocks = ['```markdown\n', '```\n', '#标题\n正文内容  \n', '## 小节\n',
+              '  * 列表项\n', '+ item\n', '正文段落 text   \n', '\n\n\n']
+    parts = []
+    total = 0
+    while total < size:
+        block = rng.choice(blocks)
+        parts.append(block)
+        total += len(block.encode('utf-8'))
+    return ''.join(parts)
+
+
+# 随机文本覆盖不到的输入：相连的代码块标记（前一次替换后剩下的反引号组成新的标记）等
+MARKDOWN_EDGE_CASES = [
+    '``````\n',
+    '```\n```\n正文\n``````',
+    '```markdown```\n# 标题\n```',
+    '``````markdown\n  * 列表项\r\n```  ',
+]
+
+
+def measure(func, text: str, repeat: int) -> float:
+    """返回最快一次的吞吐量（MB/s）"""
+    size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return size_mb / best
+
+
+def report(name: str, before: float, after: float) -> None:
+    print(f"{name:<36} {before:>10.1f} {after:>10.1f} {after / before:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文本清理吞吐量基准测试')
+    parser.add_argument('--size-mb', type=float, default=4, help='测试文本大小（MB）')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最快一次')
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    ocr_text = make_ocr_text(size)
+    markdown_text = make_markdown_text(size)
+    converter = PDFToMarkdown()
+
+    print(f"{'测试项':<36} {'旧 MB/s':>10} {'新 MB/s':>10} {'加速':>9}")
+    for ocr_language in ['eng', 'chi_sim', 'zh', 'ja']:
+        converter.set_ocr_language(ocr_language)
+        lang_code = ocr_language[:2]
+        for clean_level in [1, 2]:
+            expected = legacy_clean_text(ocr_text, lang_code, clean_level)
+            actual = converter.clean_text(ocr_text, clean_level)
+            assert actual == expected, f"clean_text 结果不一致: {ocr_language} 级别{clean_level}"
+            report(
+                f"clean_text[{ocr_language}, 级别{clean_level}]",
+                measure(lambda t: legacy_clean_text(t, lang_code, clean_level), ocr_text, args.repeat),
+                measure(lambda t: converter.clean_text(t, clean_level), ocr_text, args.repeat)
+            )
+        report(
+            f"clean_text_lines[{ocr_language}, 级别1]",
+            measure(lambda t: legacy_clean_text(t, lang_code, 1), ocr_text, args.repeat),
+            measure(lambda t: sum(1 for _ in converter.clean_text_lines(t.splitlines(), 1)),
+                    ocr_text, args.repeat)
+        )
+
+    assert clean_markdown_format(markdown_text) == legacy_clean_markdown_format(markdown_text), \
+        "clean_markdown_format 结果不一致"
+    for case in MARKDOWN_EDGE_CASES:
+        assert clean_markdown_format(case) == legacy_clean_markdown_format(case), \
+            f"clean_markdown_format 结果不一致: {case!r}"
+    report(
+        "clean_markdown_format",
+        measure(legacy_clean_markdown_format, markdown_text, args.repeat),
+        measure(clean_markdown_format, markdown_text, args.repeat)
+    )
+    report(
+        "iter_clean_markdown_lines",
+        measure(legacy_clean_markdown_format, markdown_text, args.repeat),
+        measure(lambda t: sum(1 for _ in iter_clean_markdown_lines(t.splitlines())),
+                markdown_text, args.repeat)
+    )
+
+
+if __name__ == '__main__':
+    main()
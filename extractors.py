@@ -0,0 +1,794 @@
+"""
+各格式文档的结构化提取
+
+直接把文档结构（表格、标题等）渲染为Markdown，无需调用API
+"""
+import csv
+import itertools
+import os
+import posixpath
+import re
+import shutil
+import subprocess
+import zipfile
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import unquote
+
+from utils import format_table_row, iter_parallel_map, rows_to_markdown_table
+
+# 文本文件的候选编码
+TEXT_ENCODINGS = ['utf-8-sig', 'gbk', 'gb2312', 'iso-8859-1']
+
+
+def _detect_text_encoding(file_path: str, sample_size: int = 64 * 1024) -> str:
+    """根据文件开头的内容判断文本编码"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size)
+    for encoding in TEXT_ENCODINGS:
+        try:
+            sample.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return TEXT_ENCODINGS[-1]
+
+
+def list_sheet_names(file_path: str) -> List[str]:
+    """
+    列出电子表格中的工作表
+
+    Args:
+        file_path: 电子表格路径（.xlsx/.xls/.csv）
+
+    Returns:
+        工作表名称列表，CSV文件视为只有一个工作表
+    """
+    ext = Path(file_path).suffix.lower()
+    if ext == '.csv':
+        return [Path(file_path).stem]
+    if ext == '.xls':
+        import pandas as pd
+        with pd.ExcelFile(file_path) as workbook:
+            return list(workbook.sheet_names)
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def iter_sheet_rows(file_path: str, sheet_name: str) -> Iterator[Sequence[Any]]:
+    """
+    逐行读取工作表
+
+    .xlsx 使用 openpyxl 只读模式流式读取，.csv 使用 csv 模块逐行读取，内存占用与行数无关；
+    .xls 格式本身最多65536行，由 pandas 一次读入
+
+    Args:
+        file_path: 电子表格路径
+        sheet_name: 工作表名称
+
+    Returns:
+        行迭代器，每行为单元格值的序列
+    """
+    ext = Path(file_path).suffix.lower()
+
+    if ext == '.csv':
+        with open(file_path, 'r', encoding=_detect_text_encoding(file_path), newline='') as f:
+            yield from csv.reader(f)
+        return
+
+    if ext == '.xls':
+        import pandas as pd
+        df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+        for row in df.itertuples(index=False):
+            yield [None if pd.isna(value) else value for value in row]
+        return
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        yield from workbook[sheet_name].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _trim_row(row: Sequence[Any]) -> List[Any]:
+    """去掉行尾的空单元格"""
+    row = list(row)
+    while row and (row[-1] is None or str(row[-1]).strip() == ''):
+        row.pop()
+    return row
+
+
+def render_sheet_markdown(file_path: str, sheet_name: str, batch_rows: int = 500,
+                          max_rows: int = 5000, max_chars: int = 2 * 1024 * 1024) -> str:
+    """
+    把一个工作表渲染为Markdown表格（可在子进程中执行）
+
+    第一批行用于确定列数，第一个非空行作为表头；空行被跳过。
+    超过行数或字符数上限时截断并注明
+
+    Args:
+        file_path: 电子表格路径
+        sheet_name: 工作表名称
+        batch_rows: 用于确定列数的首批行数
+        max_rows: 最多输出的数据行数
+        max_chars: 最多输出的字符数
+
+    Returns:
+        以工作表名为二级标题的Markdown文本，空工作表返回空字符串
+    """
+    rows = (row for row in map(_trim_row, iter_sheet_rows(file_path, sheet_name)) if row)
+    first_batch = list(itertools.islice(rows, batch_rows))
+    if not first_batch:
+        return ''
+
+    width = max(len(row) for row in first_batch)
+    lines = [f"## {sheet_name}", '', format_table_row(first_batch[0], width), '|' + '---|' * width]
+    size = sum(len(line) + 1 for line in lines)
+    row_count = 0
+    truncated = False
+
+    for row in itertools.chain(first_batch[1:], rows):
+        if row_count >= max_rows or size >= max_chars:
+            truncated = True
+            break
+        line = format_table_row(row[:width] if len(row) > width else row, width)
+        lines.append(line)
+        size += len(line) + 1
+        row_count += 1
+
+    if truncated:
+        lines.extend(['', f"*（内容过长，仅保留前 {row_count} 行）*"])
+    return '\n'.join(lines)
+
+
+def iter_spreadsheet_markdown(file_path: str, workers: int = 0, batch_rows: int = 500,
+                              max_rows: int = 5000, max_sheet_chars: int = 2 * 1024 * 1024,
+                              max_total_chars: int = 10 * 1024 * 1024) -> Iterator[str]:
+    """
+    按工作表顺序产出Markdown表格，多个工作表时并行渲染
+
+    Args:
+        file_path: 电子表格路径
+        workers: 进程数，0 表示使用CPU核数，1 表示不使用多进程
+        batch_rows: 用于确定列数的首批行数
+        max_rows: 每个工作表最多输出的数据行数
+        max_sheet_chars: 每个工作表最多输出的字符数
+        max_total_chars: 全部输出的字符数上限，超过后忽略其余工作表
+
+    Returns:
+        每个工作表一段Markdown文本的迭代器
+    """
+    sheet_names = list_sheet_names(file_path)
+    render = partial(
+        render_sheet_markdown, file_path,
+        batch_rows=batch_rows, max_rows=max_rows, max_chars=max_sheet_chars
+    )
+
+    total = 0
+    results = iter_parallel_map(render, sheet_names, workers)
+    for index, markdown in enumerate(results):
+        if not markdown:
+            continue
+        if total + len(markdown) > max_total_chars:
+            skipped = len(sheet_names) - index
+            yield f"*（内容过长，已省略其余 {skipped} 个工作表）*"
+            results.close()
+            return
+        total += len(markdown)
+        yield markdown
+
+
+# EPUB 容器和包文件的命名空间
+EPUB_CONTAINER_NS = {'container': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+EPUB_OPF_NS = {'opf': 'http://www.idpf.org/2007/opf'}
+EPUB_DOCUMENT_TYPES = {'application/xhtml+xml', 'text/html'}
+
+# HTML 标签分类
+HTML_HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+HTML_SKIPPED_TAGS = {'head', 'script', 'style', 'nav', 'svg', 'math', 'title'}
+HTML_CONTAINER_TAGS = {
+    'html', 'body', 'div', 'section', 'article', 'main', 'header', 'footer',
+    'aside', 'figure', 'figcaption', 'hgroup', 'center', 'dl', 'dd', 'dt'
+}
+HTML_WHITESPACE = re.compile(r'\s+')
+HTML_ENCODING_PATTERN = re.compile(rb'(?:encoding|charset)\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def list_epub_chapters(file_path: str) -> List[str]:
+    """
+    按阅读顺序（spine）列出EPUB中的章节
+
+    直接解析 container.xml 和 OPF 包文件，不需要把整本书读入内存
+
+    Args:
+        file_path: EPUB文件路径
+
+    Returns:
+        章节在压缩包内的路径列表
+    """
+    from lxml import etree
+
+    with zipfile.ZipFile(file_path) as book:
+        container = etree.fromstring(book.read('META-INF/container.xml'))
+        rootfile = container.find('.//container:rootfile', EPUB_CONTAINER_NS)
+        opf_path = rootfile.get('full-path')
+        package = etree.fromstring(book.read(opf_path))
+
+    base_dir = posixpath.dirname(opf_path)
+    manifest = {
+        item.get('id'): item
+        for item in package.iterfind('opf:manifest/opf:item', EPUB_OPF_NS)
+    }
+
+    chapters = []
+    for itemref in package.iterfind('opf:spine/opf:itemref', EPUB_OPF_NS):
+        item = manifest.get(itemref.get('idref'))
+        if item is None or item.get('media-type') not in EPUB_DOCUMENT_TYPES:
+            continue
+        href = unquote(item.get('href').split('#')[0])
+        chapters.append(posixpath.normpath(posixpath.join(base_dir, href)))
+    return chapters
+
+
+def _detect_html_encoding(content: bytes) -> str:
+    """读取XML声明或meta标签中的编码，未声明时按XHTML默认的UTF-8处理"""
+    match = HTML_ENCODING_PATTERN.search(content[:1024])
+    return match.group(1).decode('ascii') if match else 'utf-8'
+
+
+def _is_element(node) -> bool:
+    """排除注释和处理指令"""
+    return isinstance(node.tag, str)
+
+
+def _tag_name(node) -> str:
+    """去掉命名空间后的小写标签名"""
+    return node.tag.rsplit('}', 1)[-1].lower()
+
+
+def _normalize_space(text: str) -> str:
+    return HTML_WHITESPACE.sub(' ', text)
+
+
+def _inline_markdown(element) -> str:
+    """渲染元素的行内内容：粗体、斜体、行内代码和换行"""
+    parts = [_normalize_space(element.text or '')]
+    for child in element:
+        if _is_element(child):
+            tag = _tag_name(child)
+            if tag == 'br':
+                parts.append('\n')
+            elif tag not in HTML_SKIPPED_TAGS:
+                inner = _inline_markdown(child).strip()
+                if inner and tag in ('strong', 'b'):
+                    inner = f"**{inner}**"
+                elif inner and tag in ('em', 'i'):
+                    inner = f"*{inner}*"
+                elif inner and tag == 'code':
+                    inner = f"`{inner}`"
+                elif tag == 'img':
+                    inner = child.get('alt', '')
+                parts.append(inner)
+        parts.append(_normalize_space(child.tail or ''))
+    return '\n'.join(line.strip() for line in ''.join(parts).split('\n'))
+
+
+def _render_html_list(element, depth: int = 0) -> str:
+    """渲染有序或无序列表，嵌套列表按层级缩进"""
+    ordered = _tag_name(element) == 'ol'
+    lines = []
+    index = 0
+    for item in element:
+        if not _is_element(item) or _tag_name(item) != 'li':
+            continue
+        index += 1
+        nested = [child for child in item if _is_element(child) and _tag_name(child) in ('ul', 'ol')]
+        for child in nested:
+            item.remove(child)
+        marker = f"{index}. " if ordered else '- '
+        text = _inline_markdown(item).replace('\n', ' ').strip()
+        lines.append('  ' * depth + marker + text)
+        lines.extend(_render_html_list(child, depth + 1) for child in nested)
+    return '\n'.join(line for line in lines if line)
+
+
+def _render_html_table(element) -> str:
+    """渲染HTML表格"""
+    rows = []
+    for row in element.iter():
+        if _is_element(row) and _tag_name(row) == 'tr':
+            rows.append([
+                _inline_markdown(cell).replace('\n', ' ')
+                for cell in row
+                if _is_element(cell) and _tag_name(cell) in ('td', 'th')
+            ])
+    return rows_to_markdown_table(rows)
+
+
+def _render_html_blocks(element, blocks: List[str]) -> None:
+    """把块级元素依次渲染为Markdown段落，追加到 blocks"""
+    def add_text(text: str) -> None:
+        text = text.strip()
+        if text:
+            blocks.append(text)
+
+    add_text(_normalize_space(element.text or ''))
+    for child in element:
+        if not _is_element(child):
+            add_text(_normalize_space(child.tail or ''))
+            continue
+
+        tag = _tag_name(child)
+        if tag in HTML_HEADING_TAGS:
+            text = _inline_markdown(child).replace('\n', ' ').strip()
+            if text:
+                blocks.append(f"{'#' * HTML_HEADING_TAGS[tag]} {text}")
+        elif tag in ('ul', 'ol'):
+            add_text(_render_html_list(child))
+        elif tag == 'table':
+            add_text(_render_html_table(child))
+        elif tag == 'pre':
+            code = child.text_content().strip('\n')
+            if code.strip():
+                blocks.append('\n'.join('    ' + line for line in code.split('\n')))
+        elif tag == 'blockquote':
+            quoted = []
+            _render_html_blocks(child, quoted)
+            add_text('\n>\n'.join(
+                '\n'.join('> ' + line for line in block.split('\n')) for block in quoted
+            ))
+        elif tag == 'hr':
+            blocks.append('---')
+        elif tag in HTML_CONTAINER_TAGS:
+            _render_html_blocks(child, blocks)
+        elif tag not in HTML_SKIPPED_TAGS:
+            add_text(_inline_markdown(child))
+
+        add_text(_normalize_space(child.tail or ''))
+
+
+def html_to_markdown(content: bytes) -> str:
+    """
+    把HTML/XHTML文档直接转换为Markdown
+
+    标题映射为对应层级的 #，并保留段落、列表、表格、引用和行内强调
+
+    Args:
+        content: HTML文档内容
+
+    Returns:
+        Markdown文本
+    """
+    import lxml.html
+
+    if not content.strip():
+        return ''
+    parser = lxml.html.HTMLParser(encoding=_detect_html_encoding(content))
+    document = lxml.html.document_fromstring(content, parser=parser)
+    body = document.find('body')
+    blocks = []
+    _render_html_blocks(body if body is not None else document, blocks)
+    return '\n\n'.join(blocks)
+
+
+def render_epub_chapter(file_path: str, chapter_path: str) -> str:
+    """读取并转换一个EPUB章节（可在子进程中执行）"""
+    with zipfile.ZipFile(file_path) as book:
+        try:
+            content = book.read(chapter_path)
+        except KeyError:  # 目录中登记但压缩包里不存在的章节
+            return ''
+    return html_to_markdown(content)
+
+
+def iter_epub_markdown(file_path: str, workers: int = 0) -> Iterator[str]:
+    """
+    按阅读顺序逐章产出Markdown，多个章节并行转换
+
+    Args:
+        file_path: EPUB文件路径
+        workers: 进程数，0 表示使用CPU核数，1 表示不使用多进程
+
+    Returns:
+        每章一段Markdown文本的迭代器（空章节被跳过）
+    """
+    chapters = list_epub_chapters(file_path)
+    render = partial(render_epub_chapter, file_path)
+    for markdown in iter_parallel_map(render, chapters, workers):
+        if markdown:
+            yield markdown
+
+
+# WordprocessingML 命名空间
+DOCX_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = '{%s}' % DOCX_NS
+
+# 样式名称中的标题层级
+DOCX_HEADING_STYLE = re.compile(r'^(?:heading|标题)\s*(\d)$', re.IGNORECASE)
+
+# 需要先转换为DOCX的文档格式
+CONVERTIBLE_DOCUMENT_FORMATS = ('.doc', '.rtf', '.odt')
+
+# 按普通段落（而非列表）输出的文本占位符类型
+PPTX_TEXT_PLACEHOLDERS = {'TITLE', 'CENTER_TITLE', 'SUBTITLE', 'HEADER', 'FOOTER', 'DATE', 'SLIDE_NUMBER'}
+
+
+def _docx_flag(properties, name: str) -> bool:
+    """读取 <w:b/> 这类开关属性，val 为 0/false 时表示关闭"""
+    if properties is None:
+        return False
+    element = properties.find(W + name)
+    return element is not None and element.get(W + 'val', 'true') not in ('0', 'false', 'off')
+
+
+def _docx_num_properties(properties) -> Optional[Tuple[str, int]]:
+    """读取段落或样式的编号属性，返回 (numId, 层级)"""
+    if properties is None:
+        return None
+    num_pr = properties.find(W + 'numPr')
+    if num_pr is None:
+        return None
+    num_id = num_pr.find(W + 'numId')
+    ilvl = num_pr.find(W + 'ilvl')
+    if num_id is None or num_id.get(W + 'val') == '0':  # numId 为0表示取消编号
+        return None
+    return num_id.get(W + 'val'), int(ilvl.get(W + 'val', 0)) if ilvl is not None else 0
+
+
+def _read_docx_styles(document: zipfile.ZipFile) -> Dict[str, Dict]:
+    """
+    读取段落样式的标题层级和编号
+
+    Returns:
+        样式ID到 {'heading': 层级, 'numbering': (numId, 层级)} 的映射
+    """
+    from lxml import etree
+
+    try:
+        root = etree.fromstring(document.read('word/styles.xml'))
+    except KeyError:
+        return {}
+
+    styles = {}
+    for style in root.iterfind(W + 'style'):
+        if style.get(W + 'type') != 'paragraph':
+            continue
+        name = style.find(W + 'name')
+        name = name.get(W + 'val', '') if name is not None else ''
+        properties = style.find(W + 'pPr')
+
+        heading = 0
+        match = DOCX_HEADING_STYLE.match(name.strip())
+        if match:
+            heading = int(match.group(1))
+        elif name.strip().lower() == 'title':
+            heading = 1
+        elif properties is not None and properties.find(W + 'outlineLvl') is not None:
+            level = int(properties.find(W + 'outlineLvl').get(W + 'val', 9))
+            heading = level + 1 if level < 9 else 0  # 9 表示正文级别
+
+        styles[style.get(W + 'styleId')] = {
+            'heading': min(heading, 6),
+            'numbering': _docx_num_properties(properties)
+        }
+    return styles
+
+
+def _read_docx_numbering(document: zipfile.ZipFile) -> Dict[Tuple[str, int], bool]:
+    """
+    读取编号定义
+
+    Returns:
+        (numId, 层级) 到是否为有序编号的映射
+    """
+    from lxml import etree
+
+    try:
+        root = etree.fromstring(document.read('word/numbering.xml'))
+    except KeyError:
+        return {}
+
+    abstract_formats = {}
+    for abstract in root.iterfind(W + 'abstractNum'):
+        for level in abstract.iterfind(W + 'lvl'):
+            num_fmt = level.find(W + 'numFmt')
+            fmt = num_fmt.get(W + 'val', 'bullet') if num_fmt is not None else 'bullet'
+            abstract_formats[abstract.get(W + 'abstractNumId'), int(level.get(W + 'ilvl', 0))] = \
+                fmt not in ('bullet', 'none')
+
+    numbering = {}
+    for num in root.iterfind(W + 'num'):
+        abstract_id = num.find(W + 'abstractNumId')
+        if abstract_id is None:
+            continue
+        for (abstract, level), ordered in abstract_formats.items():
+            if abstract == abstract_id.get(W + 'val'):
+                numbering[num.get(W + 'numId'), level] = ordered
+    return numbering
+
+
+def _docx_run_text(run) -> str:
+    """提取一个文本片段（w:r）的文字，保留制表符和换行"""
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W + 't':
+            parts.append(child.text or '')
+        elif tag == W + 'tab':
+            parts.append('\t')
+        elif tag in (W + 'br', W + 'cr'):
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def _docx_paragraph_text(paragraph, emphasis: bool = True) -> str:
+    """渲染段落的行内内容，粗体和斜体映射为Markdown强调"""
+    # 相邻片段按 (粗体, 斜体) 分组，每组只加一次强调标记；只含空白的片段归入前一组
+    groups = []
+    for run in paragraph.iter(W + 'r'):
+        text = _docx_run_text(run)
+        if groups and (not text.strip() or not emphasis):
+            groups[-1][1].append(text)
+            continue
+        flags = (False, False)
+        if emphasis and text.strip():
+            properties = run.find(W + 'rPr')
+            flags = (_docx_flag(properties, 'b'), _docx_flag(properties, 'i'))
+        if groups and groups[-1][0] == flags:
+            groups[-1][1].append(text)
+        else:
+            groups.append((flags, [text]))
+
+    parts = []
+    for (bold, italic), texts in groups:
+        text = ''.join(texts)
+        marker = '*' * (2 * bold + italic)
+        if not marker or not text.strip():
+            parts.append(text)
+            continue
+        leading = text[:len(text) - len(text.lstrip())]
+        trailing = text[len(text.rstrip()):]
+        parts.append(f"{leading}{marker}{text.strip()}{marker}{trailing}")
+    text = ''.join(parts)
+    return '\n'.join(line.strip() for line in text.split('\n')).strip()
+
+
+def _render_docx_paragraph(paragraph, styles: Dict, numbering: Dict) -> Tuple[str, bool]:
+    """
+    把段落渲染为Markdown标题、列表项或普通段落
+
+    Returns:
+        (Markdown, 是否为列表项)
+    """
+    properties = paragraph.find(W + 'pPr')
+    style = {}
+    if properties is not None and properties.find(W + 'pStyle') is not None:
+        style = styles.get(properties.find(W + 'pStyle').get(W + 'val'), {})
+
+    heading = style.get('heading', 0)
+    if properties is not None and properties.find(W + 'outlineLvl') is not None:
+        level = int(properties.find(W + 'outlineLvl').get(W + 'val', 9))
+        heading = min(level + 1, 6) if level < 9 else 0
+
+    if heading:
+        text = _docx_paragraph_text(paragraph, emphasis=False).replace('\n', ' ').strip()
+        return (f"{'#' * heading} {text}" if text else ''), False
+
+    text = _docx_paragraph_text(paragraph)
+    if not text:
+        return '', False
+
+    num = _docx_num_properties(properties) or style.get('numbering')
+    if num:
+        marker = '1. ' if numbering.get(num, False) else '- '
+        return '  ' * num[1] + marker + text.replace('\n', ' '), True
+    return text, False
+
+
+def _render_docx_table(table) -> str:
+    """渲染表格，合并单元格按跨列数补齐空白列"""
+    rows = []
+    for row in table.iterfind(W + 'tr'):
+        cells = []
+        for cell in row.iterfind(W + 'tc'):
+            text = ' '.join(
+                _docx_paragraph_text(paragraph).replace('\n', ' ')
+                for paragraph in cell.iter(W + 'p')
+            ).strip()
+            cells.append(text)
+            span = cell.find(f'{W}tcPr/{W}gridSpan')
+            if span is not None:
+                cells.extend([''] * (int(span.get(W + 'val', 1)) - 1))
+        rows.append(cells)
+    return rows_to_markdown_table(rows)
+
+
+def iter_docx_markdown(file_path: str, batch_chars: int = 20000) -> Iterator[str]:
+    """
+    流式解析 word/document.xml，直接生成Markdown
+
+    只在内存中保留当前的顶层段落或表格，处理完即释放，适合超大文档；
+    标题样式、编号列表和表格直接映射为Markdown结构
+
+    Args:
+        file_path: DOCX文件路径
+        batch_chars: 每次产出的Markdown大约包含的字符数
+
+    Returns:
+        Markdown文本片段的迭代器（按文档顺序）
+    """
+    from lxml import etree
+
+    with zipfile.ZipFile(file_path) as document:
+        styles = _read_docx_styles(document)
+        numbering = _read_docx_numbering(document)
+
+        blocks = []
+        size = 0
+        table_depth = 0
+        previous_is_list = False
+        with document.open('word/document.xml') as xml:
+            events = etree.iterparse(xml, events=('start', 'end'), tag=(W + 'p', W + 'tbl'))
+            for event, element in events:
+                if element.tag == W + 'tbl':
+                    table_depth += 1 if event == 'start' else -1
+                if event == 'start' or table_depth:
+                    continue  # 表格内的段落随表格一起渲染
+
+                if element.tag == W + 'tbl':
+                    markdown, is_list = _render_docx_table(element), False
+                else:
+                    markdown, is_list = _render_docx_paragraph(element, styles, numbering)
+
+                # 释放已处理的元素及其前面的兄弟节点
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+                if markdown:
+                    if is_list and previous_is_list and blocks:
+                        blocks[-1] += '\n' + markdown  # 连续的列表项不加空行
+                    else:
+                        blocks.append(markdown)
+                    size += len(markdown)
+                    previous_is_list = is_list
+                if size >= batch_chars:
+                    yield '\n\n'.join(blocks)
+                    blocks = []
+                    size = 0
+
+        if blocks:
+            yield '\n\n'.join(blocks)
+
+
+def convert_with_libreoffice(file_path: str, output_dir: str, target_format: str = 'docx',
+                             soffice_path: str = 'soffice', timeout: int = 300) -> str:
+    """
+    使用LibreOffice转换文档格式（如 .doc/.rtf/.odt 转DOCX，.ppt 转PPTX）
+
+    Args:
+        file_path: 原始文档路径
+        output_dir: 转换结果的保存目录
+        target_format: 目标格式的扩展名（不含点）
+        soffice_path: LibreOffice可执行文件
+        timeout: 转换超时时间（秒）
+
+    Returns:
+        转换得到的文件路径
+    """
+    executable = shutil.which(soffice_path)
+    if executable is None:
+        raise ValueError(
+            f"转换 {Path(file_path).suffix} 文档需要安装LibreOffice（未找到 {soffice_path}）"
+        )
+
+    subprocess.run(
+        [executable, '--headless', '--convert-to', target_format, '--outdir', output_dir, file_path],
+        check=True, timeout=timeout,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    output_path = os.path.join(output_dir, f"{Path(file_path).stem}.{target_format}")
+    if not os.path.exists(output_path):
+        raise RuntimeError(f"文档转换失败: {file_path}")
+    return output_path
+
+
+def _iter_pptx_shapes(shapes) -> Iterator[Any]:
+    """按从上到下、从左到右的顺序遍历形状，展开组合形状"""
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+    def position(shape):
+        return (shape.top or 0, shape.left or 0)
+
+    for shape in sorted(shapes, key=position):
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _iter_pptx_shapes(shape.shapes)
+        else:
+            yield shape
+
+
+def _render_pptx_text(shape) -> str:
+    """渲染文本框，占位符正文和有缩进层级的段落按列表输出"""
+    is_body = (shape.is_placeholder and
+               getattr(shape.placeholder_format.type, 'name', None) not in PPTX_TEXT_PLACEHOLDERS)
+    lines = []
+    for paragraph in shape.text_frame.paragraphs:
+        text = ''.join(run.text for run in paragraph.runs).strip() or paragraph.text.strip()
+        if not text:
+            continue
+        if is_body or paragraph.level:
+            lines.append('  ' * paragraph.level + '- ' + text)
+        else:
+            lines.append(text)
+    return '\n'.join(lines)
+
+
+def _render_pptx_table(table) -> str:
+    """渲染表格形状"""
+    return rows_to_markdown_table(
+        [[cell.text for cell in row.cells] for row in table.rows]
+    )
+
+
+def render_pptx_slide(slide, number: int) -> Tuple[str, List[bytes]]:
+    """
+    把一张幻灯片渲染为一个Markdown小节
+
+    Args:
+        slide: python-pptx 幻灯片对象
+        number: 幻灯片编号（从1开始）
+
+    Returns:
+        (Markdown, 图片数据列表)；只有幻灯片没有任何文字时才返回其中的图片，供OCR识别
+    """
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+    title_shape = slide.shapes.title
+    title = title_shape.text_frame.text.strip() if title_shape is not None else ''
+
+    blocks = []
+    images = []
+    for shape in _iter_pptx_shapes(slide.shapes):
+        if title_shape is not None and shape.shape_id == title_shape.shape_id:
+            continue
+        if getattr(shape, 'has_table', False):
+            blocks.append(_render_pptx_table(shape.table))
+        elif shape.has_text_frame:
+            blocks.append(_render_pptx_text(shape))
+        elif shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
+            images.append(shape.image.blob)
+
+    blocks = [block for block in blocks if block]
+    has_text = bool(title or blocks)
+
+    if slide.has_notes_slide and slide.notes_slide.notes_text_frame is not None:
+        notes = slide.notes_slide.notes_text_frame.text.strip()
+        if notes:
+            blocks.append('\n'.join('> ' + line.strip() for line in ['备注：'] + notes.splitlines()))
+
+    heading = f"## 幻灯片 {number}" + (f"：{title}" if title else '')
+    return '\n\n'.join([heading] + blocks), ([] if has_text else images)
+
+
+def iter_pptx_slides(file_path: str) -> Iterator[Tuple[str, List[bytes]]]:
+    """
+    逐张产出幻灯片的Markdown小节
+
+    Args:
+        file_path: PPTX文件路径
+
+    Returns:
+        (Markdown, 图片数据列表) 的迭代器，见 render_pptx_slide
+    """
+    from pptx import Presentation
+
+    presentation = Presentation(file_path)
+    for number, slide in enumerate(presentation.slides, 1):
+        yield render_pptx_slide(slide, number)
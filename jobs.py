@@ -0,0 +1,314 @@
+"""
+后台转换任务队列
+
+上传接口只负责保存文件并提交任务，立即返回任务ID；转换在后台工作线程中执行，
+客户端通过 /jobs/<id> 查询状态和结果。
+
+提供两种后端：
+    local   进程内的有界线程池，任务状态保存在内存中
+    redis   任务放入Redis列表，状态和结果保存在Redis中；多个Web进程共享同一队列，
+            任意进程都能查询任务状态
+"""
+import json
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+# 进度回调：总进度（0-100）和可选的进度详情（阶段、完成数、预计剩余时间等）
+ProgressReporter = Callable[[float, Optional[Dict]], None]
+
+# 任务处理函数：接收任务参数（附带 job_id）和进度回调，返回可JSON序列化的结果
+JobHandler = Callable[[Dict, ProgressReporter], Dict]
+
+
+class QueueFullError(Exception):
+    """等待中的任务数已达上限"""
+
+
+def _new_job(params: Dict) -> Dict:
+    """创建任务记录"""
+    return {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'progress': 0,
+        'progress_detail': None,
+        'params': params,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'result': None,
+        'error': None
+    }
+
+
+def _run_job(job: Dict, handler: JobHandler, report_progress: ProgressReporter) -> None:
+    """执行任务并把结果或错误写入任务记录"""
+    job['status'] = 'running'
+    job['started_at'] = time.time()
+    try:
+        job['result'] = handler(dict(job['params'], job_id=job['id']), report_progress)
+        job['status'] = 'done'
+        job['progress'] = 100
+    except Exception as e:
+        print(f"任务 {job['id']} 处理失败: {str(e)}")
+        traceback.print_exc()
+        job['error'] = str(e)
+        job['status'] = 'failed'
+    job['finished_at'] = time.time()
+
+
+class LocalJobQueue:
+    """进程内的有界线程池任务队列"""
+
+    def __init__(self, handler: JobHandler, workers: int = 2, max_queue_size: int = 20,
+                 result_ttl: float = 3600 * 24):
+        """
+        Args:
+            handler: 任务处理函数
+            workers: 同时执行的任务数
+            max_queue_size: 最多等待中的任务数，超过时拒绝提交
+            result_ttl: 已完成任务的保留时间（秒）
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def start(self) -> None:
+        """开始处理任务（线程池在提交任务时才创建工作线程，无需额外启动）"""
+
+    def submit(self, params: Dict) -> str:
+        """
+        提交任务
+
+        Args:
+            params: 任务参数，原样传给处理函数
+
+        Returns:
+            任务ID
+        """
+        return self.submit_batch(None, [params])[0]
+
+    def submit_batch(self, batch_id: Optional[str], params_list: Sequence[Dict]) -> List[str]:
+        """
+        提交一批任务，由工作线程并发执行；排队空间不足时整批拒绝
+
+        Args:
+            batch_id: 批次ID，为None时不记录批次
+            params_list: 各任务的参数
+
+        Returns:
+            与 params_list 顺序一致的任务ID
+        """
+        with self._lock:
+            self._prune()
+            if self._count('queued') + len(params_list) > self.max_queue_size:
+                raise QueueFullError(f"等待中的任务已达上限（{self.max_queue_size}）")
+            jobs = [_new_job(params) for params in params_list]
+            for job in jobs:
+                self._jobs[job['id']] = job
+            if batch_id is not None:
+                self._batches[batch_id] = [job['id'] for job in jobs]
+        for job in jobs:
+            self._executor.submit(self._execute, job)
+        return [job['id'] for job in jobs]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """获取任务记录的副本，任务不存在或已过期时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_batch(self, batch_id: str) -> Optional[List[Optional[Dict]]]:
+        """按提交顺序获取批次中的任务记录，批次不存在时返回None"""
+        with self._lock:
+            job_ids = self._batches.get(batch_id)
+        if job_ids is None:
+            return None
+        return [self.get(job_id) for job_id in job_ids]
+
+    def stats(self) -> Dict:
+        """队列状态"""
+        with self._lock:
+            return {
+                'backend': 'local',
+                'queued': self._count('queued'),
+                'running': self._count('running'),
+                'workers': self.workers,
+                'max_queue_size': self.max_queue_size
+            }
+
+    def _execute(self, job: Dict) -> None:
+        def report_progress(progress: float, detail: Optional[Dict] = None):
+            job['progress'] = progress
+            job['progress_detail'] = detail
+        _run_job(job, self.handler, report_progress)
+
+    def _count(self, status: str) -> int:
+        return sum(1 for job in self._jobs.values() if job['status'] == status)
+
+    def _prune(self) -> None:
+        """删除超过保留时间的已完成任务"""
+        expire_before = time.time() - self.result_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job['finished_at'] and job['finished_at'] < expire_before:
+                del self._jobs[job_id]
+        for batch_id, job_ids in list(self._batches.items()):
+            if not any(job_id in self._jobs for job_id in job_ids):
+                del self._batches[batch_id]
+
+
+class RedisJobQueue:
+    """基于Redis列表的任务队列，每个Web进程运行若干工作线程（调用 start() 后开始处理）"""
+
+    def __init__(self, handler: JobHandler, redis_client, workers: int = 2, max_queue_size: int = 20,
+                 result_ttl: float = 3600 * 24, key_prefix: str = 'pictomd:jobs'):
+        """
+        Args:
+            handler: 任务处理函数
+            redis_client: Redis连接（decode_responses=True）
+            workers: 本进程的工作线程数
+            max_queue_size: 最多等待中的任务数，超过时拒绝提交
+            result_ttl: 已完成任务的保留时间（秒）
+            key_prefix: Redis键前缀
+        """
+        self.handler = handler
+        self.redis = redis_client
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.result_ttl = int(result_ttl)
+        self.queue_key = f'{key_prefix}:queue'
+        self.running_key = f'{key_prefix}:running'
+        self.job_prefix = f'{key_prefix}:job:'
+        self.batch_prefix = f'{key_prefix}:batch:'
+        self._started = False
+
+    def start(self) -> None:
+        """启动本进程的工作线程，重复调用无效"""
+        if self._started:
+            return
+        self._started = True
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-{index}', daemon=True).start()
+
+    def submit(self, params: Dict) -> str:
+        """
+        提交任务
+
+        Args:
+            params: 任务参数，需可JSON序列化
+
+        Returns:
+            任务ID
+        """
+        return self.submit_batch(None, [params])[0]
+
+    def submit_batch(self, batch_id: Optional[str], params_list: Sequence[Dict]) -> List[str]:
+        """
+        提交一批任务，由各Web进程的工作线程并发执行；排队空间不足时整批拒绝
+
+        Args:
+            batch_id: 批次ID，为None时不记录批次
+            params_list: 各任务的参数，需可JSON序列化
+
+        Returns:
+            与 params_list 顺序一致的任务ID
+        """
+        if self.redis.llen(self.queue_key) + len(params_list) > self.max_queue_size:
+            raise QueueFullError(f"等待中的任务已达上限（{self.max_queue_size}）")
+        jobs = [_new_job(params) for params in params_list]
+        for job in jobs:
+            self._save(job)
+        job_ids = [job['id'] for job in jobs]
+        if batch_id is not None:
+            self.redis.set(self.batch_prefix + batch_id, json.dumps(job_ids), ex=self.result_ttl)
+        self.redis.rpush(self.queue_key, *job_ids)
+        return job_ids
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """获取任务记录，任务不存在或已过期时返回None"""
+        data = self.redis.get(self.job_prefix + job_id)
+        return json.loads(data) if data else None
+
+    def get_batch(self, batch_id: str) -> Optional[List[Optional[Dict]]]:
+        """按提交顺序获取批次中的任务记录，批次不存在时返回None"""
+        data = self.redis.get(self.batch_prefix + batch_id)
+        if not data:
+            return None
+        return [self.get(job_id) for job_id in json.loads(data)]
+
+    def stats(self) -> Dict:
+        """队列状态（running 为所有Web进程的合计）"""
+        return {
+            'backend': 'redis',
+            'queued': self.redis.llen(self.queue_key),
+            'running': self.redis.scard(self.running_key),
+            'workers': self.workers,
+            'max_queue_size': self.max_queue_size
+        }
+
+    def _save(self, job: Dict) -> None:
+        self.redis.set(self.job_prefix + job['id'], json.dumps(job, ensure_ascii=False), ex=self.result_ttl)
+
+    def _work(self) -> None:
+        """工作线程：阻塞等待队列中的任务"""
+        while True:
+            try:
+                item = self.redis.blpop(self.queue_key, timeout=5)
+            except Exception as e:
+                print(f"读取任务队列失败: {str(e)}")
+                time.sleep(5)
+                continue
+            if item is None:
+                continue
+
+            job = self.get(item[1])
+            if job is None:
+                continue  # 任务记录已过期
+
+            def report_progress(progress: float, detail: Optional[Dict] = None):
+                job['progress'] = progress
+                job['progress_detail'] = detail
+                self._save(job)
+
+            self.redis.sadd(self.running_key, job['id'])
+            job['status'] = 'running'
+            self._save(job)
+            try:
+                _run_job(job, self.handler, report_progress)
+                self._save(job)
+            finally:
+                self.redis.srem(self.running_key, job['id'])
+
+
+def create_job_queue(handler: JobHandler, config: Dict, redis_client=None):
+    """
+    根据配置创建任务队列
+
+    Args:
+        handler: 任务处理函数
+        config: JOB_QUEUE_CONFIG
+        redis_client: Redis连接，使用redis后端时必需
+
+    Returns:
+        LocalJobQueue 或 RedisJobQueue
+    """
+    options = {
+        'workers': config['WORKERS'],
+        'max_queue_size': config['MAX_QUEUE_SIZE'],
+        'result_ttl': config['RESULT_TTL']
+    }
+    if config['BACKEND'] == 'redis':
+        if redis_client is None:
+            raise ValueError("redis后端需要提供Redis连接")
+        return RedisJobQueue(handler, redis_client, key_prefix=config['REDIS_KEY_PREFIX'], **options)
+    if config['BACKEND'] != 'local':
+        raise ValueError(f"不支持的任务队列后端: {config['BACKEND']}")
+    return LocalJobQueue(handler, **options)
@@ -0,0 +1,202 @@
+"""
+进程内的性能指标
+
+记录各处理阶段的耗时分布（直方图）以及页数、文本块数、token数、API重试次数和
+各级缓存命中情况（计数器）。Web应用通过 /metrics 以Prometheus文本格式输出，
+命令行使用 --metrics 在转换结束后输出。
+
+不依赖 prometheus_client；多进程部署时每个进程各自统计。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils import estimate_tokens
+
+# 耗时直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {','.join(key) or 'total': value for key, value in sorted(self._values.items())}
+
+
+class Histogram:
+    """耗时分布：各分桶的累计次数、总和与次数"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # 标签值 -> [各分桶次数, 总和, 次数]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                ','.join(key) or 'total': {
+                    'count': count,
+                    'sum': round(total, 4),
+                    'avg': round(total / count, 4) if count else 0.0
+                }
+                for key, (_, total, count) in sorted(self._series.items())
+            }
+
+
+class Registry:
+    """指标集合"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """各指标的当前值（便于阅读的字典，含各级缓存的命中率）"""
+        data = {metric.name: metric.snapshot() for metric in self._metrics}
+        data['cache_hit_rate'] = cache_hit_rates()
+        return data
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'pictomd_stage_duration_seconds',
+    '各处理阶段的耗时（render 页面渲染、preprocess 图像预处理、ocr 整页识别、clean 文本清理、'
+    'chunk 分块、llm_request 单次API请求、translate 翻译）',
+    ['stage']
+))
+PAGES = REGISTRY.register(Counter('pictomd_pages_total', '提取的页数'))
+CHUNKS = REGISTRY.register(Counter(
+    'pictomd_chunks_total', '调用API转换的文本块数（failed 为保留原始文本的块）', ['result']
+))
+TOKENS = REGISTRY.register(Counter(
+    'pictomd_tokens_total', 'API的token数（API未返回用量时按文本估算）', ['endpoint', 'kind']
+))
+API_RETRIES = REGISTRY.register(Counter('pictomd_api_retries_total', 'API请求的重试次数', ['endpoint']))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'pictomd_cache_requests_total',
+    '各级缓存的查询次数（ocr 页面识别结果、llm 页面Markdown、result 整个转换结果）',
+    ['cache', 'result']
+))
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """记录一次缓存查询"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def cache_hit_rates() -> Dict[str, float]:
+    """各级缓存的命中率"""
+    rates = {}
+    for cache in ('ocr', 'llm', 'result'):
+        hits = CACHE_REQUESTS.get(cache=cache, result='hit')
+        misses = CACHE_REQUESTS.get(cache=cache, result='miss')
+        if hits + misses:
+            rates[cache] = round(hits / (hits + misses), 4)
+    return rates
+
+
+def record_tokens(endpoint: str, usage: Optional[Dict], prompt: str, completion: str) -> None:
+    """
+    记录一次API调用的token数
+
+    Args:
+        endpoint: markdown 或 translate
+        usage: API响应中的 usage 字段，缺少时按文本估算
+        prompt: 发送的文本
+        completion: 返回的文本
+    """
+    usage = usage or {}
+    TOKENS.inc(usage.get('prompt_tokens') or estimate_tokens(prompt), endpoint=endpoint, kind='prompt')
+    TOKENS.inc(usage.get('completion_tokens') or estimate_tokens(completion), endpoint=endpoint, kind='completion')
+
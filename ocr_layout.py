@@ -0,0 +1,218 @@
+"""
+扫描页面的版面分割
+
+在缩小后的页面图像上用OpenCV形态学运算检测文本块、分栏和表格区域，
+按阅读顺序排列，供逐区域并行OCR识别后重新拼接
+"""
+from bisect import bisect_right
+from typing import Dict, List, Sequence
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils import join_ocr_words, rows_to_markdown_table
+
+# 版面检测时页面缩小到的宽度（像素）
+DETECT_WIDTH = 1000
+
+# 合并同一行内词语的水平距离、合并同一文本块内各行的垂直距离（相对页宽）
+WORD_GAP_RATIO = 0.012
+LINE_GAP_RATIO = 0.014
+
+# 面积小于此比例的区域视为噪点
+MIN_REGION_AREA_RATIO = 0.0002
+
+# 前景像素比例超过此值的区域视为图片或扫描黑边，不做识别
+MAX_INK_RATIO = 0.5
+
+# 高度不超过此值（相对页宽）的文本块按单行识别
+SINGLE_LINE_RATIO = 0.035
+
+# 表格线的最小长度（相对页宽或页高）
+TABLE_LINE_RATIO = 1 / 25
+
+# 表格线至少贯穿表格区域的比例
+TABLE_LINE_COVERAGE = 0.4
+
+# 宽度超过此比例的区域视为通栏，分隔上下两组分栏
+FULL_WIDTH_RATIO = 0.6
+
+
+def _line_positions(mask: np.ndarray, axis: int) -> List[int]:
+    """
+    找出掩码中贯穿区域的直线位置
+
+    axis=1 时返回水平线的y坐标，axis=0 时返回垂直线的x坐标
+    """
+    counts = np.count_nonzero(mask, axis=axis)
+    indices = np.flatnonzero(counts >= mask.shape[axis] * TABLE_LINE_COVERAGE)
+    if not len(indices):
+        return []
+    groups = np.split(indices, np.flatnonzero(np.diff(indices) > 1) + 1)
+    return [int(group.mean()) for group in groups]
+
+
+def _detect_tables(binary: np.ndarray):
+    """
+    根据横竖表格线检测表格
+
+    Returns:
+        (表格区域列表, 表格区域的掩码)
+    """
+    height, width = binary.shape
+    horizontal = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(
+        cv2.MORPH_RECT, (max(10, round(width * TABLE_LINE_RATIO)), 1)))
+    vertical = cv2.morphologyEx(binary, cv2.MORPH_OPEN, cv2.getStructuringElement(
+        cv2.MORPH_RECT, (1, max(10, round(height * TABLE_LINE_RATIO)))))
+    grid = cv2.dilate(cv2.bitwise_or(horizontal, vertical), np.ones((3, 3), np.uint8))
+
+    tables = []
+    mask = np.zeros_like(binary)
+    for contour in cv2.findContours(grid, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]:
+        x, y, w, h = cv2.boundingRect(contour)
+        rows = _line_positions(horizontal[y:y + h, x:x + w], axis=1)
+        cols = _line_positions(vertical[y:y + h, x:x + w], axis=0)
+        if len(rows) < 2 or len(cols) < 2:
+            continue  # 单独的分隔线或下划线
+        tables.append({
+            'kind': 'table',
+            'box': (x, y, x + w, y + h),
+            'rows': [y + row for row in rows],
+            'cols': [x + col for col in cols]
+        })
+        mask[y:y + h, x:x + w] = 255
+    return tables, mask
+
+
+def _order_columns(regions: Sequence[Dict]) -> List[Dict]:
+    """把水平方向互相重叠的区域归为一栏，各栏从左到右、栏内从上到下排列"""
+    columns = []
+    for region in sorted(regions, key=lambda r: r['box'][0]):
+        x0, _, x1, _ = region['box']
+        if columns and x0 < columns[-1][1]:
+            columns[-1][1] = max(columns[-1][1], x1)
+            columns[-1][2].append(region)
+        else:
+            columns.append([x0, x1, [region]])
+    return [
+        region
+        for _, _, members in columns
+        for region in sorted(members, key=lambda r: r['box'][1])
+    ]
+
+
+def order_regions(regions: Sequence[Dict], page_width: int) -> List[Dict]:
+    """
+    按阅读顺序排列区域
+
+    通栏区域（标题、跨栏段落、宽表格）把页面分成上下几段，
+    每段内的区域按分栏顺序排列
+
+    Args:
+        regions: 区域列表，每项的 box 为 (x0, y0, x1, y1)
+        page_width: 页面宽度
+
+    Returns:
+        排好序的区域列表
+    """
+    ordered = []
+    band = []
+    for region in sorted(regions, key=lambda r: r['box'][1]):
+        x0, _, x1, _ = region['box']
+        if x1 - x0 >= page_width * FULL_WIDTH_RATIO:
+            ordered.extend(_order_columns(band))
+            band = []
+            ordered.append(region)
+        else:
+            band.append(region)
+    ordered.extend(_order_columns(band))
+    return ordered
+
+
+def detect_regions(image: Image.Image) -> List[Dict]:
+    """
+    检测页面中的文本块和表格区域
+
+    Args:
+        image: 页面图像
+
+    Returns:
+        按阅读顺序排列的区域列表（坐标对应原图）。每项包含：
+        kind（'text'、'line' 单行文本或 'table'）、box (x0, y0, x1, y1)，
+        表格另有 rows、cols 表格线坐标
+    """
+    gray = np.array(image.convert('L'))
+    height, width = gray.shape
+    scale = min(1.0, DETECT_WIDTH / width)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    small_height, small_width = gray.shape
+
+    # 文字为前景（白色）
+    binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
+    tables, table_mask = _detect_tables(binary)
+
+    # 膨胀使同一段落的文字连成一片，再取外轮廓作为文本块
+    text = cv2.bitwise_and(binary, cv2.bitwise_not(table_mask))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (
+        max(3, round(small_width * WORD_GAP_RATIO)),
+        max(3, round(small_width * LINE_GAP_RATIO))
+    ))
+    merged = cv2.dilate(text, kernel)
+
+    regions = list(tables)
+    min_area = small_width * small_height * MIN_REGION_AREA_RATIO
+    for contour in cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_area:
+            continue
+        if np.count_nonzero(binary[y:y + h, x:x + w]) > w * h * MAX_INK_RATIO:
+            continue
+        regions.append({
+            'kind': 'line' if h <= small_width * SINGLE_LINE_RATIO else 'text',
+            'box': (x, y, x + w, y + h)
+        })
+
+    regions = order_regions(regions, small_width)
+
+    # 坐标换算回原图
+    for region in regions:
+        x0, y0, x1, y1 = region['box']
+        region['box'] = (
+            max(0, int(x0 / scale)), max(0, int(y0 / scale)),
+            min(width, int(np.ceil(x1 / scale))), min(height, int(np.ceil(y1 / scale)))
+        )
+        if region['kind'] == 'table':
+            region['rows'] = [int(row / scale) for row in region['rows']]
+            region['cols'] = [int(col / scale) for col in region['cols']]
+    return regions
+
+
+def table_data_to_markdown(data: dict, rows: Sequence[int], cols: Sequence[int]) -> str:
+    """
+    按表格线把OCR识别出的词分配到单元格，生成Markdown表格
+
+    Args:
+        data: 表格区域的 image_to_data 结果（坐标相对于表格区域）
+        rows: 水平表格线的y坐标（相对于表格区域，从上到下）
+        cols: 垂直表格线的x坐标（相对于表格区域，从左到右）
+
+    Returns:
+        Markdown表格；没有识别到文字时返回空字符串
+    """
+    cells = [[[] for _ in range(len(cols) - 1)] for _ in range(len(rows) - 1)]
+    for i, word in enumerate(data['text']):
+        word = (word or '').strip()
+        if not word or float(data['conf'][i]) < 0:
+            continue
+        center_x = data['left'][i] + data['width'][i] / 2
+        center_y = data['top'][i] + data['height'][i] / 2
+        row = bisect_right(rows, center_y) - 1
+        col = bisect_right(cols, center_x) - 1
+        if 0 <= row < len(cells) and 0 <= col < len(cells[row]):
+            cells[row][col].append(word)
+
+    table = [[join_ocr_words(words) for words in row] for row in cells]
+    table = [row for row in table if any(row)]
+    return rows_to_markdown_table(table) if table else ''
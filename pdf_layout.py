@@ -0,0 +1,328 @@
+"""
+基于字体信息的PDF版面分析
+
+读取PyMuPDF提供的字号、粗体标记和文本块位置，推断标题层级、列表和表格，
+直接从可提取文本的PDF生成Markdown草稿。页面可以分批交给多个进程并行处理。
+"""
+import re
+from collections import Counter
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from utils import iter_parallel_map, rows_to_markdown_table
+
+# PyMuPDF 文本片段的粗体标记位
+BOLD_FLAG = 16
+
+# 字号至少为正文的多少倍才视为标题
+HEADING_SIZE_RATIO = 1.15
+
+# 根据字号推断的最大标题层级（粗体正文标题使用下一级）
+MAX_SIZE_HEADING_LEVELS = 3
+
+# 标题的最大长度，超过则按正文处理
+MAX_HEADING_LENGTH = 120
+
+# 列表标记
+BULLET_PATTERN = re.compile(r'^\s*(?:[•●○◦▪▫■□‣⁃∙·]\s*|[-–*]\s+)')
+NUMBERED_PATTERN = re.compile(r'^\s*(\d{1,3})(?:[.)]\s+|、\s*)')
+
+# 中日文字符（行间拼接时不加空格）
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uff00-\uffef\u3000-\u303f]')
+
+
+def _round_size(size: float) -> float:
+    """字号按0.5磅取整，消除同一字号的细微差异"""
+    return round(size * 2) / 2
+
+
+def _sample_page_numbers(page_count: int, sample_pages: int) -> List[int]:
+    """在全文中均匀抽取页码"""
+    if page_count <= sample_pages:
+        return list(range(page_count))
+    step = page_count / sample_pages
+    return sorted({int(i * step) for i in range(sample_pages)})
+
+
+def build_font_profile(pdf_path: str, sample_pages: int = 20) -> Dict:
+    """
+    统计文档的字号分布，得到正文字号和标题字号
+
+    Args:
+        pdf_path: PDF文件路径
+        sample_pages: 最多抽样的页数，避免为统计字号读取整份大文档
+
+    Returns:
+        字号信息，包含 body_size 和 heading_sizes（按层级从大到小）
+    """
+    sizes = Counter()
+    with fitz.open(pdf_path) as doc:
+        for page_number in _sample_page_numbers(doc.page_count, sample_pages):
+            for block in doc[page_number].get_text('dict')['blocks']:
+                for line in block.get('lines', []):
+                    for span in line['spans']:
+                        text = span['text'].strip()
+                        if text:
+                            sizes[_round_size(span['size'])] += len(text)
+    return font_profile_from_sizes(sizes)
+
+
+def font_profile_from_sizes(sizes: Counter) -> Dict:
+    """
+    根据字号的字数分布推断标题层级
+
+    字数最多的字号视为正文；明显大于正文的字号按从大到小聚类，
+    相差不超过1磅的字号归为同一层级
+
+    Args:
+        sizes: 字号到字数的计数
+
+    Returns:
+        字号信息，heading_sizes 中每项为该层级的最小字号
+    """
+    if not sizes:
+        return {'body_size': 0.0, 'heading_sizes': []}
+
+    body_size = sizes.most_common(1)[0][0]
+    candidates = sorted(
+        (size for size in sizes if size >= body_size * HEADING_SIZE_RATIO),
+        reverse=True
+    )
+
+    heading_sizes = []
+    for size in candidates:
+        if heading_sizes and heading_sizes[-1] - size <= 1:
+            heading_sizes[-1] = size  # 归入当前层级
+        elif len(heading_sizes) < MAX_SIZE_HEADING_LEVELS:
+            heading_sizes.append(size)
+        else:
+            break
+
+    return {'body_size': body_size, 'heading_sizes': heading_sizes}
+
+
+def _heading_level(profile: Dict, size: float, bold: bool, text: str, line_count: int) -> int:
+    """推断文本块的标题层级，0 表示不是标题"""
+    if len(text) > MAX_HEADING_LENGTH:
+        return 0
+    size = _round_size(size)
+    for level, min_size in enumerate(profile['heading_sizes'], 1):
+        if size >= min_size:
+            return level
+    # 与正文字号相同的单行粗体文本视为最低一级标题
+    if bold and line_count == 1 and size >= profile['body_size']:
+        return min(len(profile['heading_sizes']) + 1, 6)
+    return 0
+
+
+def _join_lines(lines: Sequence[str]) -> str:
+    """拼接同一段落中的多行文本"""
+    text = ''
+    for line in lines:
+        if not text:
+            text = line
+        elif text.endswith('-') and line[:1].islower():
+            text = text[:-1] + line  # 英文断词
+        elif CJK_PATTERN.match(text[-1]) or CJK_PATTERN.match(line[0]):
+            text += line
+        else:
+            text += ' ' + line
+    return text
+
+
+def _render_list(lines: Sequence[str]) -> Optional[str]:
+    """把以列表标记开头的行渲染为Markdown列表，首行不是列表项时返回None"""
+    items = []
+    for line in lines:
+        numbered = NUMBERED_PATTERN.match(line)
+        bullet = BULLET_PATTERN.match(line)
+        if numbered:
+            items.append([f"{numbered.group(1)}. ", line[numbered.end():]])
+        elif bullet:
+            items.append(['- ', line[bullet.end():]])
+        elif items:
+            items[-1].append(line)  # 上一项的续行
+        else:
+            return None
+    return '\n'.join(marker + _join_lines(parts) for marker, *parts in items)
+
+
+def _render_block(block: Dict, profile: Dict) -> Tuple[str, str]:
+    """
+    渲染一个文本块
+
+    Returns:
+        (纯文本, Markdown)，空块返回两个空字符串
+    """
+    lines = []
+    sizes = Counter()
+    bold = True
+    for line in block.get('lines', []):
+        spans = [span for span in line['spans'] if span['text'].strip()]
+        if not spans:
+            continue
+        lines.append(''.join(span['text'] for span in line['spans']).strip())
+        for span in spans:
+            sizes[span['size']] += len(span['text'].strip())
+            bold = bold and bool(span['flags'] & BOLD_FLAG or 'bold' in span['font'].lower())
+
+    if not lines:
+        return '', ''
+
+    plain = _join_lines(lines)
+    level = _heading_level(profile, sizes.most_common(1)[0][0], bold, plain, len(lines))
+    if level:
+        return plain, f"{'#' * level} {plain}"
+
+    listing = _render_list(lines)
+    if listing is not None:
+        return plain, listing
+
+    return plain, plain
+
+
+def _find_tables(page) -> List[Tuple[fitz.Rect, str]]:
+    """检测页面中的表格，返回 (区域, Markdown) 列表"""
+    try:
+        found = page.find_tables()
+    except Exception:  # 旧版本PyMuPDF没有 find_tables，或表格检测失败
+        return []
+
+    tables = []
+    for table in found.tables:
+        markdown = rows_to_markdown_table(table.extract())
+        if markdown:
+            tables.append((fitz.Rect(table.bbox), markdown))
+    return tables
+
+
+def _inside_any(rect: fitz.Rect, areas: Sequence[fitz.Rect]) -> bool:
+    """判断区域是否大部分落在任一给定区域内"""
+    area = abs(rect)
+    return bool(area) and any(abs(rect & other) >= area * 0.5 for other in areas)
+
+
+def render_page_markdown(page, profile: Dict, start_patterns: Sequence[str] = (),
+                         detect_tables: bool = True) -> str:
+    """
+    根据字体信息把单页渲染为Markdown
+
+    Args:
+        page: PyMuPDF页面对象
+        profile: build_font_profile 得到的字号信息
+        start_patterns: 起始标记的正则；给出时丢弃第一个匹配之前的内容
+        detect_tables: 是否检测表格
+
+    Returns:
+        页面的Markdown文本
+    """
+    tables = _find_tables(page) if detect_tables else []
+    table_areas = [rect for rect, _ in tables]
+
+    # 文本块按内容流顺序排列，通常即阅读顺序（多栏排版也能保持）
+    blocks = []
+    for block in page.get_text('dict')['blocks']:
+        if block.get('type') != 0:
+            continue
+        rect = fitz.Rect(block['bbox'])
+        if _inside_any(rect, table_areas):
+            continue
+        plain, markdown = _render_block(block, profile)
+        if markdown:
+            blocks.append([rect.y0, plain, markdown])
+
+    if start_patterns:
+        for index, (y0, plain, _) in enumerate(blocks):
+            match = next(
+                (m for m in (re.search(p, plain, re.IGNORECASE) for p in start_patterns) if m),
+                None
+            )
+            if match:
+                remainder = plain[match.end():].strip()
+                blocks = ([[y0, remainder, remainder]] if remainder else []) + blocks[index + 1:]
+                tables = [(rect, markdown) for rect, markdown in tables if rect.y0 >= y0]
+                break
+
+    # 表格插入到其下方第一个文本块之前
+    parts = []
+    pending_tables = sorted(tables, key=lambda table: table[0].y0)
+    for y0, _, markdown in blocks:
+        while pending_tables and pending_tables[0][0].y0 <= y0:
+            parts.append(pending_tables.pop(0)[1])
+        parts.append(markdown)
+    parts.extend(markdown for _, markdown in pending_tables)
+
+    return '\n\n'.join(parts)
+
+
+def render_pages_markdown(pdf_path: str, page_numbers: Sequence[int], profile: Dict,
+                          trim_page: Optional[int] = None, start_patterns: Sequence[str] = (),
+                          detect_tables: bool = True) -> List[str]:
+    """
+    渲染一批页面（可在子进程中执行）
+
+    Args:
+        pdf_path: PDF文件路径
+        page_numbers: 页码列表（从0开始）
+        profile: 字号信息
+        trim_page: 需要按起始标记裁剪的页码
+        start_patterns: 起始标记的正则
+        detect_tables: 是否检测表格
+
+    Returns:
+        与 page_numbers 一一对应的Markdown文本
+    """
+    with fitz.open(pdf_path) as doc:
+        return [
+            render_page_markdown(
+                doc[page_number],
+                profile,
+                start_patterns if page_number == trim_page else (),
+                detect_tables
+            )
+            for page_number in page_numbers
+        ]
+
+
+def iter_pdf_markdown_pages(pdf_path: str, page_numbers: Sequence[int], profile: Optional[Dict] = None,
+                            trim_page: Optional[int] = None, start_patterns: Sequence[str] = (),
+                            workers: int = 0, min_parallel_pages: int = 8, pages_per_task: int = 4,
+                            detect_tables: bool = True) -> Iterator[str]:
+    """
+    按页产出Markdown草稿，页数较多时使用多进程并行渲染
+
+    Args:
+        pdf_path: PDF文件路径
+        page_numbers: 要渲染的页码（从0开始），按此顺序产出
+        profile: 字号信息，为None时自动统计
+        trim_page: 需要按起始标记裁剪的页码
+        start_patterns: 起始标记的正则
+        workers: 进程数，0 表示使用CPU核数，1 表示不使用多进程
+        min_parallel_pages: 页数少于此值时在当前进程中渲染
+        pages_per_task: 每个任务渲染的页数，减少重复打开文档的开销
+        detect_tables: 是否检测表格
+
+    Returns:
+        页面Markdown文本的迭代器
+    """
+    if profile is None:
+        profile = build_font_profile(pdf_path)
+
+    batches = [
+        list(page_numbers[i:i + pages_per_task])
+        for i in range(0, len(page_numbers), pages_per_task)
+    ]
+    options = {
+        'trim_page': trim_page,
+        'start_patterns': tuple(start_patterns),
+        'detect_tables': detect_tables
+    }
+
+    if len(page_numbers) < min_parallel_pages:
+        workers = 1
+
+    render = partial(render_pages_markdown, pdf_path, profile=profile, **options)
+    for pages in iter_parallel_map(render, batches, workers):
+        yield from pages
@@ -1,17 +1,23 @@
 import os
+import argparse
 from pdf2image import convert_from_path  # 用于将PDF转换为图片
 import pytesseract  # OCR文字识别工具
 import requests  # 用于发送HTTP请求
 import json
 import fitz  # PyMuPDF，用于处理PDF文件
-from typing import List, Optional, Union, Tuple
+from typing import List, Optional, Union, Tuple, Iterable, Iterator, Sequence
 from PIL import Image  # 图片处理
 import re  # 正则表达式
 from pathlib import Path  # 路径处理
 import langdetect  # 用于语言检测
-import docx  # 导入python-docx库
-from PIL import ImageEnhance
+from PIL import ImageEnhance, ImageSequence
 import time  # 用于添加请求间隔
+import itertools
+from collections import deque
+import threading
+import tempfile
+import io
+from functools import partial
 
 # 导入配置
 from config import (
@@ -20,19 +26,177 @@ from config import (
     SUPPORTED_FORMATS, SUPPORTED_IMAGE_FORMATS, SUPPORTED_TEXT_FORMATS,
     OCR_CONFIG, API_RETRY_COUNT, API_RETRY_DELAY, API_RATE_LIMIT,
     TOP_K, TOP_P, FREQUENCY_PENALTY, API_REQUEST_TIMEOUT,
-    MAX_CHUNK_SIZE, LANGUAGE_DISPLAY_NAMES
+    MAX_CHUNK_SIZE, LANGUAGE_DISPLAY_NAMES, PIPELINE_QUEUE_SIZE,
+    LAYOUT_MARKDOWN_MODE, LAYOUT_WORKERS, LAYOUT_DETECT_TABLES,
+    BOILERPLATE_CONFIG, SPREADSHEET_CONFIG, EBOOK_CONFIG, DOCUMENT_CONFIG,
+    PRESENTATION_CONFIG, IMAGE_CONFIG, OCR_WORKERS, OCR_TIER_CONFIG,
+    OCR_LAYOUT_CONFIG, INCREMENTAL_CONFIG, SHARD_CONFIG, RESULT_CACHE_CONFIG, PROGRESS_CONFIG,
+    TRACE_CONFIG
 )
 from utils import (
     check_file_exists, ensure_directory_exists,
-    merge_markdown_chunks, clean_markdown_format
+    merge_markdown_chunks, clean_markdown_format,
+    MarkdownChunkMerger, BoilerplateStripper, iter_in_background, iter_parallel_map,
+    ocr_data_to_text, ConversionManifest, parse_page_range, estimate_tokens, sweep_directory,
+    iter_line_blocks, iter_paragraph_blocks
 )
+from pdf_layout import iter_pdf_markdown_pages
+from progress import ProgressTracker
+from metrics import REGISTRY, PAGES, CHUNKS, API_RETRIES, record_cache, record_tokens
+from tracing import Tracer, TraceHook, ChromeTraceExporter, JobProfiler, traced
+from ocr_layout import detect_regions, table_data_to_markdown
+from sharding import (
+    split_shards, create_shard_queue, remove_shard_queue, start_local_workers,
+    wait_for_shards, merge_shard_outputs, run_shard_worker
+)
+from result_cache import create_result_cache, hash_file, make_cache_key
+from extractors import (
+    iter_spreadsheet_markdown, iter_epub_markdown, iter_docx_markdown, iter_pptx_slides,
+    convert_with_libreoffice, CONVERTIBLE_DOCUMENT_FORMATS
+)
+
+# 不同语言的清理模式
+# 空白合并模式 ' \s+|[^\S ]\s*' 等价于 '\s+' 替换为单个空格，但跳过本来就是单个空格的位置，
+# 避免对每个词间空格都做一次无效替换；line_space 是不跨行的版本，用于逐行清理
+LANGUAGE_PATTERN_SOURCES = {
+    'zh': {  # 中文（简体和繁体）
+        'space': r'([^\u4e00-\u9fff])\s+([^\u4e00-\u9fff])',
+        'line_space': r'([^\u4e00-\u9fff\n])[^\S\n]+([^\u4e00-\u9fff\n])',
+        'punctuation': r'[""'']+',
+        'noise': r'[·・︰]',
+        'level2': r'[^\u4e00-\u9fff\u3000-\u303f\uff00-\uffef\u0020-\u007f\n]'
+    },
+    'en': {  # 英文
+        'space': r' \s+|[^\S ]\s*',
+        'line_space': r' [^\S\n]+|[^\S \n][^\S\n]*',
+        'punctuation': r'[""'']+',
+        'noise': r'[·・︰]',
+        'level2': r'[^\x20-\x7f\n]'
+    },
+    'ja': {  # 日文
+        'space': r'([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff])\s+([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff])',
+        'line_space': r'([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\n])[^\S\n]+([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\n])',
+        'punctuation': r'[""'']+',
+        'noise': r'[·・︰]',
+        # 片假名范围不含中点（U+30FB），使强化清理的字符集包含全部干扰字符
+        'level2': r'[^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30fa\u30fc-\u30ff\u3000-\u303f\uff00-\uffef\u0020-\u007f\n]'
+    },
+    'default': {  # 其他语言
+        'space': r' \s+|[^\S ]\s*',
+        'line_space': r' [^\S\n]+|[^\S \n][^\S\n]*',
+        'punctuation': r'[""'']+',
+        'noise': r'[·・︰]',
+        'level2': r'[^\x20-\x7f\n]'
+    }
+}
+
+# 只含空白字符的行连成的空行段
+BLANK_LINE_RUNS = re.compile(r'\n(?:[^\S\n]*\n)+')
+
+# 附件内容起始标记
+ATTACHMENT_START_PATTERNS = [
+    r'附\s*件\s*[：:]\s*',
+    r'附\s*件\s*\d+\s*[：:]\s*',
+    r'attachment\s*[：:]\s*',
+    r'appendix\s*[：:]\s*'
+]
+
+# 转换和翻译提示词的版本，修改提示词后递增，使旧的结果缓存失效
+PROMPT_VERSION = 1
+
+# tesseract参数中的页面分割模式
+PSM_PATTERN = re.compile(r'--psm\s+\d+')
+
+def _with_psm(config: str, psm: int) -> str:
+    """替换tesseract参数中的页面分割模式"""
+    if PSM_PATTERN.search(config):
+        return PSM_PATTERN.sub(f'--psm {psm}', config)
+    return f'{config} --psm {psm}'.strip()
+
+def result_cache_key(content_hash: str, clean_level: int, ocr_language: str,
+                     need_translation: bool, page_range: Optional[str] = None) -> str:
+    """
+    生成结果缓存键：内容哈希加上所有影响转换结果的参数
+    
+    Args:
+        content_hash: 输入文件的SHA-256
+        clean_level: 文本清理级别
+        ocr_language: OCR语言
+        need_translation: 是否翻译
+        page_range: 页码范围
+        
+    Returns:
+        缓存键
+    """
+    return make_cache_key(content_hash, {
+        'clean_level': clean_level,
+        'ocr_language': ocr_language,
+        'translate': need_translation,
+        'page_range': page_range,
+        'model': MODEL_NAME,
+        'prompt_version': PROMPT_VERSION,
+        'settings': output_settings(ocr_language)
+    })
+
+def output_settings(ocr_language: str) -> dict:
+    """影响转换结果的配置项（修改后旧的结果缓存随之失效）"""
+    return {
+        'layout_mode': LAYOUT_MARKDOWN_MODE,
+        'layout_tables': LAYOUT_DETECT_TABLES,
+        'ocr_config': OCR_CONFIG.get(ocr_language),
+        'ocr_tier': OCR_TIER_CONFIG,
+        'ocr_layout': OCR_LAYOUT_CONFIG['ENABLED'],
+        'boilerplate': BOILERPLATE_CONFIG
+    }
+
+def _compile_language_patterns(sources: dict) -> dict:
+    """
+    编译各语言的清理模式
+    
+    删除类模式（干扰字符、强化清理）均为单个字符集，编译为匹配连续字符串，
+    一次替换删除一整段而不是逐个字符
+    
+    Args:
+        sources: 语言代码到模式字符串的映射
+        
+    Returns:
+        语言代码到已编译模式的映射
+    """
+    return {
+        lang_code: {
+            'space': re.compile(patterns['space']),
+            'line_space': re.compile(patterns['line_space']),
+            'punctuation': re.compile(patterns['punctuation']),
+            'noise': re.compile(f"{patterns['noise']}+"),
+            'level2': re.compile(f"{patterns['level2']}+")
+        }
+        for lang_code, patterns in sources.items()
+    }
 
 class PDFToMarkdown:
     """PDF/图片/文本转Markdown工具类"""
     
-    def __init__(self, progress_callback=None):
-        """初始化配置"""
+    # 已编译的清理模式（类级别，只编译一次）
+    LANGUAGE_PATTERNS = _compile_language_patterns(LANGUAGE_PATTERN_SOURCES)
+    
+    def __init__(self, progress_callback=None, progress_event_callback=None):
+        """
+        初始化配置
+        
+        Args:
+            progress_callback: 进度回调，参数为总进度（0-100）
+            progress_event_callback: 进度事件回调，参数为包含阶段、完成数、字节数、token数和预计剩余时间的字典
+        """
         self.progress_callback = progress_callback
+        self.progress_event_callback = progress_event_callback
+        self.progress = ProgressTracker(
+            self._on_progress_event,
+            max_rate=PROGRESS_CONFIG['MAX_EMIT_RATE'],
+            weights=PROGRESS_CONFIG['STAGE_WEIGHTS'],
+            ema_alpha=PROGRESS_CONFIG['EMA_ALPHA']
+        )
+        # 各阶段、每页和每个文本块的跟踪span，通过 add_trace_hook 注册回调
+        self.tracer = Tracer()
         self.api_url = API_URL
         self.headers = {
             "Content-Type": "application/json",
@@ -46,40 +210,44 @@ class PDFToMarkdown:
         self._init_language_patterns()
         self.ocr_language = 'chi_sim'  # 默认简体中文
         self.need_translation = False   # 默认不需要翻译
+        self.result_cache = create_result_cache(RESULT_CACHE_CONFIG)
+        
+        # 分级OCR的统计：每一级处理的页数
+        self.ocr_tier_stats = self._new_ocr_tier_stats()
+        self._ocr_stats_lock = threading.Lock()
+    
+    def reset(self, progress_callback=None, progress_event_callback=None):
+        """
+        重置任务相关的状态，使实例可以被下一个任务复用（见 warmup.ConverterPool）
+        
+        进度回调、OCR语言和翻译设置恢复为默认值，丢弃跟踪回调和OCR统计；
+        编译好的清理规则和结果缓存保留
+        
+        Args:
+            progress_callback: 进度回调，参数为总进度（0-100）
+            progress_event_callback: 进度事件回调
+        """
+        self.progress_callback = progress_callback
+        self.progress_event_callback = progress_event_callback
+        self.progress.begin([])
+        self.tracer = Tracer()
+        self.ocr_language = 'chi_sim'
+        self.need_translation = False
+        self.ocr_tier_stats = self._new_ocr_tier_stats()
     
     def _init_ocr_config(self):
         """初始化OCR配置"""
         if os.name == 'nt':  # Windows系统
             self.poppler_path = POPPLER_PATH  # 设置Poppler路径
+        
+        # 同时运行多个tesseract时，限制每个进程的OpenMP线程数，避免CPU超额占用
+        if OCR_WORKERS != 1 or OCR_LAYOUT_CONFIG['REGION_WORKERS'] != 1:
+            os.environ.setdefault('OMP_THREAD_LIMIT', '1')
     
     def _init_language_patterns(self):
         """初始化不同语言的清理模式"""
-        self.language_patterns = {
-            'zh': {  # 中文（简体和繁体）
-                'space': r'([^\u4e00-\u9fff])\s+([^\u4e00-\u9fff])',
-                'punctuation': r'[""'']+',
-                'noise': r'[·・︰]',
-                'level2': r'[^\u4e00-\u9fff\u3000-\u303f\uff00-\uffef\u0020-\u007f\n]'
-            },
-            'en': {  # 英文
-                'space': r'\s+',
-                'punctuation': r'[""'']+',
-                'noise': r'[·・︰]',
-                'level2': r'[^\x20-\x7f\n]'
-            },
-            'ja': {  # 日文
-                'space': r'([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff])\s+([^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff])',
-                'punctuation': r'[""'']+',
-                'noise': r'[·・︰]',
-                'level2': r'[^\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\u3000-\u303f\uff00-\uffef\u0020-\u007f\n]'
-            },
-            'default': {  # 其他语言
-                'space': r'\s+',
-                'punctuation': r'[""'']+',
-                'noise': r'[·・︰]',
-                'level2': r'[^\x20-\x7f\n]'
-            }
-        }
+        # 清理模式在类加载时已编译，实例之间共享
+        self.language_patterns = self.LANGUAGE_PATTERNS
     
     def _is_scanned_pdf(self, pdf_path: str) -> bool:
         """
@@ -104,6 +272,81 @@ class PDFToMarkdown:
             text.append(page.get_text())
         return "\n".join(text)
     
+    def extract_markdown_from_pdf(self, pdf_path: str) -> str:
+        """
+        根据字体信息从PDF中直接生成Markdown（用于非扫描版PDF）
+        页面选择规则与 _extract_attachment_text 相同
+        """
+        return "\n\n".join(self.iter_layout_pages(pdf_path))
+    
+    def iter_layout_pages(self, pdf_path: str, page_numbers: Optional[Sequence[int]] = None) -> Iterator[str]:
+        """
+        逐页生成Markdown草稿（用于非扫描版PDF）
+        
+        按字号推断标题层级，保留列表和表格；页数较多时多进程并行渲染。
+        与 _iter_attachment_pages 一样跳过红头首页，并从第一个附件标记处开始
+        
+        Args:
+            pdf_path: PDF文件路径
+            page_numbers: 只处理这些页（从0开始），为None时处理全部页面
+            
+        Returns:
+            页面Markdown文本迭代器
+        """
+        selected = []
+        trim_page = None
+        
+        with fitz.open(pdf_path) as doc:
+            candidates = list(page_numbers) if page_numbers is not None else list(range(doc.page_count))
+            for index, page_num in enumerate(candidates):
+                # 只需纯文本判断红头和附件标记，找到附件起始页后不再读取
+                if page_num > 0 and trim_page is not None:
+                    selected.extend(candidates[index:])
+                    break
+                
+                text = doc[page_num].get_text()
+                if page_num == 0 and self._is_red_header_text(text):
+                    continue
+                
+                if trim_page is None and self._has_attachment_marker(text):
+                    trim_page = page_num
+                
+                if trim_page is not None or page_num > 0:
+                    selected.append(page_num)
+        
+        print(f"按版面信息生成Markdown，共 {len(selected)} 页...")
+        yield from iter_pdf_markdown_pages(
+            pdf_path,
+            selected,
+            trim_page=trim_page,
+            start_patterns=ATTACHMENT_START_PATTERNS,
+            workers=LAYOUT_WORKERS,
+            detect_tables=LAYOUT_DETECT_TABLES
+        )
+    
+    def _get_layout_mode(self, file_path: str) -> str:
+        """
+        确定文件是否直接按文档结构生成Markdown
+        
+        Returns:
+            'off'：提取纯文本后交给API转换；'draft'：结构化草稿交给API整理；
+            'direct'：直接输出结构化结果，不调用API
+        """
+        file_ext = Path(file_path).suffix.lower()
+        if file_ext in SUPPORTED_FORMATS['spreadsheet']:
+            return 'direct'  # 表格直接渲染，无需API
+        if file_ext == '.epub':
+            return 'direct'  # 电子书按HTML结构直接转换，无需API
+        if file_ext == '.docx' or file_ext in CONVERTIBLE_DOCUMENT_FORMATS:
+            return 'direct'  # Word文档按样式和表格结构直接转换，无需API
+        if file_ext in SUPPORTED_FORMATS['presentation']:
+            return 'direct'  # 演示文稿逐张幻灯片直接转换，无需API
+        if LAYOUT_MARKDOWN_MODE == 'off' or file_ext != '.pdf':
+            return 'off'
+        if self._is_scanned_pdf(file_path):
+            return 'off'
+        return LAYOUT_MARKDOWN_MODE
+    
     def convert_pdf_to_images(self, pdf_path: str) -> List[Image.Image]:
         """
         将PDF转换为图片列表
@@ -116,6 +359,24 @@ class PDFToMarkdown:
             return convert_from_path(pdf_path, poppler_path=self.poppler_path)
         return convert_from_path(pdf_path)
     
+    @traced('render', span_args=lambda pdf_path, page_number: {'page': page_number})
+    def convert_pdf_page_to_image(self, pdf_path: str, page_number: int) -> Image.Image:
+        """
+        将PDF的单页转换为图片
+        逐页渲染，避免一次性把整份文档的图片都放进内存
+        
+        Args:
+            pdf_path: PDF文件路径
+            page_number: 页码（从1开始）
+            
+        Returns:
+            页面图像
+        """
+        kwargs = {'first_page': page_number, 'last_page': page_number}
+        if os.name == 'nt':
+            kwargs['poppler_path'] = self.poppler_path
+        return convert_from_path(pdf_path, **kwargs)[0]
+    
     def set_ocr_language(self, language: str):
         """设置OCR识别语言"""
         self.ocr_language = language
@@ -124,35 +385,219 @@ class PDFToMarkdown:
         """设置是否需要翻译"""
         self.need_translation = need_translation
     
+    def add_trace_hook(self, hook: TraceHook):
+        """注册跟踪回调，在每个阶段、每页和每个文本块的span开始和结束时调用"""
+        self.tracer.add_hook(hook)
+    
+    def remove_trace_hook(self, hook: TraceHook):
+        """移除跟踪回调"""
+        self.tracer.remove_hook(hook)
+    
+    def set_result_cache(self, result_cache):
+        """设置结果缓存（如Web应用共享的缓存），为None时不使用缓存"""
+        self.result_cache = result_cache
+    
     def process_image(self, image_path: str) -> str:
-        """处理图片文件"""
+        """处理图片文件，多页TIFF/GIF的每一帧分别识别"""
         try:
-            # 打开图片
-            image = Image.open(image_path)
-            
-            # 图像预处理
-            processed_image = self.preprocess_image(image)
-            
-            # 设置OCR参数
-            custom_config = f'-l {self.ocr_language} --oem 1 --psm 3 ' + \
-                           '--dpi 300 ' + \
-                           '-c preserve_interword_spaces=1 ' + \
-                           '-c tessedit_char_blacklist=|' + \
-                           '-c textord_heavy_nr=1 ' + \
-                           '-c textord_min_linesize=2.5'  # 保留词间空格，去除容易误识别的字符，改进数字识别，改进小字体识别，改进OCR参数配置
-            # OCR识别
-            text = pytesseract.image_to_string(
-                processed_image,
-                lang=self.ocr_language,
-                config=custom_config
-            )
-            
-            return text
-            
+            return '\n\n'.join(self.iter_image_pages(image_path))
         except Exception as e:
             print(f"处理图片时出错: {str(e)}")
             raise
     
+    def iter_image_pages(self, image_path: str) -> Iterator[str]:
+        """
+        逐帧识别图片文件
+        
+        多页TIFF（如传真）和动图的每一帧作为一页，与扫描版PDF使用同一个OCR线程池
+        
+        Args:
+            image_path: 图片路径
+            
+        Returns:
+            每帧一页文本的迭代器
+        """
+        # 设置OCR参数
+        custom_config = f'-l {self.ocr_language} --oem 1 --psm 3 ' + \
+                       '--dpi 300 ' + \
+                       '-c preserve_interword_spaces=1 ' + \
+                       '-c tessedit_char_blacklist=|' + \
+                       '-c textord_heavy_nr=1 ' + \
+                       '-c textord_min_linesize=2.5'  # 保留词间空格，去除容易误识别的字符，改进数字识别，改进小字体识别，改进OCR参数配置
+        
+        with Image.open(image_path) as image:
+            total = getattr(image, 'n_frames', 1)
+            yield from self._iter_ocr_pages(self._iter_image_frames(image), custom_config, total)
+    
+    def _iter_image_frames(self, image: Image.Image) -> Iterator[Image.Image]:
+        """
+        逐帧解码图片，超过目标分辨率的图片在解码时即缩小
+        
+        JPEG使用draft模式按2的幂次缩小解码，不会分配全分辨率的缓冲区；
+        其他格式解码后立即缩小到目标尺寸
+        
+        Args:
+            image: 已打开的图片
+            
+        Returns:
+            各帧图像的迭代器（每帧为独立的副本）
+        """
+        for frame in ImageSequence.Iterator(image):
+            size = self._target_image_size(frame)
+            if size != frame.size:
+                if frame.format == 'JPEG':
+                    frame.draft('L' if frame.mode == 'L' else 'RGB', size)
+                frame = frame.copy()
+                if frame.size != size:
+                    frame = frame.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+                yield frame
+            else:
+                yield frame.copy()
+    
+    def _target_image_size(self, image: Image.Image) -> Tuple[int, int]:
+        """根据图片自带的DPI和最大边长计算OCR所需的尺寸，不放大图片"""
+        width, height = image.size
+        scale = 1.0
+        dpi = image.info.get('dpi')
+        if dpi and dpi[0] and float(dpi[0]) > IMAGE_CONFIG['TARGET_DPI']:
+            scale = IMAGE_CONFIG['TARGET_DPI'] / float(dpi[0])
+        scale = min(scale, IMAGE_CONFIG['MAX_LONG_EDGE'] / max(width, height))
+        if scale >= 1.0:
+            return image.size
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    
+    @traced('ocr', span_args=lambda image, config, index=None: {'index': index})
+    def _ocr_page_image(self, image: Image.Image, config: str, index: Optional[int] = None) -> str:
+        """
+        识别一页图像（可在线程池中执行）
+        
+        启用版面分割时逐区域识别；未检测到区域时整页识别
+        
+        Args:
+            image: 页面图像
+            config: tesseract参数
+            index: 页面在本次识别中的序号（从1开始），仅用于跟踪
+        """
+        if OCR_LAYOUT_CONFIG['ENABLED']:
+            regions = detect_regions(image)
+            if regions:
+                return self._ocr_page_regions(image, regions, config)
+        
+        text, tier = self._ocr_tiered(image, config)
+        self._count_ocr_tier(tier)
+        return text
+    
+    def _ocr_tiered(self, image: Image.Image, config: str) -> Tuple[str, str]:
+        """
+        分级识别一张图像
+        
+        启用分级OCR时，先对只转为灰度的图像做一次识别，平均词置信度达到阈值
+        即采用该结果；置信度不足时再经完整预处理后重新识别
+        
+        Returns:
+            (文本, 使用的级别 'light' 或 'heavy')
+        """
+        if OCR_TIER_CONFIG['ENABLED']:
+            text, confidence, word_count = ocr_data_to_text(pytesseract.image_to_data(
+                image.convert('L'),
+                lang=self.ocr_language,
+                config=config,
+                output_type=pytesseract.Output.DICT
+            ))
+            if (confidence >= OCR_TIER_CONFIG['MIN_CONFIDENCE'] and
+                    word_count >= OCR_TIER_CONFIG['MIN_WORDS']):
+                return text, 'light'
+        
+        image = self.preprocess_image(image)
+        text = pytesseract.image_to_string(
+            image,
+            lang=self.ocr_language,
+            config=config
+        )
+        return text, 'heavy'
+    
+    def _ocr_page_regions(self, image: Image.Image, regions: List[dict], config: str) -> str:
+        """
+        并行识别页面中的各个区域，按阅读顺序拼接
+        
+        文本块按块识别（--psm 6），单行文本按行识别（--psm 7），
+        表格按表格线把识别出的词分配到单元格，输出Markdown表格
+        """
+        image = image.convert('L')
+        recognize = partial(self._ocr_region, image, config=config)
+        results = list(iter_parallel_map(
+            recognize, regions, workers=OCR_LAYOUT_CONFIG['REGION_WORKERS'], threads=True
+        ))
+        
+        tiers = [tier for _, tier in results if tier]
+        for tier in tiers:
+            self._count_ocr_tier(f'{tier}_regions')
+        self._count_ocr_tier('heavy' if 'heavy' in tiers else 'light')
+        
+        return '\n\n'.join(text.strip() for text, _ in results if text.strip())
+    
+    def _ocr_region(self, image: Image.Image, region: dict, config: str) -> Tuple[str, Optional[str]]:
+        """
+        识别一个区域
+        
+        Returns:
+            (文本, 使用的级别)；表格区域不分级，级别为None
+        """
+        x0, y0, x1, y1 = region['box']
+        crop = image.crop(region['box'])
+        
+        if region['kind'] == 'table':
+            data = pytesseract.image_to_data(
+                crop,
+                lang=self.ocr_language,
+                config=_with_psm(config, 6),
+                output_type=pytesseract.Output.DICT
+            )
+            rows = [row - y0 for row in region['rows']]
+            cols = [col - x0 for col in region['cols']]
+            return table_data_to_markdown(data, rows, cols), None
+        
+        psm = 7 if region['kind'] == 'line' else 6
+        return self._ocr_tiered(crop, _with_psm(config, psm))
+    
+    @staticmethod
+    def _new_ocr_tier_stats() -> dict:
+        """分级OCR的统计：每一级处理的页数，逐区域识别时另计区域数"""
+        return {'light': 0, 'heavy': 0, 'light_regions': 0, 'heavy_regions': 0}
+    
+    def _count_ocr_tier(self, tier: str) -> None:
+        """记录一页使用的OCR级别"""
+        with self._ocr_stats_lock:
+            self.ocr_tier_stats[tier] += 1
+    
+    def _iter_ocr_pages(self, images: Iterable[Union[Image.Image, str]], config: str,
+                        total: Optional[int] = None) -> Iterator[str]:
+        """
+        使用线程池并行识别页面图像，按输入顺序产出文本
+        
+        OCR主要耗时在tesseract子进程中，线程即可并行；同时处理的页数有上限，
+        上游按需渲染或解码页面
+        
+        Args:
+            images: 页面图像迭代器；其中的字符串视为已识别的文本（如增量转换复用的结果），原样产出
+            config: tesseract参数
+            total: 总页数，用于显示进度
+            
+        Returns:
+            页面文本迭代器
+        """
+        def ocr(item: Tuple[int, Union[Image.Image, str]]) -> str:
+            index, image = item
+            if isinstance(image, str):
+                return image
+            return self._ocr_page_image(image, config, index=index)
+        
+        pages = iter_parallel_map(ocr, enumerate(images, 1), workers=OCR_WORKERS, threads=True)
+        for i, text in enumerate(pages, 1):
+            if total and total > 1:
+                print(f'识别进度: {i}/{total}')
+            yield text
+    
     def extract_text_from_images(self, images: Union[List[Image.Image], List[str]]) -> str:
         """从图片中提取文本"""
         extracted_text = []
@@ -262,10 +707,9 @@ class PDFToMarkdown:
         file_ext = Path(file_path).suffix.lower()
         
         # 处理Word文档
-        if file_ext in ['.doc', '.docx']:
+        if file_ext == '.docx' or file_ext in CONVERTIBLE_DOCUMENT_FORMATS:
             try:
-                doc = docx.Document(file_path)
-                content = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+                content = '\n\n'.join(self.iter_document_pages(file_path))
                 language = self.detect_language(content)
                 return content, language
             except Exception as e:
@@ -298,27 +742,99 @@ class PDFToMarkdown:
         )
         
         # 基础清理（所有语言通用）
-        text = re.sub(r'\r\n', '\n', text)  # 统一换行符
-        text = re.sub(r'\n{3,}', '\n\n', text)  # 合并多个空行
+        text = text.replace('\r\n', '\n')  # 统一换行符
         
         # 根据语言特点清理
         if lang_code in ['zh', 'ja']:  # 中文和日文
-            text = re.sub(patterns['space'], r'\1\2', text)  # 保留中日文间的空格
+            # 保留中日文间的空格；三个以上的换行总会被缩为至多两个，与先合并空行的结果相同
+            text = patterns['space'].sub(r'\1\2', text)
         else:  # 其他语言
-            text = re.sub(patterns['space'], ' ', text)  # 合并空格
+            text = patterns['space'].sub(' ', text)  # 合并空格（空行也随之合并）
         
-        # 清理标点符号
-        text = re.sub(patterns['punctuation'], '"', text)
+        return self._clean_characters(text, patterns, clean_level).strip()
+    
+    def clean_text_lines(self, lines: Iterable[str], clean_level: int = 1) -> Iterator[str]:
+        """
+        逐行清理文本，适用于不便整体载入内存的大文本
         
-        if clean_level >= 1:
-            # 清理确定的干扰字符
-            text = re.sub(patterns['noise'], '', text)
+        规则与 clean_text 相同，但空白合并只在行内进行，保留原有的换行；
+        连续空行合并为一个，首尾空行被去除
+        
+        Args:
+            lines: 文本行迭代器（如打开的文件对象）
+            clean_level: 文本清理级别（0-2）
             
+        Returns:
+            清理后的文本行迭代器（不含换行符）
+        """
+        if clean_level == 0:
+            yield from (line.rstrip('\r\n') for line in lines)
+            return
+        
+        lang_code = self.ocr_language[:2]
+        patterns = self.language_patterns.get(
+            lang_code,
+            self.language_patterns['default']
+        )
+        space_replacement = r'\1\2' if lang_code in ['zh', 'ja'] else ' '
+        
+        pending_blank = False
+        started = False
+        for block in iter_line_blocks(lines):
+            # 整块替换，匹配不跨行，结果与逐行替换相同
+            block = patterns['line_space'].sub(space_replacement, block)
+            block = self._clean_characters(block, patterns, clean_level)
+            for line in block.split('\n'):
+                if not line.strip():
+                    pending_blank = started
+                    continue
+                if pending_blank:
+                    yield ''
+                    pending_blank = False
+                started = True
+                yield line
+    
+    def clean_text_keep_lines(self, text: str, clean_level: int = 1) -> str:
+        """
+        整段清理文本并保留行结构（如结构化草稿的一页），结果与
+        '\n'.join(clean_text_lines(text.splitlines(), clean_level)) 相同，但不逐行处理
+        
+        Args:
+            text: 要清理的文本
+            clean_level: 文本清理级别（0-2）
+            
+        Returns:
+            清理后的文本
+        """
+        text = '\n'.join(text.splitlines())  # 统一换行符
+        if clean_level == 0:
+            return text
+        
+        lang_code = self.ocr_language[:2]
+        patterns = self.language_patterns.get(
+            lang_code,
+            self.language_patterns['default']
+        )
+        space_replacement = r'\1\2' if lang_code in ['zh', 'ja'] else ' '
+        
+        text = patterns['line_space'].sub(space_replacement, text)
+        text = self._clean_characters(text, patterns, clean_level)
+        # 连续的空行（含只有空白的行）合并为一个；首尾补换行后一并合并，再去掉首尾空行
+        return BLANK_LINE_RUNS.sub('\n\n', f'\n{text}\n').strip('\n')
+    
+    def _clean_characters(self, text: str, patterns: dict, clean_level: int) -> str:
+        """统一标点并删除干扰字符"""
+        # 清理标点符号
+        text = patterns['punctuation'].sub('"', text)
+        
         if clean_level >= 2:
-            # 强化清理
-            text = re.sub(patterns['level2'], '', text)
+            # 强化清理（其字符集包含全部干扰字符，无需先单独删除干扰字符）
+            text = patterns['level2'].sub('', text)
+        elif clean_level >= 1:
+            # 清理确定的干扰字符
+            text = patterns['noise'].sub('', text)
         
-        return text.strip()
+        return text
     
     def split_text_into_chunks(self, text: str, max_chunk_size: int = 2000, overlap: int = 200) -> List[str]:
         """
@@ -332,13 +848,33 @@ class PDFToMarkdown:
         Returns:
             分割后的文本块列表
         """
-        # 首先按段落分割
-        paragraphs = text.split('\n\n')
-        chunks = []
+        return list(self.iter_text_chunks([text], max_chunk_size, overlap))
+    
+    def iter_text_chunks(self, texts: Iterable[str], max_chunk_size: int = 2000, overlap: int = 200) -> Iterator[str]:
+        """
+        逐段读取文本并产出带重叠的块，规则与 split_text_into_chunks 相同
+        
+        Args:
+            texts: 依次到达的文本片段（如逐页文本），片段之间视为段落分隔
+            max_chunk_size: 每个块的最大字符数
+            overlap: 块之间的重叠字符数，用于保持上下文连贯
+            
+        Returns:
+            文本块迭代器，块一旦凑满即产出，无需等待全部文本
+        """
+        return self.tracer.iter_stage(
+            'chunk', lambda source: self._iter_text_chunks(source, max_chunk_size, overlap), texts
+        )
+    
+    def _iter_text_chunks(self, texts: Iterable[str], max_chunk_size: int, overlap: int) -> Iterator[str]:
+        """iter_text_chunks 的实现"""
         current_chunk = []
         current_size = 0
         last_context = ""  # 用于存储上一个块的结尾内容
         
+        # 首先按段落分割
+        paragraphs = (para for text in texts for para in text.split('\n\n'))
+        
         for para in paragraphs:
             para_size = len(para)
             
@@ -347,7 +883,7 @@ class PDFToMarkdown:
                 # 如果当前块不为空，先保存当前块
                 if current_chunk:
                     chunk_text = '\n\n'.join(current_chunk)
-                    chunks.append(chunk_text)
+                    yield chunk_text
                     last_context = chunk_text[-overlap:] if len(chunk_text) > overlap else chunk_text
                     current_chunk = []
                     current_size = 0
@@ -365,7 +901,7 @@ class PDFToMarkdown:
                         temp_para += sentence
                     else:
                         if temp_para:
-                            chunks.append(temp_para)
+                            yield temp_para
                             last_context = temp_para[-overlap:] if len(temp_para) > overlap else temp_para
                         temp_para = last_context + sentence
             
@@ -376,7 +912,7 @@ class PDFToMarkdown:
                 # 检查添加当前段落是否会超出块大小
                 if current_size + para_size > max_chunk_size:
                     chunk_text = '\n\n'.join(current_chunk)
-                    chunks.append(chunk_text)
+                    yield chunk_text
                     last_context = chunk_text[-overlap:] if len(chunk_text) > overlap else chunk_text
                     current_chunk = [last_context + para]
                     current_size = len(current_chunk[0])
@@ -386,83 +922,13 @@ class PDFToMarkdown:
         
         # 处理最后一个块
         if current_chunk:
-            chunks.append('\n\n'.join(current_chunk))
-        
-        return chunks
+            yield '\n\n'.join(current_chunk)
     
     def convert_to_markdown(self, text: str) -> str:
         """将文本转换为Markdown格式"""
         try:
             chunks = self.split_text_into_chunks(text)
-            markdown_chunks = []
-            previous_context = ""  # 存储前一个块的处理结果
-            
-            for i, chunk in enumerate(chunks):
-                print(f"正在处理文本块 {i+1}/{len(chunks)} ({len(chunk)} 字符)...")
-                
-                # 将前一个块的结果作为上下文
-                context_message = f"请继续保持前文的格式和结构。前文的结尾是:\n\n{previous_context}\n\n" if previous_context else ""
-                
-                payload = {
-                    "model": MODEL_NAME,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "你是一个文本格式转换专家。请将输入的文本转换为结构良好的Markdown格式，保持原文的层级结构和重要信息。注意保持标题层级的连贯性。"
-                        },
-                        {
-                            "role": "user",
-                            "content": f"{context_message}请将以下文本转换为Markdown格式，保持原有的结构和格式：\n\n{chunk}"
-                        }
-                    ],
-                    "temperature": TEMPERATURE,
-                    "max_tokens": MAX_TOKENS,
-                    "top_k": TOP_K,
-                    "top_p": TOP_P,
-                    "frequency_penalty": FREQUENCY_PENALTY,
-                    "stream": False
-                }
-                
-                success = False
-                for retry in range(API_RETRY_COUNT):
-                    try:
-                        print(f"发送请求 (尝试 {retry + 1}/{API_RETRY_COUNT})...")
-                        response = requests.post(
-                            self.api_url,
-                            headers=self.headers,
-                            json=payload,
-                            timeout=(30, API_REQUEST_TIMEOUT)
-                        )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            if 'choices' in result and len(result['choices']) > 0:
-                                markdown_text = result['choices'][0]['message']['content']
-                                markdown_chunks.append(markdown_text)
-                                # 保存当前处理结果的最后部分作为上下文
-                                previous_context = markdown_text[-500:] if len(markdown_text) > 500 else markdown_text
-                                success = True
-                                print("文本块处理成功")
-                                break
-                        else:
-                            error_msg = response.json()
-                            print(f"API错误 (状态码: {response.status_code}): {error_msg}")
-                            if retry == API_RETRY_COUNT - 1:
-                                raise Exception(f"API请求失败: {error_msg}")
-                            time.sleep(API_RETRY_DELAY)
-                            
-                    except Exception as e:
-                        print(f"请求出错 ({retry + 1}/{API_RETRY_COUNT}): {str(e)}")
-                        if retry == API_RETRY_COUNT - 1:
-                            raise
-                        time.sleep(API_RETRY_DELAY)
-                
-                if not success:
-                    print("文本块处理失败，保留原始文本")
-                    markdown_chunks.append(chunk)
-                
-                # 添加请求间隔
-                time.sleep(1/API_RATE_LIMIT)
+            markdown_chunks = list(self.iter_markdown_chunks(chunks, total=len(chunks)))
             
             # 合并所有处理后的块并清理格式
             if markdown_chunks:
@@ -476,6 +942,125 @@ class PDFToMarkdown:
             print(f"调用 API 时发生错误: {str(e)}")
             return text
     
+    def iter_markdown_chunks(self, chunks: Iterable[str], total: Optional[int] = None,
+                             failures: Optional[List[int]] = None) -> Iterator[str]:
+        """
+        逐块调用API将文本转换为Markdown
+        
+        Args:
+            chunks: 文本块迭代器，可以边生成边消费
+            total: 文本块总数，未知时为None（仅用于打印进度）
+            failures: 传入列表时，转换失败（保留原始文本）的块的序号（从0开始）追加到其中
+            
+        Returns:
+            Markdown文本块迭代器，与输入块一一对应
+        """
+        previous_context = ""  # 存储前一个块的处理结果
+        
+        for i, chunk in enumerate(chunks):
+            position = f"{i+1}/{total}" if total else f"{i+1}"
+            print(f"正在处理文本块 {position} ({len(chunk)} 字符)...")
+            
+            with self.tracer.span('markdown_chunk', 'chunk', index=i + 1, chars=len(chunk)):
+                try:
+                    markdown_text = self._request_markdown_chunk(chunk, previous_context)
+                except Exception as e:
+                    print(f"调用 API 时发生错误: {str(e)}")
+                    markdown_text = None
+            
+            if markdown_text is None:
+                print("文本块处理失败，保留原始文本")
+                markdown_text = chunk
+                CHUNKS.inc(result='failed')
+                if failures is not None:
+                    failures.append(i)
+            else:
+                CHUNKS.inc(result='converted')
+                # 保存当前处理结果的最后部分作为上下文
+                previous_context = markdown_text[-500:] if len(markdown_text) > 500 else markdown_text
+            
+            self.progress.advance(
+                'convert', nbytes=len(chunk.encode('utf-8')),
+                tokens=estimate_tokens(chunk) + estimate_tokens(markdown_text)
+            )
+            yield markdown_text
+            
+            # 添加请求间隔
+            time.sleep(1/API_RATE_LIMIT)
+    
+    def _request_markdown_chunk(self, chunk: str, previous_context: str) -> Optional[str]:
+        """
+        请求API转换单个文本块
+        
+        Args:
+            chunk: 文本块
+            previous_context: 前一个块转换结果的结尾，用于保持格式连贯
+            
+        Returns:
+            转换后的Markdown文本，API未返回结果时为None
+        """
+        # 将前一个块的结果作为上下文
+        context_message = f"请继续保持前文的格式和结构。前文的结尾是:\n\n{previous_context}\n\n" if previous_context else ""
+        
+        payload = {
+            "model": MODEL_NAME,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "你是一个文本格式转换专家。请将输入的文本转换为结构良好的Markdown格式，保持原文的层级结构和重要信息。注意保持标题层级的连贯性。"
+                },
+                {
+                    "role": "user",
+                    "content": f"{context_message}请将以下文本转换为Markdown格式，保持原有的结构和格式：\n\n{chunk}"
+                }
+            ],
+            "temperature": TEMPERATURE,
+            "max_tokens": MAX_TOKENS,
+            "top_k": TOP_K,
+            "top_p": TOP_P,
+            "frequency_penalty": FREQUENCY_PENALTY,
+            "stream": False
+        }
+        
+        for retry in range(API_RETRY_COUNT):
+            if retry:
+                API_RETRIES.inc(endpoint='markdown')
+            try:
+                print(f"发送请求 (尝试 {retry + 1}/{API_RETRY_COUNT})...")
+                with self.tracer.span('llm_request', endpoint='markdown', attempt=retry + 1):
+                    response = requests.post(
+                        self.api_url,
+                        headers=self.headers,
+                        json=payload,
+                        timeout=(30, API_REQUEST_TIMEOUT)
+                    )
+                
+                if response.status_code == 200:
+                    result = response.json()
+                    if 'choices' in result and len(result['choices']) > 0:
+                        print("文本块处理成功")
+                        content = result['choices'][0]['message']['content']
+                        record_tokens(
+                            'markdown', result.get('usage'),
+                            payload['messages'][0]['content'] + payload['messages'][1]['content'], content
+                        )
+                        return content
+                else:
+                    error_msg = response.json()
+                    print(f"API错误 (状态码: {response.status_code}): {error_msg}")
+                    if retry == API_RETRY_COUNT - 1:
+                        raise Exception(f"API请求失败: {error_msg}")
+                    time.sleep(API_RETRY_DELAY)
+                    
+            except Exception as e:
+                print(f"请求出错 ({retry + 1}/{API_RETRY_COUNT}): {str(e)}")
+                if retry == API_RETRY_COUNT - 1:
+                    raise
+                time.sleep(API_RETRY_DELAY)
+        
+        return None
+    
+    @traced('translate')
     def translate_to_chinese(self, text: str) -> str:
         """将文本翻译成中文"""
         try:
@@ -501,16 +1086,21 @@ class PDFToMarkdown:
             
             # 添加重试机制
             for retry in range(API_RETRY_COUNT):
+                if retry:
+                    API_RETRIES.inc(endpoint='translate')
                 try:
-                    response = requests.post(
-                        self.api_url, 
-                        headers=self.headers, 
-                        json=payload,
-                        timeout=API_REQUEST_TIMEOUT
-                    )
+                    with self.tracer.span('llm_request', endpoint='translate', attempt=retry + 1):
+                        response = requests.post(
+                            self.api_url, 
+                            headers=self.headers, 
+                            json=payload,
+                            timeout=API_REQUEST_TIMEOUT
+                        )
                     response.raise_for_status()
                     result = response.json()
-                    return result['choices'][0]['message']['content']
+                    content = result['choices'][0]['message']['content']
+                    record_tokens('translate', result.get('usage'), text, content)
+                    return content
                 except requests.exceptions.RequestException as e:
                     if retry == API_RETRY_COUNT - 1:
                         print(f"翻译API请求失败 ({retry + 1}/{API_RETRY_COUNT}): {str(e)}")
@@ -525,138 +1115,590 @@ class PDFToMarkdown:
             print(f"翻译时发生错误: {str(e)}")
             return text
     
-    def report_progress(self, progress: float):
-        """报告处理进度"""
+    def translate_file(self, input_path: str, output_path: str) -> None:
+        """
+        按段落分块翻译Markdown文件，边翻译边写入，不把整个文件读入内存
+        
+        Args:
+            input_path: Markdown文件路径
+            output_path: 翻译结果的保存路径
+        """
+        self.progress.start_stage('translate')
+        with open(input_path, 'r', encoding='utf-8') as source, \
+                open(output_path, 'w', encoding='utf-8') as target:
+            for index, block in enumerate(iter_paragraph_blocks(source, MAX_CHUNK_SIZE)):
+                translated = self.translate_to_chinese(block)
+                if index:
+                    target.write('\n\n')
+                target.write(translated.strip('\n'))
+                self.progress.advance(
+                    'translate', nbytes=len(block.encode('utf-8')),
+                    tokens=estimate_tokens(block) + estimate_tokens(translated)
+                )
+            target.write('\n')
+        self.progress.finish_stage('translate')
+    
+    def _on_progress_event(self, event: dict):
+        """把进度事件转发给回调（已按最大频率合并）"""
         if self.progress_callback:
-            self.progress_callback(progress)
-            
-    def process_file(self, file_path: str, output_path: str, clean_level: int = 1) -> dict:
+            self.progress_callback(event['progress'])
+        if self.progress_event_callback:
+            self.progress_event_callback(event)
+            
+    @traced('process_file', 'job', span_args=lambda file_path, *args, **kwargs: {'file': os.path.basename(file_path)})
+    def process_file(self, file_path: str, output_path: str, clean_level: int = 1,
+                     document_key: Optional[str] = None, page_range: Optional[str] = None,
+                     content_hash: Optional[str] = None) -> dict:
         """
         处理文件并转换为Markdown格式
         
+        以流水线方式执行：提取页面 -> 清理 -> 分块 -> 转换 -> 合并 -> 写入。
+        页面提取（含OCR）在后台线程中进行，与文本块的API转换重叠执行；
+        原始文本和Markdown结果边处理边追加写入文件，内存中只保留少量页面和文本块。
+        
+        启用增量转换并提供文档标识时，按文档标识保存页面指纹清单；同一文档的新版本只重新处理
+        变化的页面，未变化页面的识别结果和Markdown直接复用并按页序拼接。增量转换逐页分块，
+        未提供文档标识时按正常方式跨页分块。
+        
+        启用结果缓存时，内容和处理参数都相同的文件直接写出缓存的结果。
+        
         Args:
             file_path: 输入文件路径
             output_path: 输出文件路径
             clean_level: 文本清理级别（0-2）
+            document_key: 文档标识，同一文档的各个版本应使用相同的标识；为None时不使用增量转换
+            page_range: 页码范围（从1开始，如 "1-50"、"3,5-9"），仅支持PDF；为None时处理全部页面
+            content_hash: 文件内容的SHA-256（如上传时已计算），为None时读取文件计算
             
         Returns:
-            包含处理结果的字典
+            包含处理结果的字典：output 为Markdown文件路径，translated 为翻译文件路径（如有），
+            language、raw_pages 等为元数据；结果内容只写入文件，不读回内存
         """
         try:
-            # 获取文件扩展名
-            file_ext = os.path.splitext(file_path)[1].lower()
-            
             # 检查文件是否存在
             if not check_file_exists(file_path):
                 raise FileNotFoundError(f"文件不存在: {file_path}")
             
-            # 更新进度：开始处理
-            self.report_progress(0)
             print(f"开始处理文件: {file_path}")
             
-            # 根据文件类型选择处理方法
-            if file_ext == '.pdf':
-                raw_text = self.process_pdf(file_path)
-            elif file_ext in SUPPORTED_FORMATS['image']:
-                raw_text = self.process_image(file_path)
-            elif file_ext in SUPPORTED_FORMATS['document']:
-                raw_text = self.process_document(file_path)
-            elif file_ext in SUPPORTED_FORMATS['presentation']:
-                raw_text = self.process_presentation(file_path)
-            elif file_ext in SUPPORTED_FORMATS['spreadsheet']:
-                raw_text = self.process_spreadsheet(file_path)
-            elif file_ext in SUPPORTED_FORMATS['ebook']:
-                raw_text = self.process_ebook(file_path)
-            else:
-                raise ValueError(f"不支持的文件格式: {file_ext}")
+            # 检查结果缓存
+            cache_key = None
+            if self.result_cache is not None:
+                cache_key = result_cache_key(
+                    content_hash or hash_file(file_path), clean_level,
+                    self.ocr_language, self.need_translation, page_range
+                )
+                cached_result = self.result_cache.restore(cache_key, output_path)
+                if cached_result is not None:
+                    print(f"命中结果缓存，已写出Markdown文件: {output_path}")
+                    self.progress.begin([])
+                    self.progress.finish()
+                    return cached_result
             
-            # 保存原始文本
             raw_path = output_path.replace('.md', '_raw.txt')
-            with open(raw_path, 'w', encoding='utf-8') as f:
-                f.write(raw_text)
-            print(f"保存清理前的原始文本到: {raw_path}")
-            
-            # 检测语言
-            detected_language = self.detect_language(raw_text)
-            display_language = LANGUAGE_DISPLAY_NAMES.get(detected_language, detected_language)
-            print(f"使用{display_language}语言规则清理文本...")
+            self.ocr_tier_stats = self._new_ocr_tier_stats()
+            layout_mode = self._get_layout_mode(file_path)
+            page_numbers = self._select_pages(file_path, page_range)
+            
+            manifest = None
+            if document_key:
+                # 不同页码范围的结果分别记录，避免互相覆盖
+                if page_range:
+                    document_key += f'#pages={page_range}'
+                manifest = self._open_manifest(document_key, layout_mode, clean_level)
+            
+            # 进度阶段：提取（含OCR）、API转换、翻译
+            stages = ['extract'] + (['convert'] if layout_mode != 'direct' else [])
+            if self.need_translation:
+                stages.append('translate')
+            self.progress.begin(stages, {'extract': self._count_source_pages(file_path, page_numbers)})
+            self.progress.start_stage('extract')
+            
+            # 每页的提取（含渲染和OCR）各生成一个span
+            pages = iter_in_background(
+                self.tracer.iter_spans(
+                    'page', self.iter_file_pages(file_path, layout_mode, manifest, page_numbers), 'page'
+                ),
+                PIPELINE_QUEUE_SIZE
+            )
             
-            # 清理文本
-            cleaned_text = self.clean_text(raw_text, clean_level)
+            with open(raw_path, 'w', encoding='utf-8') as raw_file, \
+                    open(output_path, 'w', encoding='utf-8') as md_file:
+                raw_page_offsets = []
+                pages = self._write_raw_pages(pages, raw_file, raw_page_offsets)
+                
+                # 根据第一页检测语言，其余页面无需等待
+                first_page = next(pages, '')
+                detected_language = self.detect_language(first_page)
+                display_language = LANGUAGE_DISPLAY_NAMES.get(detected_language, detected_language)
+                print(f"使用{display_language}语言规则清理文本...")
+                
+                pages = itertools.chain([first_page], pages)
+                
+                # 剥离跨页重复的页眉、页脚和页码，减少发送给API的内容
+                stripper = None
+                if BOILERPLATE_CONFIG['ENABLED'] and self._is_paged_format(file_path):
+                    stripper = BoilerplateStripper(
+                        edge_lines=BOILERPLATE_CONFIG['EDGE_LINES'],
+                        min_ratio=BOILERPLATE_CONFIG['MIN_RATIO'],
+                        window=BOILERPLATE_CONFIG['WINDOW']
+                    )
+                    pages = stripper.strip(pages)
+                
+                if layout_mode == 'direct':
+                    # 结构化提取的结果已是Markdown，原样写入
+                    print("使用结构化提取结果，跳过API转换...")
+                    self._write_direct_pages(pages, md_file)
+                else:
+                    # 清理、分块并转换为Markdown
+                    if layout_mode == 'draft':
+                        # 保留草稿中的标题、列表和表格结构
+                        clean_pages = lambda source: (
+                            self.clean_text_keep_lines(page_text, clean_level) for page_text in source
+                        )
+                    else:
+                        clean_pages = lambda source: (
+                            self.clean_text(page_text, clean_level) for page_text in source
+                        )
+                    cleaned_pages = self.tracer.iter_stage('clean', clean_pages, pages)
+                    if manifest is not None:
+                        markdown_chunks = self._iter_incremental_markdown(cleaned_pages, manifest)
+                    else:
+                        chunks = self.iter_text_chunks(cleaned_pages)
+                        markdown_chunks = self.iter_markdown_chunks(chunks)
+                    
+                    self._write_markdown_chunks(markdown_chunks, md_file)
+                    self.progress.finish_stage('convert')
             
-            # 转换为Markdown
-            markdown_text = self.convert_to_markdown(cleaned_text)
+            if manifest is not None:
+                manifest.save()
             
-            # 保存Markdown结果
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_text)
+            print(f"保存清理前的原始文本到: {raw_path}")
             print(f"保存Markdown文件到: {output_path}")
             
             result = {
-                'original': markdown_text,
-                'language': display_language
+                'output': output_path,
+                'language': display_language,
+                'raw_pages': raw_page_offsets
             }
             
+            if stripper:
+                stats = stripper.stats
+                print(f"已剥离重复页眉页脚: {stats['lines']} 行，{stats['chars']} 字符，约 {stats['tokens']} tokens")
+                result['boilerplate'] = dict(stats)
+            
+            if any(self.ocr_tier_stats.values()):
+                tiers = self.ocr_tier_stats
+                print(f"OCR分级: 快速识别 {tiers['light']} 页，完整预处理 {tiers['heavy']} 页")
+                if tiers['light_regions'] or tiers['heavy_regions']:
+                    print(f"区域识别: 快速识别 {tiers['light_regions']} 个，完整预处理 {tiers['heavy_regions']} 个")
+                result['ocr_tiers'] = dict(tiers)
+            
+            if manifest is not None:
+                stats = manifest.stats
+                print(f"增量转换: 复用 {stats['pages_reused']} 页识别结果、{stats['segments_reused']} 页Markdown，"
+                      f"重新转换 {stats['segments_converted']} 页")
+                result['incremental'] = dict(stats)
+            
             # 如果需要翻译
             if self.need_translation and not detected_language.startswith(('zh_cn', 'zh_tw')):
                 print("正在翻译文本...")
-                translated_text = self.translate_to_chinese(markdown_text)
                 translated_path = output_path.replace('.md', '_zh.md')
-                with open(translated_path, 'w', encoding='utf-8') as f:
-                    f.write(translated_text)
+                self.translate_file(output_path, translated_path)
                 print(f"保存翻译后的文件到: {translated_path}")
-                result['translated'] = translated_text
+                result['translated'] = translated_path
+            
+            if cache_key is not None:
+                self.result_cache.store(cache_key, output_path, result)
             
-            # 更新进度：完成
-            self.report_progress(100)
+            self.progress.finish()
             
             return result
             
         except Exception as e:
             print(f"处理文件时发生错误: {str(e)}")
             raise
+    
+    def iter_file_pages(self, file_path: str, layout_mode: str = 'off',
+                        manifest: Optional[ConversionManifest] = None,
+                        page_numbers: Optional[Sequence[int]] = None) -> Iterator[str]:
+        """
+        根据文件类型逐页提取原始文本
+        
+        Args:
+            file_path: 输入文件路径
+            layout_mode: _get_layout_mode 的结果，决定PDF是否按版面生成Markdown
+            manifest: 增量转换清单，扫描版PDF据此跳过未变化页面的OCR
+            page_numbers: PDF只处理这些页（从0开始），为None时处理全部页面
             
-    def process_presentation(self, file_path: str) -> dict:
-        """处理演示文稿文件"""
-        if file_path.endswith(('.ppt', '.pptx')):
-            from pptx import Presentation
-            prs = Presentation(file_path)
-            text_content = []
-            
-            for i, slide in enumerate(prs.slides):
-                text_content.append(f"\n## 幻灯片 {i+1}\n")
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text_content.append(shape.text)
-                        
-            return self.process_text('\n'.join(text_content))
-            
-    def process_spreadsheet(self, file_path: str) -> dict:
-        """处理电子表格文件"""
-        if file_path.endswith(('.xls', '.xlsx')):
-            import pandas as pd
-            df = pd.read_excel(file_path)
-            return self.process_text(df.to_markdown())
-        elif file_path.endswith('.csv'):
-            import pandas as pd
-            df = pd.read_csv(file_path)
-            return self.process_text(df.to_markdown())
-            
-    def process_ebook(self, file_path: str) -> dict:
-        """处理电子书文件"""
-        if file_path.endswith('.epub'):
-            import ebooklib
-            from ebooklib import epub
-            from bs4 import BeautifulSoup
-            
-            book = epub.read_epub(file_path)
-            chapters = []
-            for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    soup = BeautifulSoup(item.get_content(), 'html.parser')
-                    chapters.append(soup.get_text())
-                    
-            return self.process_text('\n\n'.join(chapters))
+        Returns:
+            页面文本迭代器；非分页格式整体作为一页产出，多帧图片每帧一页，电子表格每个工作表一页，
+            电子书每章一页，演示文稿每张幻灯片一页
+        """
+        # 获取文件扩展名
+        file_ext = os.path.splitext(file_path)[1].lower()
+        
+        # 根据文件类型选择处理方法
+        if file_ext == '.pdf':
+            if layout_mode == 'off':
+                yield from self.iter_pdf_pages(file_path, manifest, page_numbers)
+            else:
+                yield from self.iter_layout_pages(file_path, page_numbers)
+        elif file_ext in SUPPORTED_FORMATS['image']:
+            yield from self.iter_image_pages(file_path)
+        elif file_ext in SUPPORTED_FORMATS['document']:
+            yield from self.iter_document_pages(file_path)
+        elif file_ext in SUPPORTED_FORMATS['presentation']:
+            yield from self.iter_presentation_pages(file_path)
+        elif file_ext in SUPPORTED_FORMATS['spreadsheet']:
+            yield from self.iter_spreadsheet_pages(file_path)
+        elif file_ext in SUPPORTED_FORMATS['ebook']:
+            yield from self.iter_ebook_pages(file_path)
+        else:
+            raise ValueError(f"不支持的文件格式: {file_ext}")
+    
+    def _count_source_pages(self, file_path: str, page_numbers: Optional[Sequence[int]]) -> Optional[int]:
+        """要提取的页数（PDF页数、图片帧数，纯文本整体一页），用于计算进度；其他格式返回None"""
+        if page_numbers is not None:
+            return len(page_numbers)
+        file_ext = Path(file_path).suffix.lower()
+        if file_ext in SUPPORTED_FORMATS['document'] and file_ext != '.docx' \
+                and file_ext not in CONVERTIBLE_DOCUMENT_FORMATS:
+            return 1
+        try:
+            if file_ext == '.pdf':
+                with fitz.open(file_path) as doc:
+                    return doc.page_count
+            if file_ext in SUPPORTED_FORMATS['image']:
+                with Image.open(file_path) as image:
+                    return getattr(image, 'n_frames', 1)
+        except Exception:
+            pass
+        return None
+    
+    def _select_pages(self, file_path: str, page_range: Optional[str]) -> Optional[List[int]]:
+        """解析页码范围，返回要处理的页码（从0开始）；未指定范围时返回None"""
+        if not page_range:
+            return None
+        if Path(file_path).suffix.lower() != '.pdf':
+            raise ValueError("页码范围仅支持PDF文件")
+        with fitz.open(file_path) as doc:
+            page_numbers = parse_page_range(page_range, doc.page_count)
+        print(f"只处理第 {page_range} 页，共 {len(page_numbers)} 页")
+        return page_numbers
+    
+    def process_file_sharded(self, file_path: str, output_path: str, clean_level: int = 1,
+                             page_range: Optional[str] = None, pages_per_shard: Optional[int] = None,
+                             workers: Optional[int] = None, queue_dir: Optional[str] = None,
+                             document_key: Optional[str] = None) -> dict:
+        """
+        把大型PDF拆分为多个页码范围并行转换，再按顺序合并
+        
+        分片任务放入目录形式的队列，由本机的工作进程处理；其他机器只要能访问
+        队列目录，运行 `python pdf_to_markdown.py --shard-worker <队列目录>` 即可加入。
+        合并时按前一分片调整标题层级并去除跨分片重复的标题；合并完成后删除本次的队列目录
+        
+        Args:
+            file_path: PDF文件路径
+            output_path: 输出文件路径
+            clean_level: 文本清理级别（0-2）
+            page_range: 只处理这些页（从1开始），为None时处理全部页面
+            pages_per_shard: 每个分片的页数，默认取 SHARD_CONFIG
+            workers: 本机工作进程数，0 表示使用CPU核数，默认取 SHARD_CONFIG
+            queue_dir: 任务队列的上级目录，多台机器协作时应位于共享存储上；默认在输出文件旁边；
+                每次运行在其中新建独立的队列目录
+            document_key: 文档标识，用于增量转换；为None时不使用增量转换
+            
+        Returns:
+            包含处理结果的字典，格式与 process_file 相同
+        """
+        if Path(file_path).suffix.lower() != '.pdf':
+            raise ValueError("分片处理仅支持PDF文件")
+        
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+        page_numbers = parse_page_range(page_range, page_count) if page_range else list(range(page_count))
+        shards = split_shards(page_numbers, pages_per_shard or SHARD_CONFIG['PAGES_PER_SHARD'])
+        
+        queue_root = queue_dir or output_path.replace('.md', '_shards')
+        queue_dir, tasks = create_shard_queue(queue_root, file_path, shards, {
+            'clean_level': clean_level,
+            'ocr_language': self.ocr_language,
+            'document_key': document_key
+        })
+        
+        if workers is None:
+            workers = SHARD_CONFIG['WORKERS']
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        print(f"共 {len(page_numbers)} 页，拆分为 {len(tasks)} 个分片，启动 {workers} 个工作进程...")
+        print(f"其他机器可运行 python pdf_to_markdown.py --shard-worker {os.path.abspath(queue_dir)} 加入处理")
+        
+        processes = start_local_workers(queue_dir, workers)
+        try:
+            for process in processes:
+                process.wait()
+            wait_for_shards(queue_dir, len(tasks), SHARD_CONFIG['POLL_INTERVAL'], SHARD_CONFIG['TASK_TIMEOUT'])
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+        
+        # 分片失败时保留队列目录，便于查看 failed/ 中的错误信息
+        merge_shard_outputs(queue_dir, tasks, output_path)
+        remove_shard_queue(queue_dir)
+        print(f"已合并 {len(tasks)} 个分片，保存Markdown文件到: {output_path}")
+        
+        with open(output_path, 'r', encoding='utf-8') as f:
+            detected_language = self.detect_language(f.read(5000))
+        result = {
+            'output': output_path,
+            'shards': len(tasks),
+            'language': LANGUAGE_DISPLAY_NAMES.get(detected_language, detected_language)
+        }
+        if self.need_translation and not detected_language.startswith(('zh_cn', 'zh_tw')):
+            print("正在翻译文本...")
+            translated_path = output_path.replace('.md', '_zh.md')
+            self.translate_file(output_path, translated_path)
+            print(f"保存翻译后的文件到: {translated_path}")
+            result['translated'] = translated_path
+        return result
+    
+    def _open_manifest(self, document_key: str, layout_mode: str,
+                       clean_level: int) -> Optional[ConversionManifest]:
+        """打开文档的增量转换清单，未启用增量转换时返回None"""
+        if not INCREMENTAL_CONFIG['ENABLED']:
+            return None
+        # 清理长期未使用的清单
+        sweep_directory(
+            INCREMENTAL_CONFIG['MANIFEST_DIR'], INCREMENTAL_CONFIG['MAX_AGE_DAYS'] * 86400,
+            INCREMENTAL_CONFIG['MAX_SIZE_MB'] * 1024 * 1024, '*.json'
+        )
+        settings = {
+            'ocr_language': self.ocr_language,
+            'layout_mode': layout_mode,
+            'clean_level': clean_level,
+            'model': MODEL_NAME
+        }
+        manifest_name = ConversionManifest.digest(document_key) + '.json'
+        return ConversionManifest(os.path.join(INCREMENTAL_CONFIG['MANIFEST_DIR'], manifest_name), settings)
+    
+    def _iter_incremental_markdown(self, cleaned_pages: Iterable[str],
+                                   manifest: ConversionManifest) -> Iterator[str]:
+        """
+        逐页转换Markdown，页面文本与上次相同时直接复用上次的结果
+        
+        每页单独分块，使每个文本块只来自一页，页面变化不会影响其他页面的转换结果
+        
+        Args:
+            cleaned_pages: 清理后的页面文本
+            manifest: 增量转换清单
+            
+        Returns:
+            每页一段Markdown文本的迭代器
+        """
+        for page_text in cleaned_pages:
+            if not page_text.strip():
+                continue
+            
+            markdown = manifest.get_segment(page_text)
+            record_cache('llm', markdown is not None)
+            if markdown is not None:
+                print("页面内容未变化，复用上次的Markdown...")
+                yield markdown
+                continue
+            
+            failures = []
+            markdown = '\n\n'.join(self.iter_markdown_chunks(self.iter_text_chunks([page_text]), failures=failures))
+            
+            # API调用失败时保留的是原始文本，不写入清单，下次重新转换
+            if not failures:
+                manifest.put_segment(page_text, markdown)
+            yield markdown
+    
+    def _is_paged_format(self, file_path: str) -> bool:
+        """判断文件是否按版面分页（页眉页脚只存在于这类文件中）"""
+        file_ext = os.path.splitext(file_path)[1].lower()
+        return file_ext == '.pdf' or file_ext in SUPPORTED_FORMATS['image']
+    
+    def _write_raw_pages(self, pages: Iterable[str], raw_file, page_offsets: List[int]) -> Iterator[str]:
+        """边产出页面边把原始文本追加写入文件，页面之间以空行分隔，并记录各页的起始字节偏移"""
+        for i, page_text in enumerate(pages):
+            if i:
+                raw_file.write('\n\n')
+            page_offsets.append(raw_file.tell())
+            raw_file.write(page_text)
+            raw_file.flush()
+            PAGES.inc()
+            self.progress.advance('extract', nbytes=raw_file.tell() - page_offsets[-1])
+            yield page_text
+        self.progress.finish_stage('extract')
+    
+    def _write_direct_pages(self, pages: Iterable[str], md_file) -> None:
+        """
+        原样写入结构化提取的Markdown，各段之间空一行
+        
+        不经过 MarkdownChunkMerger：其格式清理和重复标题删除是为有重叠的API文本块设计的，
+        会删去各章节中同名的标题、压平嵌套列表并改写代码块中的内容
+        """
+        written = False
+        for page_text in pages:
+            page_text = page_text.strip('\n')
+            if not page_text.strip():
+                continue
+            if written:
+                md_file.write('\n\n')
+            md_file.write(page_text)
+            md_file.flush()
+            written = True
+    
+    def _write_markdown_chunks(self, markdown_chunks: Iterable[str], md_file) -> None:
+        """增量合并Markdown文本块并追加写入文件"""
+        merger = MarkdownChunkMerger()
+        written = False
+        
+        for markdown_text in markdown_chunks:
+            chunk = merger.add(markdown_text)
+            if not chunk:
+                continue
+            if written:
+                md_file.write('\n')
+            md_file.write(chunk)
+            md_file.flush()
+            written = True
+    
+    def iter_document_pages(self, file_path: str) -> Iterator[str]:
+        """
+        逐段生成文档内容
+        
+        DOCX流式解析 word/document.xml，标题、编号列表和表格直接映射为Markdown；
+        .doc/.rtf/.odt 先用LibreOffice转换为DOCX再解析；纯文本整体作为一页
+        
+        Args:
+            file_path: 文档路径
+            
+        Returns:
+            文本片段迭代器
+        """
+        file_ext = Path(file_path).suffix.lower()
+        if file_ext == '.docx':
+            yield from iter_docx_markdown(file_path, batch_chars=DOCUMENT_CONFIG['BATCH_CHARS'])
+        elif file_ext in CONVERTIBLE_DOCUMENT_FORMATS:
+            print(f"使用LibreOffice将{file_ext}文档转换为DOCX...")
+            with tempfile.TemporaryDirectory() as temp_dir:
+                docx_path = convert_with_libreoffice(
+                    file_path, temp_dir, 'docx',
+                    soffice_path=DOCUMENT_CONFIG['SOFFICE_PATH'],
+                    timeout=DOCUMENT_CONFIG['CONVERT_TIMEOUT']
+                )
+                yield from iter_docx_markdown(docx_path, batch_chars=DOCUMENT_CONFIG['BATCH_CHARS'])
+        else:
+            content, _ = self.read_text_file(file_path)
+            yield content
+    
+    def process_presentation(self, file_path: str) -> str:
+        """处理演示文稿文件，每张幻灯片直接渲染为一个Markdown小节"""
+        return '\n\n'.join(self.iter_presentation_pages(file_path))
+    
+    def iter_presentation_pages(self, file_path: str) -> Iterator[str]:
+        """
+        逐张幻灯片生成Markdown
+        
+        展开组合形状，表格渲染为Markdown表格，附带演讲者备注，不调用API；
+        只有图片的幻灯片可交给线程池并行OCR识别。.ppt 先用LibreOffice转换为PPTX
+        
+        Args:
+            file_path: 演示文稿路径
+            
+        Returns:
+            每张幻灯片一段Markdown文本的迭代器
+        """
+        if Path(file_path).suffix.lower() == '.ppt':
+            print("使用LibreOffice将.ppt文档转换为PPTX...")
+            with tempfile.TemporaryDirectory() as temp_dir:
+                pptx_path = convert_with_libreoffice(
+                    file_path, temp_dir, 'pptx',
+                    soffice_path=DOCUMENT_CONFIG['SOFFICE_PATH'],
+                    timeout=DOCUMENT_CONFIG['CONVERT_TIMEOUT']
+                )
+                yield from self.iter_presentation_pages(pptx_path)
+            return
+        
+        print("逐张幻灯片直接转换为Markdown...")
+        slides = iter_pptx_slides(file_path)
+        if not PRESENTATION_CONFIG['OCR_IMAGE_SLIDES']:
+            yield from (markdown for markdown, _ in slides)
+            return
+        
+        # OCR主要耗时在tesseract子进程中，使用线程池即可并行
+        yield from iter_parallel_map(
+            self._ocr_slide_images, slides,
+            workers=PRESENTATION_CONFIG['OCR_WORKERS'], threads=True
+        )
+    
+    def _ocr_slide_images(self, slide: Tuple[str, List[bytes]]) -> str:
+        """识别只有图片的幻灯片中的文字，附加在该幻灯片的Markdown之后"""
+        markdown, images = slide
+        texts = [markdown]
+        for blob in images:
+            try:
+                text = self._ocr_page_image(
+                    Image.open(io.BytesIO(blob)), OCR_CONFIG.get(self.ocr_language, '')
+                )
+            except Exception as e:
+                print(f"识别幻灯片图片时出错: {str(e)}")
+                continue
+            text = '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+            if text:
+                texts.append(text)
+        return '\n\n'.join(texts)
+            
+    def process_spreadsheet(self, file_path: str) -> str:
+        """处理电子表格文件，所有工作表直接渲染为Markdown表格"""
+        return '\n\n'.join(self.iter_spreadsheet_pages(file_path))
+    
+    def iter_spreadsheet_pages(self, file_path: str) -> Iterator[str]:
+        """
+        逐个工作表生成Markdown表格
+        
+        流式读取行，限制输出大小，多个工作表并行渲染，不调用API
+        
+        Args:
+            file_path: 电子表格路径（.xlsx/.xls/.csv）
+            
+        Returns:
+            每个工作表一段Markdown文本的迭代器
+        """
+        print("直接渲染电子表格为Markdown表格...")
+        yield from iter_spreadsheet_markdown(
+            file_path,
+            workers=SPREADSHEET_CONFIG['WORKERS'],
+            batch_rows=SPREADSHEET_CONFIG['BATCH_ROWS'],
+            max_rows=SPREADSHEET_CONFIG['MAX_ROWS_PER_SHEET'],
+            max_sheet_chars=SPREADSHEET_CONFIG['MAX_SHEET_CHARS'],
+            max_total_chars=SPREADSHEET_CONFIG['MAX_TOTAL_CHARS']
+        )
+            
+    def process_ebook(self, file_path: str) -> str:
+        """处理电子书文件，各章节按阅读顺序直接转换为Markdown"""
+        return '\n\n'.join(self.iter_ebook_pages(file_path))
+    
+    def iter_ebook_pages(self, file_path: str) -> Iterator[str]:
+        """
+        按书脊（spine）顺序逐章生成Markdown
+        
+        章节在子进程中按需从压缩包读取并转换，保留标题、列表和表格结构，不调用API
+        
+        Args:
+            file_path: 电子书路径
+            
+        Returns:
+            每章一段Markdown文本的迭代器
+        """
+        if not file_path.lower().endswith('.epub'):
+            raise ValueError(f"暂不支持该电子书格式: {Path(file_path).suffix}，请先转换为EPUB")
+        
+        print("按章节直接转换电子书为Markdown...")
+        yield from iter_epub_markdown(file_path, workers=EBOOK_CONFIG['WORKERS'])
 
     def process_pdf(self, pdf_path: str) -> str:
         """
@@ -669,25 +1711,84 @@ class PDFToMarkdown:
             提取的文本内容
         """
         try:
-            if not check_file_exists(pdf_path):
-                raise FileNotFoundError(f"PDF文件不存在: {pdf_path}")
-            
-            # 检查是否为扫描版PDF
-            if self._is_scanned_pdf(pdf_path):
-                print("检测到扫描版PDF，使用OCR处理...")
-                # 将PDF转换为图片
-                images = self.convert_pdf_to_images(pdf_path)
-                
-                # 处理每一页
-                text_parts = []
-                total_pages = len(images)
-                
-                for i, image in enumerate(images, 1):
+            return '\n\n'.join(self.iter_pdf_pages(pdf_path))
+            
+        except Exception as e:
+            print(f"处理PDF文件时发生错误: {str(e)}")
+            raise
+
+    def iter_pdf_pages(self, pdf_path: str, manifest: Optional[ConversionManifest] = None,
+                       page_numbers: Optional[Sequence[int]] = None) -> Iterator[str]:
+        """
+        逐页提取PDF文本
+        
+        Args:
+            pdf_path: PDF文件路径
+            manifest: 增量转换清单，用于跳过未变化页面的OCR
+            page_numbers: 只处理这些页（从0开始），为None时处理全部页面
+            
+        Returns:
+            页面文本迭代器
+        """
+        if not check_file_exists(pdf_path):
+            raise FileNotFoundError(f"PDF文件不存在: {pdf_path}")
+        
+        # 检查是否为扫描版PDF
+        if self._is_scanned_pdf(pdf_path):
+            print("检测到扫描版PDF，使用OCR处理...")
+            yield from self._iter_scanned_pages(pdf_path, manifest, page_numbers)
+        else:
+            print("检测到可直接提取文本的PDF...")
+            # 直接提取文本，但只提取附件部分
+            yield from self._iter_attachment_pages(pdf_path, page_numbers)
+
+    def _iter_scanned_pages(self, pdf_path: str, manifest: Optional[ConversionManifest] = None,
+                            page_numbers: Optional[Sequence[int]] = None) -> Iterator[str]:
+        """
+        逐页渲染扫描版PDF并进行OCR识别
+        
+        Args:
+            pdf_path: PDF文件路径
+            manifest: 增量转换清单；指纹未变化的页面直接复用上次的识别结果
+            page_numbers: 只处理这些页（从0开始），为None时处理全部页面
+            
+        Returns:
+            页面文本迭代器
+        """
+        with fitz.open(pdf_path) as doc:
+            total_pages = doc.page_count
+        if page_numbers is None:
+            page_numbers = range(total_pages)
+        
+        # 与送入OCR的页面一一对应的指纹，识别完成后写入清单
+        fingerprints = deque()
+        
+        def attachment_images() -> Iterator[Union[Image.Image, str]]:
+            doc = fitz.open(pdf_path) if manifest is not None else None
+            try:
+                for page_num in page_numbers:
+                    i = page_num + 1
                     print(f"正在处理第 {i}/{total_pages} 页...")
                     
+                    fingerprint = None
+                    if doc is not None:
+                        fingerprint = self._page_fingerprint(doc[i - 1])
+                        cached = manifest.get_page(fingerprint)
+                        record_cache('ocr', cached is not None)
+                        if cached is not None:
+                            print(f"第 {i} 页未变化，复用上次的识别结果")
+                            if cached:
+                                fingerprints.append(None)
+                                yield cached
+                            continue
+                    
+                    image = self.convert_pdf_page_to_image(pdf_path, i)
+                    
                     # 检测是否为红头文件正文部分
                     if self._is_red_header_page(image) and i == 1:
                         print("检测到红头文件正文，跳过处理...")
+                        if fingerprint:
+                            manifest.put_page(fingerprint, '')
                         continue
                     
                     # 检测是否为附件部分
@@ -695,31 +1796,35 @@ class PDFToMarkdown:
                     
                     if is_attachment:
                         print(f"处理附件内容: 第 {i} 页")
-                        # 图像预处理
-                        image = self.preprocess_image(image)
-                        # OCR识别
-                        page_text = pytesseract.image_to_string(
-                            image,
-                            lang=self.ocr_language,
-                            config=OCR_CONFIG.get(self.ocr_language, '')
-                        )
-                        text_parts.append(page_text)
+                        fingerprints.append(fingerprint)
+                        yield image
                     else:
                         print(f"跳过非附件内容: 第 {i} 页")
-                    
-                    # 更新进度
-                    self.report_progress(i * 100 / total_pages)
-                
-                return '\n\n'.join(text_parts)
-            
-            else:
-                print("检测到可直接提取文本的PDF...")
-                # 直接提取文本，但只提取附件部分
-                return self._extract_attachment_text(pdf_path)
-            
-        except Exception as e:
-            print(f"处理PDF文件时发生错误: {str(e)}")
-            raise
+                        if fingerprint:
+                            manifest.put_page(fingerprint, '')
+            finally:
+                if doc is not None:
+                    doc.close()
+        
+        # 页面边渲染边交给OCR线程池识别
+        for text in self._iter_ocr_pages(attachment_images(), OCR_CONFIG.get(self.ocr_language, '')):
+            fingerprint = fingerprints.popleft()
+            if fingerprint:
+                manifest.put_page(fingerprint, text)
+            yield text
+    
+    def _page_fingerprint(self, page) -> str:
+        """
+        计算页面指纹：有文本层时取文本的哈希，否则取低分辨率灰度缩略图的哈希
+        
+        Args:
+            page: PyMuPDF页面对象
+        """
+        text = page.get_text('text').strip()
+        if text:
+            return 'text:' + ConversionManifest.digest(text)
+        pixmap = page.get_pixmap(dpi=INCREMENTAL_CONFIG['THUMBNAIL_DPI'], colorspace=fitz.csGRAY)
+        return 'image:' + ConversionManifest.digest(pixmap.samples)
 
     def _is_red_header_page(self, image: Image.Image) -> bool:
         """
@@ -801,12 +1906,26 @@ class PDFToMarkdown:
         Returns:
             附件部分的文本
         """
+        return "\n\n".join(self._iter_attachment_pages(pdf_path))
+
+    def _iter_attachment_pages(self, pdf_path: str, page_numbers: Optional[Sequence[int]] = None) -> Iterator[str]:
+        """
+        逐页提取PDF附件部分的文本
+        
+        Args:
+            pdf_path: PDF文件路径
+            page_numbers: 只处理这些页（从0开始），为None时处理全部页面
+            
+        Returns:
+            附件部分的页面文本迭代器
+        """
         doc = fitz.open(pdf_path)
-        text_parts = []
         in_attachment = False
+        if page_numbers is None:
+            page_numbers = range(doc.page_count)
         
-        for page_num, page in enumerate(doc):
-            text = page.get_text()
+        for page_num in page_numbers:
+            text = doc[page_num].get_text()
             
             # 检查是否为第一页
             if page_num == 0:
@@ -824,9 +1943,7 @@ class PDFToMarkdown:
                         text = text[attachment_start:]
             
             if in_attachment or page_num > 0:
-                text_parts.append(text)
-        
-        return "\n\n".join(text_parts)
+                yield text
 
     def _is_red_header_text(self, text: str) -> bool:
         """
@@ -872,20 +1989,14 @@ class PDFToMarkdown:
         Returns:
             附件内容的起始位置，如果未找到则返回-1
         """
-        attachment_patterns = [
-            r'附\s*件\s*[：:]\s*',
-            r'附\s*件\s*\d+\s*[：:]\s*',
-            r'attachment\s*[：:]\s*',
-            r'appendix\s*[：:]\s*'
-        ]
-        
-        for pattern in attachment_patterns:
+        for pattern in ATTACHMENT_START_PATTERNS:
             match = re.search(pattern, text, re.IGNORECASE)
             if match:
                 return match.end()
         
         return -1
 
+    @traced('preprocess')
     def preprocess_image(self, image: Image.Image) -> Image.Image:
         """
         图像预处理，优化OCR效果
@@ -983,66 +2094,158 @@ class PDFToMarkdown:
             print(f"图像预处理时出错: {str(e)}")
             return image  # 如果处理失败，返回原始图像
 
+def find_input_file(input_name: str) -> Optional[str]:
+    """根据不带后缀的文件名查找支持的输入文件"""
+    for category in SUPPORTED_FORMATS.values():
+        for ext in category:
+            test_path = f'{input_name}{ext}'
+            if check_file_exists(test_path):
+                return test_path
+    for ext in SUPPORTED_TEXT_FORMATS:
+        test_path = f'{input_name}{ext}'
+        if check_file_exists(test_path):
+            return test_path
+    return None
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    """解析命令行参数；不提供输入文件时进入交互模式"""
+    parser = argparse.ArgumentParser(description='将PDF、图片和文档转换为Markdown')
+    parser.add_argument('input', nargs='?', help='输入文件路径；省略时进入交互模式')
+    parser.add_argument('-o', '--output', help='输出Markdown文件路径，默认与输入文件同名')
+    parser.add_argument('--clean-level', type=int, choices=[0, 1, 2], default=1, help='文本清理级别（0-2）')
+    parser.add_argument('--lang', help='OCR语言，如 chi_sim、eng')
+    parser.add_argument('--pages', help='只处理指定页码（从1开始），如 "1-50"、"3,5-9"、"100-"')
+    parser.add_argument('--document-key',
+                        help='文档标识，同一文档的各个版本使用相同的标识时启用增量转换，只重新处理变化的页面')
+    parser.add_argument('--shard', action='store_true', help='把PDF拆分为多个分片并行处理')
+    parser.add_argument('--shard-pages', type=int, help='每个分片的页数')
+    parser.add_argument('--workers', type=int, help='本机分片工作进程数，0 表示使用CPU核数')
+    parser.add_argument('--queue-dir', help='分片任务队列目录，多台机器协作时应位于共享存储上')
+    parser.add_argument('--shard-worker', metavar='QUEUE_DIR', help='作为工作进程处理指定队列中的分片任务')
+    parser.add_argument('--metrics', nargs='?', const='-', metavar='PATH',
+                        help='转换结束后输出各阶段耗时和缓存命中等指标；指定路径时以Prometheus文本格式写入文件')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='把各阶段、每页和每个文本块的耗时写入Chrome trace JSON（可在 chrome://tracing 或 Perfetto 中查看）')
+    parser.add_argument('--profile', metavar='PREFIX',
+                        help='开启cProfile和tracemalloc分析，报告写入 PREFIX.prof、PREFIX.cpu.txt 和 PREFIX.memory.txt')
+    return parser.parse_args(argv)
+
+def interactive_args() -> Optional[argparse.Namespace]:
+    """交互式获取输入文件、清理级别和页码范围"""
+    # 获取用户输入的文件名
+    input_name = input('请输入要转换的文件名(不带后缀): ')
+    
+    # 选择清理级别
+    print("\n请选择文本清理级别：")
+    print("0 - 不清理（保留所有OCR识别内容）")
+    print("1 - 适当清理（仅清理确定的无用内容）")
+    print("2 - 强化清理（更积极地清理可能的干扰内容）")
+    
+    clean_level = -1
+    while clean_level not in [0, 1, 2]:
+        try:
+            clean_level = int(input("请输入清理级别(0-2): "))
+        except ValueError:
+            print("请输入有效的数字(0-2)")
+    
+    found_file = find_input_file(input_name)
+    if not found_file:
+        print(f"错误：未找到文件 {input_name}.*")
+        print("支持的文件格式：")
+        for category, extensions in SUPPORTED_FORMATS.items():
+            print(f"- {category.title()}文件:", ", ".join(extensions))
+        print("- 文本文件:", ", ".join(SUPPORTED_TEXT_FORMATS))
+        return None
+    
+    pages = None
+    if found_file.lower().endswith('.pdf'):
+        pages = input("请输入要处理的页码范围(如 1-50，直接回车处理全部页面): ").strip() or None
+    
+    return parse_args([found_file, '-o', f'{input_name}.md', '--clean-level', str(clean_level)]
+                      + (['--pages', pages] if pages else []))
+
+def dump_metrics(target: str) -> None:
+    """
+    输出本进程记录的指标
+    
+    Args:
+        target: '-' 时打印摘要，否则以Prometheus文本格式写入该文件
+    """
+    if target == '-':
+        print("\n性能指标:")
+        print(json.dumps(REGISTRY.snapshot(), ensure_ascii=False, indent=2))
+        return
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write(REGISTRY.render())
+    print(f'性能指标已写入：{target}')
+
 def main():
     """主函数：处理用户输入并执行转换流程"""
     try:
-        converter = PDFToMarkdown()
-        
-        # 获取用户输入的文件名
-        input_name = input('请输入要转换的文件名(不带后缀): ')
+        args = parse_args()
         
-        # 选择清理级别
-        print("\n请选择文本清理级别：")
-        print("0 - 不清理（保留所有OCR识别内容）")
-        print("1 - 适当清理（仅清理确定的无用内容）")
-        print("2 - 强化清理（更积极地清理可能的干扰内容）")
+        # 分片工作进程：处理队列中的任务直到队列为空
+        if args.shard_worker:
+            completed = run_shard_worker(args.shard_worker)
+            print(f"工作进程完成 {completed} 个分片任务")
+            return
         
-        clean_level = -1
-        while clean_level not in [0, 1, 2]:
-            try:
-                clean_level = int(input("请输入清理级别(0-2): "))
-            except ValueError:
-                print("请输入有效的数字(0-2)")
-        
-        # 检查所有支持的文件格式
-        found_file = None
-        for category in SUPPORTED_FORMATS.values():
-            for ext in category:
-                test_path = f'{input_name}{ext}'
-                if check_file_exists(test_path):
-                    found_file = test_path
-                    break
-            if found_file:
-                break
-        
-        # 检查文本格式
-        if not found_file:
-            for ext in SUPPORTED_TEXT_FORMATS:
-                test_path = f'{input_name}{ext}'
-                if check_file_exists(test_path):
-                    found_file = test_path
-                    break
+        if not args.input:
+            args = interactive_args()
+            if args is None:
+                return
         
-        if not found_file:
-            print(f"错误：未找到文件 {input_name}.*")
-            print("支持的文件格式：")
-            for category, extensions in SUPPORTED_FORMATS.items():
-                print(f"- {category.title()}文件:", ", ".join(extensions))
-            print("- 文本文件:", ", ".join(SUPPORTED_TEXT_FORMATS))
+        if not check_file_exists(args.input):
+            print(f"错误：未找到文件 {args.input}")
             return
         
-        # 执行转换
-        output_path = f'{input_name}.md'
+        converter = PDFToMarkdown()
+        if args.lang:
+            converter.set_ocr_language(args.lang)
+        
+        # 跟踪和性能分析时不使用结果缓存，否则命中缓存时没有可分析的内容
+        trace_exporter = None
+        if args.trace:
+            trace_exporter = ChromeTraceExporter()
+            converter.add_trace_hook(trace_exporter)
+            converter.set_result_cache(None)
+        profiler = None
+        if args.profile:
+            profiler = JobProfiler(
+                memory_top=TRACE_CONFIG['MEMORY_TOP'], memory_frames=TRACE_CONFIG['MEMORY_FRAMES']
+            )
+            profiler.start()
+            converter.set_result_cache(None)
         
-        # 修改 process_file 方法调用，传入清理级别
-        result = converter.process_file(found_file, output_path, clean_level)
+        # 执行转换
+        output_path = args.output or str(Path(args.input).with_suffix('.md'))
+        if args.shard:
+            result = converter.process_file_sharded(
+                args.input, output_path, args.clean_level, args.pages,
+                args.shard_pages, args.workers, args.queue_dir, args.document_key
+            )
+        else:
+            result = converter.process_file(
+                args.input, output_path, args.clean_level,
+                document_key=args.document_key, page_range=args.pages
+            )
         
         if result:
-            print(f'转换完成，结果保存在：{result["original"]}')
-            if result['translated']:
-                print(f'翻译后的中文版本保存在：{result["translated_path"]}')
+            print(f'转换完成，结果保存在：{output_path}')
+            if result.get('translated'):
+                print(f'翻译后的中文版本保存在：{output_path.replace(".md", "_zh.md")}')
         else:
             print('转换失败')
+        
+        if trace_exporter is not None:
+            trace_exporter.write(args.trace)
+            print(f'跟踪数据已写入：{args.trace}')
+        if profiler is not None:
+            for path in profiler.stop(args.profile).values():
+                print(f'性能分析报告已写入：{path}')
+        
+        if args.metrics:
+            dump_metrics(args.metrics)
             
     except KeyboardInterrupt:
         print("\n程序被用户中断")
@@ -1050,4 +2253,4 @@ def main():
         print(f"程序运行出错: {str(e)}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,198 @@
+"""
+上传文件的预览
+
+图片和PDF首页渲染为限定尺寸的缩略图（WebP或JPEG），按文件内容哈希缓存在磁盘上，
+由单独的接口提供，上传响应中只返回缩略图地址；文本类文件只返回开头的一部分。
+"""
+import io
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageOps, features
+
+from extractors import iter_docx_markdown
+from utils import clean_temp_files
+
+# 可生成缩略图的图片格式
+THUMBNAIL_IMAGE_FORMATS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.tiff', '.tif'}
+
+# 直接预览开头内容的文本格式
+TEXT_PREVIEW_FORMATS = {'.txt', '.md', '.csv', '.json', '.xml', '.html', '.rst'}
+
+# 缩略图格式对应的MIME类型
+THUMBNAIL_MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def has_thumbnail(file_path: str) -> bool:
+    """判断文件是否可以生成缩略图"""
+    ext = Path(file_path).suffix.lower()
+    return ext == '.pdf' or ext in THUMBNAIL_IMAGE_FORMATS
+
+
+def _render_pdf_page(file_path: str, max_size: int) -> Image.Image:
+    """按缩略图尺寸直接渲染PDF首页，不生成全分辨率图片"""
+    with fitz.open(file_path) as doc:
+        page = doc[0]
+        zoom = min(max_size / max(page.rect.width, page.rect.height), 2.0)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+
+
+def _load_image(file_path: str, max_size: int) -> Image.Image:
+    """读取图片首帧并缩小到缩略图尺寸"""
+    with Image.open(file_path) as img:
+        # JPEG在解码时直接缩小，避免解码整幅大图
+        img.draft('RGB', (max_size, max_size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_size, max_size))
+        return img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+
+def render_thumbnail(file_path: str, max_size: int = 480, image_format: str = 'WEBP',
+                     quality: int = 75) -> bytes:
+    """
+    生成缩略图
+
+    Args:
+        file_path: PDF或图片路径
+        max_size: 长边的最大像素数
+        image_format: WEBP 或 JPEG
+        quality: 压缩质量
+
+    Returns:
+        编码后的缩略图
+    """
+    if Path(file_path).suffix.lower() == '.pdf':
+        img = _render_pdf_page(file_path, max_size)
+    else:
+        img = _load_image(file_path, max_size)
+    if image_format == 'JPEG' and img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def read_text_preview(file_path: str, max_chars: int) -> Tuple[str, bool]:
+    """
+    读取文本类文件的开头部分
+
+    Returns:
+        (预览文本, 是否被截断)
+    """
+    if Path(file_path).suffix.lower() == '.docx':
+        # Word文档：只流式解析开头部分
+        text = next(iter_docx_markdown(file_path, batch_chars=max_chars + 1), '')
+    else:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read(max_chars + 1)
+    return text[:max_chars], len(text) > max_chars
+
+
+class PreviewService:
+    """按内容哈希缓存缩略图"""
+
+    def __init__(self, cache_dir: str, max_size: int = 480, image_format: str = 'WEBP',
+                 quality: int = 75, text_chars: int = 2000, max_age: float = 3600 * 24 * 7):
+        """
+        Args:
+            cache_dir: 缩略图缓存目录
+            max_size: 缩略图长边的最大像素数
+            image_format: WEBP 或 JPEG；Pillow不支持WebP时使用JPEG
+            quality: 压缩质量
+            text_chars: 文本预览的最大字符数
+            max_age: 缩略图缓存的保留时间（秒）
+        """
+        if image_format == 'WEBP' and not features.check('webp'):
+            image_format = 'JPEG'
+        if image_format not in THUMBNAIL_MIME_TYPES:
+            raise ValueError(f"不支持的缩略图格式: {image_format}")
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.image_format = image_format
+        self.quality = quality
+        self.text_chars = text_chars
+        self.max_age = max_age
+        self.mime_type = THUMBNAIL_MIME_TYPES[image_format]
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def etag(self, content_hash: str) -> str:
+        """缩略图的ETag：内容哈希加上渲染参数"""
+        return f'{content_hash[:32]}-{self.max_size}-{self.quality}.{self.image_format.lower()}'
+
+    def thumbnail_path(self, file_path: str, content_hash: str) -> Optional[str]:
+        """
+        获取缩略图路径，首次请求时生成
+
+        Args:
+            file_path: 原文件路径
+            content_hash: 原文件的内容哈希
+
+        Returns:
+            缩略图路径，文件类型不支持时返回None
+        """
+        if not has_thumbnail(file_path):
+            return None
+        path = os.path.join(self.cache_dir, self.etag(content_hash))
+        if os.path.exists(path):
+            return path
+
+        with self._lock:
+            if not os.path.exists(path):
+                data = render_thumbnail(file_path, self.max_size, self.image_format, self.quality)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+        return path
+
+    def sweep(self) -> int:
+        """删除超过保留时间的缩略图，返回删除的文件数"""
+        return clean_temp_files(self.cache_dir, '*', max_age=self.max_age)
+
+    def describe(self, file_path: str, url: str) -> Dict:
+        """
+        生成上传响应中的预览信息（缩略图只返回地址，不在此时渲染）
+
+        Args:
+            file_path: 原文件路径
+            url: 缩略图接口地址
+
+        Returns:
+            预览信息
+        """
+        ext = Path(file_path).suffix.lower()
+        try:
+            if has_thumbnail(file_path):
+                return {'type': 'image', 'url': url}
+            if ext in TEXT_PREVIEW_FORMATS or ext == '.docx':
+                text, truncated = read_text_preview(file_path, self.text_chars)
+                return {'type': 'text', 'data': text, 'truncated': truncated}
+            return {'type': 'unsupported', 'data': '不支持预览此类型文件'}
+        except Exception as e:
+            return {'type': 'error', 'data': f'预览生成失败: {str(e)}'}
+
+
+def create_preview_service(config: Dict) -> PreviewService:
+    """
+    根据配置创建预览服务
+
+    Args:
+        config: PREVIEW_CONFIG
+
+    Returns:
+        PreviewService
+    """
+    return PreviewService(
+        config['CACHE_DIR'],
+        max_size=config['MAX_SIZE'],
+        image_format=config['FORMAT'],
+        quality=config['QUALITY'],
+        text_chars=config['TEXT_CHARS'],
+        max_age=config['CACHE_MAX_AGE_HOURS'] * 3600
+    )
@@ -0,0 +1,201 @@
+"""
+分阶段的转换进度
+
+转换分为若干阶段（extract 提取/OCR、convert 调用API转换、translate 翻译），各阶段按权重
+合成总进度。每个阶段记录已完成的单位数（页、文本块）、字节数和估算的token数，
+剩余时间按总进度的滑动平均速度估算。
+
+页面循环可能很快，进度事件按最大频率合并：两次发送之间的更新只保留最新的一次，
+在间隔结束时补发；阶段切换和完成事件立即发送。
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+# 进度事件的接收函数
+ProgressEventCallback = Callable[[Dict], None]
+
+# 各阶段的默认权重
+DEFAULT_STAGE_WEIGHTS = {'extract': 4, 'convert': 5, 'translate': 1}
+
+
+class ProgressTracker:
+    """记录各阶段的进度，按最大频率发送进度事件"""
+
+    def __init__(self, callback: ProgressEventCallback, max_rate: float = 2.0,
+                 weights: Optional[Dict[str, float]] = None, ema_alpha: float = 0.3):
+        """
+        Args:
+            callback: 进度事件的接收函数
+            max_rate: 每秒最多发送的事件数，0表示不限制
+            weights: 各阶段在总进度中的权重
+            ema_alpha: 速度滑动平均的系数，越大越偏重最近的速度
+        """
+        self.callback = callback
+        self.min_interval = 1 / max_rate if max_rate else 0
+        self.weights = weights or DEFAULT_STAGE_WEIGHTS
+        self.ema_alpha = ema_alpha
+        self._lock = threading.RLock()
+        self._timer = None
+        self.begin([])
+
+    def begin(self, stages: Sequence[str], totals: Optional[Dict[str, int]] = None) -> None:
+        """
+        开始新一轮转换
+
+        Args:
+            stages: 本次转换包含的阶段，按执行顺序
+            totals: 已知的各阶段总单位数
+        """
+        with self._lock:
+            self._cancel_timer()
+            totals = totals or {}
+            self.stages = {
+                name: {'done': 0, 'total': totals.get(name), 'bytes': 0, 'tokens': 0, 'finished': False}
+                for name in stages
+            }
+            self.stage = stages[0] if stages else None
+            self.started_at = time.time()
+            self._progress = 0.0
+            self._rate = None
+            self._sampled_at = self.started_at
+            self._sampled_progress = 0.0
+            self._last_emit = 0.0
+            self._pending = False
+
+    def advance(self, stage: str, units: int = 1, nbytes: int = 0, tokens: int = 0) -> None:
+        """
+        记录一个阶段完成的工作量
+
+        Args:
+            stage: 阶段名
+            units: 完成的单位数（页、文本块）
+            nbytes: 处理的字节数
+            tokens: 估算的token数
+        """
+        with self._lock:
+            state = self.stages.get(stage)
+            if state is None:
+                return
+            state['done'] += units
+            state['bytes'] += nbytes
+            state['tokens'] += tokens
+            changed = stage != self.stage
+            self.stage = stage
+            self._update()
+            self._emit(force=changed)
+
+    def finish_stage(self, stage: str) -> None:
+        """标记阶段已完成（总单位数未知或部分单位被跳过时）"""
+        with self._lock:
+            state = self.stages.get(stage)
+            if state is None or state['finished']:
+                return
+            state['finished'] = True
+            state['total'] = state['done']
+            self._update()
+            self._emit(force=True)
+
+    def start_stage(self, stage: str, total: Optional[int] = None) -> None:
+        """进入新阶段，立即发送事件"""
+        with self._lock:
+            state = self.stages.get(stage)
+            if state is None:
+                return
+            if total is not None:
+                state['total'] = total
+            self.stage = stage
+            self._emit(force=True)
+
+    def finish(self) -> None:
+        """转换完成，发送100%"""
+        with self._lock:
+            for state in self.stages.values():
+                state['finished'] = True
+            self._progress = 100.0
+            self.stage = 'done'
+            self._emit(force=True)
+
+    def _fraction(self, name: str, previous: Optional[Dict]) -> float:
+        """
+        阶段的完成比例
+
+        总单位数已知时按单位计算；未知时（如文本块数要等提取完才知道）按字节数相对于
+        上一阶段的预计总字节数估算
+        """
+        state = self.stages[name]
+        if state['finished']:
+            return 1.0
+        if state['total']:
+            return min(state['done'] / state['total'], 1.0)
+        if previous is not None and previous['bytes'] and state['bytes']:
+            previous_fraction = previous['fraction']
+            if previous_fraction > 0:
+                expected_bytes = previous['bytes'] / previous_fraction
+                return min(state['bytes'] / expected_bytes, 0.99)
+        return 0.0
+
+    def _update(self) -> None:
+        """重新计算总进度和滑动平均速度"""
+        total_weight = sum(self.weights.get(name, 1) for name in self.stages) or 1
+        progress = 0.0
+        previous = None
+        for name, state in self.stages.items():
+            fraction = self._fraction(name, previous)
+            progress += self.weights.get(name, 1) * fraction
+            previous = dict(state, fraction=fraction)
+        # 总进度不回退
+        self._progress = max(self._progress, min(progress * 100 / total_weight, 99.9))
+
+        now = time.time()
+        elapsed = now - self._sampled_at
+        if elapsed >= 0.5:
+            rate = (self._progress - self._sampled_progress) / elapsed
+            self._rate = rate if self._rate is None else self.ema_alpha * rate + (1 - self.ema_alpha) * self._rate
+            self._sampled_at = now
+            self._sampled_progress = self._progress
+
+    def snapshot(self) -> Dict:
+        """当前进度事件"""
+        with self._lock:
+            state = self.stages.get(self.stage, {})
+            eta = None
+            if self._progress >= 100:
+                eta = 0
+            elif self._rate and self._rate > 0:
+                eta = round((100 - self._progress) / self._rate, 1)
+            return {
+                'stage': self.stage,
+                'done': state.get('done'),
+                'total': state.get('total'),
+                'bytes': state.get('bytes'),
+                'tokens': sum(item['tokens'] for item in self.stages.values()),
+                'progress': round(self._progress, 1),
+                'elapsed': round(time.time() - self.started_at, 1),
+                'eta': eta
+            }
+
+    def _emit(self, force: bool = False) -> None:
+        """发送事件；距上次发送不足最小间隔时合并，在间隔结束时补发最新的事件"""
+        now = time.time()
+        wait = self._last_emit + self.min_interval - now
+        if force or wait <= 0:
+            self._cancel_timer()
+            self._last_emit = now
+            self._pending = False
+            self.callback(self.snapshot())
+        elif not self._pending:
+            self._pending = True
+            self._timer = threading.Timer(wait, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            if self._pending:
+                self._emit(force=True)
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
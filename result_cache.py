@@ -0,0 +1,507 @@
+"""
+转换结果缓存
+
+以输入文件的内容哈希和影响输出的处理参数（清理级别、OCR语言、模型、提示词版本等）
+作为缓存键，保存完整的转换结果（Markdown、原始文本和翻译）。相同文件再次转换时
+直接写出缓存的结果文件，跳过OCR和API调用。Web上传、批量上传和命令行共用同一份缓存。
+
+分两层存储：
+    索引    每个缓存键只记录少量元数据（语言、内容块ID、大小、访问时间、命中次数），
+            保存在Redis（多台机器共享）或本地SQLite中
+    内容块  Markdown、原始文本等大块内容按内容哈希压缩保存在磁盘上（gzip或zstd），
+            相同内容只保存一份，按引用计数删除
+
+缓存总大小超过上限时按最近访问时间淘汰，长时间未访问的条目过期删除。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from metrics import record_cache
+
+# 读取文件计算哈希、压缩和解压内容块时的块大小
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# 缓存结果中保存为内容块的字段及对应的结果文件后缀（相对于Markdown文件的 .md）
+BLOB_FIELDS = {'original': '.md', 'raw': '_raw.txt', 'translated': '_zh.md'}
+
+
+def hash_file(file_path: str) -> str:
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_stream_with_hash(stream, file_path: str) -> str:
+    """
+    把上传的数据流写入文件，同时计算内容哈希，避免保存后再读一遍
+
+    Args:
+        stream: 可读的二进制数据流
+        file_path: 保存路径
+
+    Returns:
+        内容的SHA-256
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def make_cache_key(content_hash: str, settings: Dict) -> str:
+    """
+    根据内容哈希和处理参数生成缓存键
+
+    Args:
+        content_hash: 输入文件的SHA-256
+        settings: 影响转换结果的参数
+
+    Returns:
+        缓存键
+    """
+    settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+    return f'{content_hash}-{settings_hash[:16]}'
+
+
+class BlobStore:
+    """按内容寻址的压缩内容块存储，读写都分块进行，不把整个内容载入内存"""
+
+    def __init__(self, directory: str, compression: str = 'gzip'):
+        """
+        Args:
+            directory: 存储目录，多台机器共享Redis索引时应位于共享存储上
+            compression: 压缩算法，gzip 或 zstd（需要安装 zstandard）
+        """
+        if compression == 'gzip':
+            # wbits=31 生成gzip格式
+            self._compressobj = lambda: zlib.compressobj(6, zlib.DEFLATED, 31)
+            self.extension = '.gz'
+        elif compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("使用zstd压缩需要安装 zstandard") from None
+            self._compressobj = zstandard.ZstdCompressor(level=3).compressobj
+            self.extension = '.zst'
+        else:
+            raise ValueError(f"不支持的压缩算法: {compression}")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, blob_id: str) -> str:
+        return os.path.join(self.directory, blob_id[:2], blob_id)
+
+    def put_file(self, file_path: str) -> Optional[Tuple[str, int]]:
+        """
+        分块读取、压缩并保存文件内容
+
+        Returns:
+            (内容块ID, 压缩后的字节数)，文件为空时返回None
+        """
+        digest = hashlib.sha256()
+        compressor = self._compressobj()
+        # 先写临时文件，算出内容哈希后再替换为正式路径，并发读取时不会读到一半的内容
+        tmp_path = os.path.join(self.directory, f'put.{os.getpid()}.{threading.get_ident()}.tmp')
+        size = 0
+        try:
+            with open(file_path, 'rb') as source, open(tmp_path, 'wb') as target:
+                for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+                    digest.update(block)
+                    target.write(compressor.compress(block))
+                    size += len(block)
+                target.write(compressor.flush())
+            if not size:
+                return None
+
+            blob_id = digest.hexdigest() + self.extension
+            path = self._path(blob_id)
+            if os.path.exists(path):
+                return blob_id, os.path.getsize(path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            return blob_id, os.path.getsize(path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_file(self, blob_id: str, file_path: str) -> None:
+        """分块解压内容块并写入文件，内容块不存在时抛出 FileNotFoundError（不创建文件）"""
+        with open(self._path(blob_id), 'rb') as source:
+            decompressor = self._decompressobj(blob_id)
+            with open(file_path, 'wb') as target:
+                for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+                    target.write(decompressor.decompress(block))
+                target.write(decompressor.flush())
+
+    def _decompressobj(self, blob_id: str):
+        if blob_id.endswith('.zst'):
+            import zstandard
+            return zstandard.ZstdDecompressor().decompressobj()
+        return zlib.decompressobj(31)
+
+    def delete(self, blob_id: str) -> None:
+        try:
+            os.remove(self._path(blob_id))
+        except FileNotFoundError:
+            pass
+
+
+class SQLiteIndex:
+    """
+    本地SQLite索引
+
+    同一台机器上的多个进程（Web应用、命令行、分片工作进程）可以共用；
+    路径为 ':memory:' 时只在当前进程内有效，可用于测试
+    """
+
+    def __init__(self, path: str):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    meta TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+                CREATE TABLE IF NOT EXISTS blob_refs (blob_id TEXT PRIMARY KEY, refs INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """读取元数据并更新访问时间和命中次数"""
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT meta FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                'UPDATE entries SET accessed_at = ?, hits = hits + 1 WHERE key = ?', (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, meta: Dict, size: int) -> List[str]:
+        """
+        写入元数据并增加内容块的引用计数
+
+        Returns:
+            被替换的旧条目中不再被引用的内容块ID
+        """
+        orphans = self.remove(key)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO entries (key, meta, size, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(meta), size, time.time())
+            )
+            for blob_id in meta['blobs'].values():
+                self._conn.execute(
+                    'INSERT INTO blob_refs (blob_id, refs) VALUES (?, 1) '
+                    'ON CONFLICT (blob_id) DO UPDATE SET refs = refs + 1', (blob_id,)
+                )
+        return [blob_id for blob_id in orphans if blob_id not in meta['blobs'].values()]
+
+    def remove(self, key: str) -> List[str]:
+        """
+        删除条目
+
+        Returns:
+            不再被任何条目引用的内容块ID
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT meta FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return []
+            self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            orphans = []
+            for blob_id in json.loads(row[0])['blobs'].values():
+                self._conn.execute('UPDATE blob_refs SET refs = refs - 1 WHERE blob_id = ?', (blob_id,))
+                refs = self._conn.execute('SELECT refs FROM blob_refs WHERE blob_id = ?', (blob_id,)).fetchone()
+                if refs is None or refs[0] <= 0:
+                    self._conn.execute('DELETE FROM blob_refs WHERE blob_id = ?', (blob_id,))
+                    orphans.append(blob_id)
+            return orphans
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def oldest_keys(self, limit: int, accessed_before: Optional[float] = None) -> List[str]:
+        """按访问时间从旧到新返回缓存键，可只返回早于指定时间访问的条目"""
+        with self._lock:
+            if accessed_before is None:
+                rows = self._conn.execute(
+                    'SELECT key FROM entries ORDER BY accessed_at LIMIT ?', (limit,)
+                )
+            else:
+                rows = self._conn.execute(
+                    'SELECT key FROM entries WHERE accessed_at < ? ORDER BY accessed_at LIMIT ?',
+                    (accessed_before, limit)
+                )
+            return [row[0] for row in rows]
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO counters (name, value) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET value = value + ?', (name, amount, amount)
+            )
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            counters = dict(self._conn.execute('SELECT name, value FROM counters'))
+            counters['entries'] = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return counters
+
+
+class RedisIndex:
+    """Redis索引，多台机器共享（内容块目录需位于共享存储上）"""
+
+    def __init__(self, client, prefix: str = 'result'):
+        """
+        Args:
+            client: Redis连接（decode_responses=True）
+            prefix: 键前缀
+        """
+        self.client = client
+        self.entry_prefix = f'{prefix}:entry:'
+        self.lru_key = f'{prefix}:lru'
+        self.refs_key = f'{prefix}:refs'
+        self.counters_key = f'{prefix}:counters'
+
+    def get(self, key: str) -> Optional[Dict]:
+        data = self.client.hget(self.entry_prefix + key, 'meta')
+        if data is None:
+            return None
+        pipe = self.client.pipeline()
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.hincrby(self.entry_prefix + key, 'hits', 1)
+        pipe.execute()
+        return json.loads(data)
+
+    def put(self, key: str, meta: Dict, size: int) -> List[str]:
+        orphans = self.remove(key)
+        pipe = self.client.pipeline()
+        pipe.hset(self.entry_prefix + key, mapping={'meta': json.dumps(meta), 'size': size, 'hits': 0})
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.hincrby(self.counters_key, 'size', size)
+        for blob_id in meta['blobs'].values():
+            pipe.hincrby(self.refs_key, blob_id, 1)
+        pipe.execute()
+        return [blob_id for blob_id in orphans if blob_id not in meta['blobs'].values()]
+
+    def remove(self, key: str) -> List[str]:
+        entry = self.client.hgetall(self.entry_prefix + key)
+        # 只有成功删除条目的进程负责减少引用计数，避免并发淘汰时重复计数
+        if not entry or not self.client.delete(self.entry_prefix + key):
+            return []
+        pipe = self.client.pipeline()
+        pipe.zrem(self.lru_key, key)
+        pipe.hincrby(self.counters_key, 'size', -int(entry['size']))
+        blob_ids = list(json.loads(entry['meta'])['blobs'].values())
+        for blob_id in blob_ids:
+            pipe.hincrby(self.refs_key, blob_id, -1)
+        refs = pipe.execute()[2:]
+
+        orphans = [blob_id for blob_id, count in zip(blob_ids, refs) if count <= 0]
+        if orphans:
+            self.client.hdel(self.refs_key, *orphans)
+        return orphans
+
+    def total_size(self) -> int:
+        return int(self.client.hget(self.counters_key, 'size') or 0)
+
+    def oldest_keys(self, limit: int, accessed_before: Optional[float] = None) -> List[str]:
+        if accessed_before is None:
+            return self.client.zrange(self.lru_key, 0, limit - 1)
+        return self.client.zrangebyscore(self.lru_key, 0, accessed_before, start=0, num=limit)
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.client.hincrby(self.counters_key, name, amount)
+
+    def counters(self) -> Dict[str, int]:
+        counters = {name: int(value) for name, value in self.client.hgetall(self.counters_key).items()}
+        counters.pop('size', None)
+        counters['entries'] = self.client.zcard(self.lru_key)
+        return counters
+
+
+class ResultCache:
+    """转换结果缓存：元数据索引加压缩内容块"""
+
+    def __init__(self, index, blobs: BlobStore, ttl: int, max_size: int):
+        """
+        Args:
+            index: SQLiteIndex 或 RedisIndex
+            blobs: 内容块存储
+            ttl: 条目超过此时间（秒）未被访问则删除
+            max_size: 压缩后的总大小上限（字节），超过时按最近访问时间淘汰
+        """
+        self.index = index
+        self.blobs = blobs
+        self.ttl = int(ttl)
+        self.max_size = int(max_size)
+
+    def put(self, key: str, result: Dict, files: Dict[str, str]) -> None:
+        """
+        保存结果并按需淘汰旧条目，写入失败只记录日志
+
+        Args:
+            key: 缓存键
+            result: 元数据（语言、分页索引等）
+            files: 内容块字段（BLOB_FIELDS）到结果文件路径的映射，文件分块压缩保存；空文件不保存
+        """
+        try:
+            meta = dict(result, blobs={}, created_at=time.time())
+            size = 0
+            for name, file_path in files.items():
+                stored = self.blobs.put_file(file_path)
+                if stored is not None:
+                    meta['blobs'][name], blob_size = stored
+                    size += blob_size
+            for blob_id in self.index.put(key, meta, size):
+                self.blobs.delete(blob_id)
+            self.evict()
+        except Exception as e:
+            print(f"写入结果缓存失败: {str(e)}")
+
+    def evict(self) -> int:
+        """
+        删除过期条目，并在总大小超过上限时按最近访问时间淘汰
+
+        Returns:
+            删除的条目数
+        """
+        removed = 0
+        for key in self.index.oldest_keys(1000, accessed_before=time.time() - self.ttl):
+            self._remove(key)
+            removed += 1
+        while self.index.total_size() > self.max_size:
+            keys = self.index.oldest_keys(1)
+            if not keys:
+                break
+            self._remove(keys[0])
+            removed += 1
+        if removed:
+            self.index.incr('evictions', removed)
+        return removed
+
+    def _remove(self, key: str) -> None:
+        for blob_id in self.index.remove(key):
+            self.blobs.delete(blob_id)
+
+    def stats(self) -> Dict:
+        """命中率、条目数和总大小"""
+        counters = self.index.counters()
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'evictions': counters.get('evictions', 0),
+            'entries': counters['entries'],
+            'size_bytes': self.index.total_size(),
+            'max_size_bytes': self.max_size
+        }
+
+    def restore(self, key: str, output_path: str, record_miss: bool = True) -> Optional[Dict]:
+        """
+        读取缓存的结果并写出结果文件（Markdown、_raw.txt 和 _zh.md），内容块分块解压写入
+
+        Args:
+            key: 缓存键
+            output_path: 输出Markdown文件路径
+            record_miss: 未命中时是否计入统计；随后还会由转换流程再次查询时传入False，避免重复计数
+
+        Returns:
+            process_file 格式的结果，未命中或读取失败时返回None
+        """
+        try:
+            meta = self.index.get(key)
+            if meta is None:
+                if record_miss:
+                    self.index.incr('misses')
+                    record_cache('result', False)
+                return None
+
+            paths = {name: output_path.replace('.md', suffix) for name, suffix in BLOB_FIELDS.items()}
+            for name, blob_id in meta['blobs'].items():
+                self.blobs.write_file(blob_id, paths[name])
+            # 空文本不保存内容块，写出空文件
+            for name in ('original', 'raw'):
+                if name not in meta['blobs']:
+                    open(paths[name], 'w', encoding='utf-8').close()
+            self.index.incr('hits')
+            record_cache('result', True)
+        except FileNotFoundError:
+            # 内容块已被删除（如手动清理），删除索引条目
+            print(f"结果缓存的内容块缺失，删除条目: {key}")
+            self._remove(key)
+            return None
+        except Exception as e:
+            print(f"读取结果缓存失败: {str(e)}")
+            return None
+
+        result = {name: value for name, value in meta.items() if name not in ('blobs', 'created_at')}
+        result['output'] = output_path
+        if 'translated' in meta['blobs']:
+            result['translated'] = paths['translated']
+        result['cached'] = True
+        return result
+
+    def store(self, key: str, output_path: str, result: Dict) -> None:
+        """
+        保存转换结果，从结果文件分块读取内容
+
+        Args:
+            key: 缓存键
+            output_path: 输出Markdown文件路径
+            result: process_file 的结果
+        """
+        files = {name: output_path.replace('.md', suffix) for name, suffix in BLOB_FIELDS.items()}
+        if not result.get('translated'):
+            del files['translated']
+        self.put(key, {'language': result.get('language'), 'raw_pages': result.get('raw_pages')}, files)
+
+
+def create_result_cache(config: Dict, redis_client=None) -> Optional[ResultCache]:
+    """
+    根据配置创建结果缓存
+
+    Args:
+        config: RESULT_CACHE_CONFIG
+        redis_client: Redis连接；使用redis索引且未提供时按 REDIS_URL 创建
+
+    Returns:
+        结果缓存，未启用时返回None
+    """
+    if not config['ENABLED']:
+        return None
+    if config['BACKEND'] == 'redis':
+        if redis_client is None:
+            import redis
+            redis_client = redis.Redis.from_url(config['REDIS_URL'], decode_responses=True)
+        index = RedisIndex(redis_client)
+    elif config['BACKEND'] == 'local':
+        index = SQLiteIndex(os.path.join(config['DIR'], 'index.sqlite3'))
+    elif config['BACKEND'] == 'memory':
+        index = SQLiteIndex(':memory:')
+    else:
+        raise ValueError(f"不支持的结果缓存后端: {config['BACKEND']}")
+    blobs = BlobStore(os.path.join(config['DIR'], 'blobs'), config['COMPRESSION'])
+    return ResultCache(index, blobs, config['TTL'], config['MAX_SIZE_MB'] * 1024 * 1024)
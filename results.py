@@ -0,0 +1,169 @@
+"""
+转换结果的分段读取与压缩传输
+
+结果文件（原始文本、Markdown、翻译）保存在上传目录中，接口直接从磁盘读取，
+不再整体放入上传响应：
+    整个文件   按 Accept-Encoding 返回预先压缩的副本（brotli 或 gzip），支持Range请求
+    分段读取   按原文页面（仅原始文本）或按固定大小的文本块返回指定范围的分段
+
+分段的字节偏移保存在结果文件旁的索引文件中（文件名以 .<分段方式>.idx 结尾），
+首次读取时建立；压缩副本同样在首次请求时生成。两者都以文件ID为前缀，随上传文件一起清理。
+"""
+import gzip
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 分段方式
+SECTION_KINDS = ('page', 'chunk')
+
+# 压缩副本的扩展名
+ENCODING_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+_compress_lock = threading.Lock()
+
+
+def available_encodings() -> List[str]:
+    """可用的压缩算法，按优先顺序"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def _index_path(path: str, kind: str) -> str:
+    return f'{path}.{kind}.idx'
+
+
+def write_section_index(path: str, offsets: Sequence[int]) -> None:
+    """
+    保存结果文件的分页索引
+
+    Args:
+        path: 结果文件路径
+        offsets: 各页起始位置的字节偏移
+    """
+    _write_json(_index_path(path, 'page'), {'size': os.path.getsize(path), 'offsets': list(offsets)})
+
+
+def _write_json(path: str, data: Dict) -> None:
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def build_chunk_offsets(path: str, chunk_bytes: int) -> List[int]:
+    """
+    把文件划分为大约 chunk_bytes 大小的文本块
+
+    尽量在空行处划分，避免把段落、表格或代码块拆开；超过两倍大小仍没有空行时在行尾划分
+
+    Returns:
+        各文本块起始位置的字节偏移
+    """
+    offsets = [0]
+    position = 0
+    chunk_start = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            position += len(line)
+            size = position - chunk_start
+            if size >= chunk_bytes and (not line.strip() or size >= chunk_bytes * 2):
+                offsets.append(position)
+                chunk_start = position
+    if len(offsets) > 1 and offsets[-1] == position:
+        offsets.pop()
+    return offsets
+
+
+def section_offsets(path: str, kind: str, chunk_bytes: int) -> Optional[List[int]]:
+    """
+    获取结果文件的分段偏移
+
+    Args:
+        path: 结果文件路径
+        kind: page 或 chunk
+        chunk_bytes: 文本块的大约字节数
+
+    Returns:
+        各分段起始位置的字节偏移；没有分页信息时返回None
+    """
+    index_path = _index_path(path, kind)
+    size = os.path.getsize(path)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        # 结果文件被改写后索引失效
+        if index['size'] == size and index.get('chunk_bytes', chunk_bytes) == chunk_bytes:
+            return index['offsets']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if kind == 'page':
+        return None
+    offsets = build_chunk_offsets(path, chunk_bytes)
+    _write_json(index_path, {'size': size, 'chunk_bytes': chunk_bytes, 'offsets': offsets})
+    return offsets
+
+
+def read_sections(path: str, offsets: Sequence[int], start: int, count: int) -> List[str]:
+    """
+    读取指定范围的分段
+
+    Args:
+        path: 结果文件路径
+        offsets: 各分段的起始偏移
+        start: 第一个分段的序号（从0开始）
+        count: 分段数
+
+    Returns:
+        分段文本
+    """
+    end = min(start + count, len(offsets))
+    if start >= end:
+        return []
+    bounds = list(offsets[start:end]) + [offsets[end] if end < len(offsets) else os.path.getsize(path)]
+    sections = []
+    with open(path, 'rb') as f:
+        f.seek(bounds[0])
+        for begin, finish in zip(bounds, bounds[1:]):
+            sections.append(f.read(finish - begin).decode('utf-8', errors='replace'))
+    return sections
+
+
+def compressed_path(path: str, encoding: str, level: int = 6) -> str:
+    """
+    获取结果文件的压缩副本，首次请求或原文件更新后重新生成
+
+    Args:
+        path: 结果文件路径
+        encoding: br 或 gzip
+        level: 压缩级别（gzip 1-9，brotli 0-11）
+
+    Returns:
+        压缩副本路径
+    """
+    target = path + ENCODING_EXTENSIONS[encoding]
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        return target
+
+    with _compress_lock:
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+            return target
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            if encoding == 'br':
+                compressor = brotli.Compressor(quality=level)
+                for block in iter(lambda: src.read(1024 * 1024), b''):
+                    dst.write(compressor.process(block))
+                dst.write(compressor.finish())
+            else:
+                with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=level, mtime=0) as gz:
+                    shutil.copyfileobj(src, gz, 1024 * 1024)
+        os.replace(tmp_path, target)
+    return target
@@ -0,0 +1,229 @@
+"""
+分块断点续传上传
+
+大文件先创建上传会话，再按偏移量逐块发送（协议参照 tus）：
+    POST   /uploads          创建会话，声明文件名和总大小
+    HEAD   /uploads/<id>     查询已接收的字节数（Upload-Offset），断线后从此处继续
+    PATCH  /uploads/<id>     从 Upload-Offset 处追加一块数据；最后一块到达后自动提交转换
+    DELETE /uploads/<id>     取消上传
+
+数据块直接追加写入磁盘上的临时文件，同时更新内容哈希；最后一块到达时哈希已经算好，
+临时文件原地移动到上传目录，无需再读一遍。哈希状态保存在内存中，服务重启或请求
+落到其他进程时按已接收的部分重新计算一次。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from utils import clean_temp_files
+
+# 追加写入和计算哈希时的块大小
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadOffsetError(Exception):
+    """请求的偏移量与已接收的字节数不一致"""
+
+    def __init__(self, expected: int):
+        super().__init__(f"偏移量不一致，已接收 {expected} 字节")
+        self.expected = expected
+
+
+class UploadTooLargeError(Exception):
+    """上传的数据超过声明的总大小或上限"""
+
+
+class ResumableUploadStore:
+    """分块上传会话，临时文件和会话信息保存在同一目录中"""
+
+    def __init__(self, directory: str, max_size: int, max_age: float):
+        """
+        Args:
+            directory: 临时文件目录（应与上传目录位于同一文件系统，完成后直接移动）
+            max_size: 单个文件的大小上限（字节）
+            max_age: 未完成的上传的保留时间（秒）
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        # 上传ID -> (已计算哈希的字节数, 哈希对象)
+        self._digests = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f'{upload_id}.json')
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f'{upload_id}.part')
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename: str, length: int, metadata: Optional[Dict] = None) -> Dict:
+        """
+        创建上传会话
+
+        Args:
+            filename: 原文件名
+            length: 文件总大小（字节）
+            metadata: 随会话保存的其他信息（如处理参数）
+
+        Returns:
+            会话信息
+        """
+        if length < 0:
+            raise ValueError("文件大小不能为负数")
+        if length > self.max_size:
+            raise UploadTooLargeError(f"文件超过大小上限（{self.max_size // (1024 * 1024)}MB）")
+        upload = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'length': length,
+            'metadata': metadata or {},
+            'created_at': time.time()
+        }
+        with open(self._meta_path(upload['id']), 'w', encoding='utf-8') as f:
+            json.dump(upload, f, ensure_ascii=False)
+        open(self._data_path(upload['id']), 'wb').close()
+        self._digests[upload['id']] = (0, hashlib.sha256())
+        return upload
+
+    def get(self, upload_id: str) -> Optional[Dict]:
+        """
+        获取会话信息（含已接收的字节数 offset），会话不存在时返回None
+        """
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                upload = json.load(f)
+            upload['offset'] = os.path.getsize(self._data_path(upload_id))
+        except (OSError, ValueError):
+            return None
+        return upload
+
+    def append(self, upload_id: str, offset: int, stream) -> Dict:
+        """
+        从指定偏移量追加一块数据
+
+        Args:
+            upload_id: 上传ID
+            offset: 客户端认为已发送的字节数，必须与已接收的字节数一致
+            stream: 数据块的二进制数据流
+
+        Returns:
+            更新后的会话信息
+        """
+        with self._upload_lock(upload_id):
+            upload = self.get(upload_id)
+            if upload is None:
+                raise KeyError(upload_id)
+            if offset != upload['offset']:
+                raise UploadOffsetError(upload['offset'])
+
+            received, digest = self._digest(upload_id, offset)
+            data_path = self._data_path(upload_id)
+            with open(data_path, 'ab') as f:
+                try:
+                    for block in iter(lambda: stream.read(WRITE_BLOCK_SIZE), b''):
+                        if received + len(block) > upload['length']:
+                            raise UploadTooLargeError("数据超过声明的文件大小")
+                        f.write(block)
+                        digest.update(block)
+                        received += len(block)
+                finally:
+                    # 中途断开时丢弃未计入哈希的部分，下次从一致的位置继续
+                    f.flush()
+                    f.truncate(received)
+                    self._digests[upload_id] = (received, digest)
+
+            # 仍在上传的会话不会被过期清理
+            os.utime(self._meta_path(upload_id))
+            upload['offset'] = received
+            return upload
+
+    def _digest(self, upload_id: str, offset: int):
+        """获取已接收部分的哈希状态，不在内存中时重新读取计算"""
+        state = self._digests.get(upload_id)
+        if state is not None and state[0] == offset:
+            return state
+        digest = hashlib.sha256()
+        received = 0
+        with open(self._data_path(upload_id), 'rb') as f:
+            for block in iter(lambda: f.read(WRITE_BLOCK_SIZE), b''):
+                digest.update(block)
+                received += len(block)
+        return received, digest
+
+    def complete(self, upload_id: str, target_path: str) -> str:
+        """
+        把接收完毕的文件移动到目标路径并结束会话
+
+        Args:
+            upload_id: 上传ID
+            target_path: 目标路径
+
+        Returns:
+            文件内容的SHA-256
+        """
+        with self._upload_lock(upload_id):
+            upload = self.get(upload_id)
+            if upload is None:
+                raise KeyError(upload_id)
+            if upload['offset'] != upload['length']:
+                raise UploadOffsetError(upload['offset'])
+            _, digest = self._digest(upload_id, upload['offset'])
+            os.replace(self._data_path(upload_id), target_path)
+            self._forget(upload_id)
+        return digest.hexdigest()
+
+    def delete(self, upload_id: str) -> None:
+        """取消上传，删除临时文件"""
+        with self._upload_lock(upload_id):
+            for path in (self._data_path(upload_id), self._meta_path(upload_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._forget(upload_id)
+
+    def _forget(self, upload_id: str) -> None:
+        try:
+            os.remove(self._meta_path(upload_id))
+        except FileNotFoundError:
+            pass
+        self._digests.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+
+    def sweep(self) -> int:
+        """删除超过保留时间仍未完成的上传，返回删除的文件数"""
+        removed = clean_temp_files(self.directory, '*', max_age=self.max_age)
+        for upload_id in list(self._digests):
+            if not os.path.exists(self._meta_path(upload_id)):
+                self._digests.pop(upload_id, None)
+        return removed
+
+
+def create_upload_store(config: Dict) -> ResumableUploadStore:
+    """
+    根据配置创建分块上传存储
+
+    Args:
+        config: RESUMABLE_UPLOAD_CONFIG
+
+    Returns:
+        ResumableUploadStore
+    """
+    return ResumableUploadStore(
+        config['DIR'],
+        config['MAX_SIZE_MB'] * 1024 * 1024,
+        config['EXPIRE_HOURS'] * 3600
+    )
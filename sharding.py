@@ -0,0 +1,357 @@
+"""
+大文档的分片处理
+
+把PDF按页码范围拆分为多个分片任务，放入目录形式的任务队列。本机的多个工作进程，
+以及共享该目录的其他机器，都可以从队列中领取任务并行转换；全部完成后按分片顺序
+合并各部分的Markdown，并删除队列目录。
+
+每次转换在指定目录下新建一个队列目录（run_<时间>_<随机串>），上次运行留下的任务和
+输出不会混入本次结果。队列目录结构：
+    source.pdf     待转换的文档（复制一份，其他机器无需访问原路径）
+    pending/       等待处理的任务
+    running/       正在处理的任务（领取时原子地从 pending/ 移入，文件名附带领取标记）
+    done/          已完成的任务
+    failed/        失败的任务（附错误信息）
+    output/        各分片的Markdown
+
+超时的任务会被重新排队并由其他进程领取；原领取者随后完成时，其领取标记对应的文件
+已不存在，结果被丢弃，同一任务只会完成一次。
+"""
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import traceback
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils import MarkdownChunkMerger, format_page_range
+
+QUEUE_STATES = ('pending', 'running', 'done', 'failed')
+
+# Markdown标题行；代码块由 ``` 围栏行切换
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*$')
+_FENCE_PATTERN = re.compile(r'^\s*```')
+
+
+def _task_path(queue_dir: str, state: str, name: str) -> str:
+    return os.path.join(queue_dir, state, name)
+
+
+def _list_tasks(queue_dir: str, state: str) -> List[str]:
+    return sorted(name for name in os.listdir(os.path.join(queue_dir, state)) if name.endswith('.json'))
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _task_name(file_name: str) -> str:
+    """running/ 中的文件名（shard_00001.<领取标记>.json）对应的任务文件名"""
+    return file_name.split('.', 1)[0] + '.json'
+
+
+def split_shards(page_numbers: Sequence[int], pages_per_shard: int) -> List[str]:
+    """
+    把页码列表（从0开始）按固定页数拆分为分片
+
+    Returns:
+        每个分片的页码范围字符串
+    """
+    pages_per_shard = max(1, pages_per_shard)
+    return [
+        format_page_range(page_numbers[i:i + pages_per_shard])
+        for i in range(0, len(page_numbers), pages_per_shard)
+    ]
+
+
+def create_shard_queue(queue_root: str, file_path: str, page_ranges: Sequence[str],
+                       options: Dict) -> Tuple[str, List[Dict]]:
+    """
+    在 queue_root 下新建本次运行的分片任务队列
+
+    Args:
+        queue_root: 队列的上级目录；多台机器协作时应位于共享存储上
+        file_path: 待转换的文档
+        page_ranges: 各分片的页码范围
+        options: 传给每个分片的处理参数（clean_level、ocr_language、document_key）
+
+    Returns:
+        (队列目录, 任务列表)
+    """
+    queue_dir = os.path.join(queue_root, f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}")
+    for state in QUEUE_STATES + ('output',):
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    source = 'source' + Path(file_path).suffix.lower()
+    shutil.copyfile(file_path, os.path.join(queue_dir, source))
+
+    tasks = []
+    for index, page_range in enumerate(page_ranges, 1):
+        name = f"shard_{index:05d}"
+        task = dict(options, index=index, name=name, source=source,
+                    page_range=page_range, output=f"output/{name}.md")
+        with open(_task_path(queue_dir, 'pending', name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(task, f, ensure_ascii=False)
+        tasks.append(task)
+    return queue_dir, tasks
+
+
+def remove_shard_queue(queue_dir: str) -> None:
+    """删除队列目录（含复制的文档和各分片的输出），上级目录为空时一并删除"""
+    shutil.rmtree(queue_dir, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(os.path.abspath(queue_dir)))
+    except OSError:
+        pass  # 还有其他运行的队列或其他文件
+
+
+def claim_shard_task(queue_dir: str) -> Optional[Tuple[str, Dict]]:
+    """
+    领取一个待处理的任务
+
+    通过重命名把任务文件从 pending/ 移入 running/，文件名附带本次领取的标记；
+    同一任务只会被一个进程领取，完成时只有标记对应的文件仍在 running/ 中才算完成
+
+    Returns:
+        (running/ 中的文件名, 任务)，队列为空时返回None
+    """
+    for name in _list_tasks(queue_dir, 'pending'):
+        claimed = f"{name[:-len('.json')]}.{uuid.uuid4().hex}.json"
+        try:
+            os.rename(_task_path(queue_dir, 'pending', name), _task_path(queue_dir, 'running', claimed))
+        except FileNotFoundError:
+            continue  # 已被其他进程领取
+        os.utime(_task_path(queue_dir, 'running', claimed))  # 记录领取时间，用于判断超时
+        with open(_task_path(queue_dir, 'running', claimed), 'r', encoding='utf-8') as f:
+            return claimed, json.load(f)
+    return None
+
+
+def run_shard_task(queue_dir: str, task: Dict, output: str) -> None:
+    """在当前进程中转换一个分片，结果写入队列目录中的 output"""
+    from pdf_to_markdown import PDFToMarkdown
+
+    converter = PDFToMarkdown()
+    converter.set_ocr_language(task['ocr_language'])
+    converter.process_file(
+        os.path.join(queue_dir, task['source']),
+        os.path.join(queue_dir, output),
+        task['clean_level'],
+        document_key=task['document_key'],
+        page_range=task['page_range']
+    )
+
+
+def renew_shard_claim(queue_dir: str, claimed: str) -> bool:
+    """
+    确认仍持有领取的任务，并刷新领取时间（避免随后被判为超时）
+
+    Returns:
+        是否仍持有该任务；超时后已被重新排队时返回False
+    """
+    try:
+        os.utime(_task_path(queue_dir, 'running', claimed))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def complete_shard_task(queue_dir: str, claimed: str, task: Dict, state: str) -> bool:
+    """
+    把领取的任务移入 done/ 或 failed/
+
+    Returns:
+        是否仍持有该任务；超时后已被重新排队时返回False，结果应丢弃
+    """
+    running_path = _task_path(queue_dir, 'running', claimed)
+    try:
+        with open(running_path, 'r+', encoding='utf-8') as f:
+            f.truncate()
+            json.dump(task, f, ensure_ascii=False)
+        os.rename(running_path, _task_path(queue_dir, state, _task_name(claimed)))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def run_shard_worker(queue_dir: str) -> int:
+    """
+    循环领取并处理任务，直到队列为空
+
+    可以在任何能访问队列目录的机器上运行：
+        python pdf_to_markdown.py --shard-worker <队列目录>
+
+    Returns:
+        处理的任务数
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    while True:
+        claimed = claim_shard_task(queue_dir)
+        if claimed is None:
+            return processed
+        claimed_name, task = claimed
+        print(f"[{worker}] 处理分片 {task['index']}（第 {task['page_range']} 页）...")
+        # 先写入本次领取专用的文件，完成后再替换为正式输出，避免与重新领取该任务的进程同时写一个文件
+        output = f"output/{claimed_name[:-len('.json')]}.md"
+        try:
+            run_shard_task(queue_dir, task, output)
+            state = 'done'
+        except Exception as e:
+            task['error'] = f"{worker}: {str(e)}\n{traceback.format_exc()}"
+            state = 'failed'
+            print(f"[{worker}] 分片 {task['index']} 处理失败: {str(e)}")
+
+        task['worker'] = worker
+        processed += 1
+        # 先确认仍持有该任务再替换正式输出，已被重新排队时不覆盖其他进程的结果
+        if not renew_shard_claim(queue_dir, claimed_name):
+            print(f"[{worker}] 分片 {task['index']} 处理超时已被重新排队，丢弃本次结果")
+            _remove_file(os.path.join(queue_dir, output))
+            continue
+        if state == 'done':
+            os.replace(os.path.join(queue_dir, output), os.path.join(queue_dir, task['output']))
+        if not complete_shard_task(queue_dir, claimed_name, task, state):
+            print(f"[{worker}] 分片 {task['index']} 处理超时已被重新排队")
+
+
+def requeue_stale_tasks(queue_dir: str, timeout: float) -> int:
+    """把处理时间超过 timeout 秒的任务（如工作机器已宕机）放回等待队列"""
+    requeued = 0
+    now = time.time()
+    for name in _list_tasks(queue_dir, 'running'):
+        path = _task_path(queue_dir, 'running', name)
+        try:
+            if now - os.path.getmtime(path) > timeout:
+                os.rename(path, _task_path(queue_dir, 'pending', _task_name(name)))
+                requeued += 1
+        except FileNotFoundError:
+            continue  # 刚好处理完成
+    return requeued
+
+
+def start_local_workers(queue_dir: str, count: int) -> List[subprocess.Popen]:
+    """启动本机的工作进程（与其他机器上运行的命令相同）"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_to_markdown.py')
+    return [
+        subprocess.Popen([sys.executable, script, '--shard-worker', queue_dir])
+        for _ in range(count)
+    ]
+
+
+def wait_for_shards(queue_dir: str, total: int, poll_interval: float = 5,
+                    task_timeout: float = 3600) -> None:
+    """
+    等待全部分片完成
+
+    本机工作进程结束后，当前进程也参与处理剩余的任务；超时未完成的任务重新排队
+
+    Raises:
+        RuntimeError: 有分片处理失败
+    """
+    while True:
+        run_shard_worker(queue_dir)
+        finished = set(_list_tasks(queue_dir, 'done')) | set(_list_tasks(queue_dir, 'failed'))
+        if len(finished) >= total:
+            break
+        requeue_stale_tasks(queue_dir, task_timeout)
+        time.sleep(poll_interval)
+
+    failed = set(_list_tasks(queue_dir, 'failed')) - set(_list_tasks(queue_dir, 'done'))
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个分片处理失败，详见 {os.path.join(queue_dir, 'failed')}")
+
+
+def _heading_lines(markdown: str) -> List[Tuple[int, int, str]]:
+    """代码块之外的标题行：(行号, 级别, 标题)"""
+    headings = []
+    in_code = False
+    for number, line in enumerate(markdown.split('\n')):
+        if _FENCE_PATTERN.match(line):
+            in_code = not in_code
+            continue
+        match = None if in_code else _HEADING_PATTERN.match(line)
+        if match:
+            headings.append((number, len(match.group(1)), match.group(2)))
+    return headings
+
+
+def shift_heading_levels(markdown: str, shift: int) -> str:
+    """把代码块之外的标题级别整体调整 shift 级（限制在1到6级之间）"""
+    if not shift:
+        return markdown
+    lines = markdown.split('\n')
+    for number, level, title in _heading_lines(markdown):
+        lines[number] = '#' * min(6, max(1, level + shift)) + ' ' + title
+    return '\n'.join(lines)
+
+
+def _continuation_shift(headings: List[Tuple[int, int, str]], previous: Optional[Tuple[int, int]],
+                        known_levels: Dict[str, int]) -> int:
+    """
+    使分片的标题层级与之前的分片衔接所需的调整级数
+
+    各分片独立转换，模型看不到前一分片的结构，分片开头的章节常被写成最高级标题：
+    分片的第一个标题在之前出现过时沿用之前的级别；否则不高于前一分片的最高级标题，
+    也不比前一分片最后一个标题低一级以上
+
+    Args:
+        headings: 分片的标题行
+        previous: 前一分片（调整后）的 (最高标题级别, 最后一个标题的级别)，没有标题时为None
+        known_levels: 之前的分片中各标题（调整后）的级别
+    """
+    if not headings:
+        return 0
+    _, level, title = headings[0]
+    if title in known_levels:
+        return known_levels[title] - level
+    if previous is None:
+        return 0
+    top_level, last_level = previous
+    if level < top_level:
+        return top_level - level
+    if level > last_level + 1:
+        return last_level + 1 - level
+    return 0
+
+
+def merge_shard_outputs(queue_dir: str, tasks: Sequence[Dict], output_path: str) -> None:
+    """
+    按分片顺序合并各分片的Markdown
+
+    每个分片的标题先按前一分片的标题级别整体调整（见 _continuation_shift），
+    再使用与分块合并相同的规则，跨分片重复出现的标题（如每个分片开头重复的文档标题
+    或延续上一分片的章节标题）只保留第一次出现；逐个分片写入，内存中只保留一个分片
+    """
+    merger = MarkdownChunkMerger()
+    previous = None
+    known_levels = {}
+    written = False
+    with open(output_path, 'w', encoding='utf-8') as output:
+        for task in sorted(tasks, key=lambda t: t['index']):
+            with open(os.path.join(queue_dir, task['output']), 'r', encoding='utf-8') as f:
+                markdown = f.read()
+            headings = _heading_lines(markdown)
+            shift = _continuation_shift(headings, previous, known_levels)
+            if headings:
+                markdown = shift_heading_levels(markdown, shift)
+                levels = [min(6, max(1, level + shift)) for _, level, _ in headings]
+                for (_, _, title), level in zip(headings, levels):
+                    known_levels.setdefault(title, level)
+                previous = (min(levels), levels[-1])
+            chunk = merger.add(markdown)
+            if chunk:
+                if written:
+                    output.write('\n')
+                output.write(chunk)
+                written = True
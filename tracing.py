@@ -0,0 +1,385 @@
+"""
+转换流程的跟踪与性能分析
+
+转换器在每个处理阶段（页面渲染、预处理、OCR、清理、分块、API请求、翻译）以及每一页、
+每个文本块的处理前后生成 span，注册的跟踪回调在 span 开始和结束时被调用。阶段 span
+同时计入 metrics 中的阶段耗时直方图。
+
+内置的 ChromeTraceExporter 把 span 写成 Chrome trace-event JSON，可在 chrome://tracing
+或 Perfetto 中按线程查看每一页、每个文本块的耗时。JobProfiler 为单个任务开启 cProfile
+（CPU）和 tracemalloc（内存）分析，开销较大，只在需要时使用。
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from metrics import STAGE_SECONDS
+
+# 计入阶段耗时指标的 span 类别
+STAGE_CATEGORY = 'stage'
+
+
+class TraceHook:
+    """跟踪回调的基类，按需覆盖；回调可能在多个线程中同时被调用"""
+
+    def on_span_start(self, span: Dict) -> None:
+        pass
+
+    def on_span_end(self, span: Dict) -> None:
+        pass
+
+
+class Tracer:
+    """
+    生成 span 并通知跟踪回调
+
+    span 为字典：name、category（stage 阶段、page 页面、chunk 文本块、job 整个任务）、
+    args（页码、序号等附加信息）、start/end（time.perf_counter() 的值）、duration（秒）、
+    thread/thread_name（所在线程）
+    """
+
+    def __init__(self):
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: TraceHook) -> None:
+        with self._lock:
+            self.hooks = self.hooks + [hook]
+
+    def remove_hook(self, hook: TraceHook) -> None:
+        with self._lock:
+            self.hooks = [item for item in self.hooks if item is not hook]
+
+    def start_span(self, name: str, category: str = STAGE_CATEGORY, **args) -> Dict:
+        """开始一个 span"""
+        thread = threading.current_thread()
+        span = {
+            'name': name,
+            'category': category,
+            'args': args,
+            'start': time.perf_counter(),
+            'thread': thread.ident,
+            'thread_name': thread.name
+        }
+        self._notify('on_span_start', span)
+        return span
+
+    def end_span(self, span: Dict, stage_seconds: Optional[float] = None, observe: bool = True) -> None:
+        """
+        结束一个 span
+
+        Args:
+            span: start_span 的返回值
+            stage_seconds: 计入阶段耗时指标的时间，默认为 span 的时长
+            observe: 阶段 span 是否计入耗时指标
+        """
+        span['end'] = time.perf_counter()
+        span['duration'] = span['end'] - span['start']
+        if observe and span['category'] == STAGE_CATEGORY:
+            seconds = span['duration'] if stage_seconds is None else stage_seconds
+            STAGE_SECONDS.observe(seconds, stage=span['name'])
+        self._notify('on_span_end', span)
+
+    def _notify(self, method: str, span: Dict) -> None:
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(span)
+            except Exception as e:
+                # 跟踪回调的错误不影响转换
+                print(f"跟踪回调出错: {str(e)}")
+
+    @contextmanager
+    def span(self, name: str, category: str = STAGE_CATEGORY, **args):
+        """记录代码块的 span，块内可以向 span['args'] 添加信息"""
+        span = self.start_span(name, category, **args)
+        try:
+            yield span
+        finally:
+            self.end_span(span)
+
+    def iter_spans(self, name: str, iterable: Iterable, category: str, **args) -> Iterator:
+        """为迭代器产出的每一项生成一个 span（如逐页提取），args 中附带从1开始的序号 index"""
+        source = iter(iterable)
+        index = 0
+        while True:
+            index += 1
+            span = self.start_span(name, category, index=index, **args)
+            try:
+                item = next(source)
+            except StopIteration:
+                span['args']['exhausted'] = True
+                return
+            finally:
+                self.end_span(span)
+            yield item
+
+    def iter_stage(self, stage: str, make_iter: Callable[[Iterable], Iterator], upstream: Iterable) -> Iterator:
+        """
+        为流水线中的生成器产出的每一项生成阶段 span，计入指标的耗时不含等待上游输入的时间
+
+        流水线中的生成器边读取上游边产出，直接计时会把上游（提取、OCR）的耗时算进来；
+        span 仍覆盖整个产出过程（在跟踪查看器中上游的 span 嵌套在其中），args 中的
+        self_seconds 为扣除上游后的耗时
+
+        Args:
+            stage: 阶段名
+            make_iter: 接收上游迭代器、返回生成器的函数
+            upstream: 上游迭代器
+
+        Returns:
+            与 make_iter 的结果相同的迭代器
+        """
+        waited = [0.0]
+
+        def pull() -> Iterator:
+            source = iter(upstream)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(source)
+                except StopIteration:
+                    return
+                finally:
+                    waited[0] += time.perf_counter() - start
+                yield item
+
+        inner = make_iter(pull())
+        index = 0
+        while True:
+            index += 1
+            waited[0] = 0.0
+            exhausted = False
+            span = self.start_span(stage, index=index)
+            try:
+                item = next(inner)
+            except StopIteration:
+                exhausted = True
+                span['args']['exhausted'] = True
+                return
+            finally:
+                self_seconds = max(time.perf_counter() - span['start'] - waited[0], 0.0)
+                span['args']['self_seconds'] = round(self_seconds, 6)
+                # 迭代结束时的最后一次调用没有产出，不计入指标
+                self.end_span(span, stage_seconds=self_seconds, observe=not exhausted)
+            yield item
+
+
+def traced(name: str, category: str = STAGE_CATEGORY, span_args: Optional[Callable[..., Dict]] = None) -> Callable:
+    """
+    装饰器：方法每次调用在 self.tracer 上生成一个 span
+
+    Args:
+        name: span 名称（阶段名）
+        category: span 类别
+        span_args: 根据方法参数生成 span 附加信息的函数
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            extra = span_args(*args, **kwargs) if span_args else {}
+            with self.tracer.span(name, category, **extra):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ChromeTraceExporter(TraceHook):
+    """把 span 收集为 Chrome trace-event 格式（完整事件 ph=X，时间单位为微秒）"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def on_span_end(self, span: Dict) -> None:
+        event = {
+            'name': span['name'],
+            'cat': span['category'],
+            'ph': 'X',
+            'ts': round((span['start'] - self.origin) * 1e6, 1),
+            'dur': round(span['duration'] * 1e6, 1),
+            'pid': self.pid,
+            'tid': span['thread'],
+            'args': {name: value for name, value in span['args'].items() if value is not None}
+        }
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(span['thread'], span['thread_name'])
+
+    def to_json(self) -> Dict:
+        with self._lock:
+            metadata = [
+                {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                for tid, name in self._threads.items()
+            ]
+            events = sorted(self.events, key=lambda event: event['ts'])
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: str) -> None:
+        """写入 trace 文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, ensure_ascii=False)
+
+
+# 当前线程所属任务的性能分析器，由启动线程传递给任务流水线中的新线程
+_profiling = threading.local()
+
+
+def profiled_in_thread(func: Callable) -> Callable:
+    """
+    包装将在新线程中执行的函数：当前线程所属的任务正在进行CPU分析时，新线程执行该函数期间一并分析
+
+    Args:
+        func: 线程中执行的函数
+
+    Returns:
+        未在分析时返回 func 本身
+    """
+    profiler = getattr(_profiling, 'profiler', None)
+    if profiler is None or not profiler.running:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with profiler.profile_thread():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class JobProfiler:
+    """
+    单个任务的 CPU（cProfile）和内存（tracemalloc）分析
+
+    cProfile 只分析启用它的线程，因此任务流水线中的线程（通过 iter_in_background、
+    iter_parallel_map 启动的页面提取、OCR线程）在执行期间各自启用一个分析器，结束时合并；
+    其他线程（并发的任务、Web请求线程）不受影响。tracemalloc 作用于整个进程，
+    同一时间只允许一个任务开启分析。
+    """
+
+    _active = threading.Lock()
+
+    def __init__(self, cpu: bool = True, memory: bool = True, memory_top: int = 30, memory_frames: int = 1):
+        """
+        Args:
+            cpu: 是否开启 cProfile
+            memory: 是否开启 tracemalloc
+            memory_top: 内存报告中列出的分配位置数
+            memory_frames: tracemalloc 保存的调用栈深度
+        """
+        self.cpu = cpu
+        self.memory = memory
+        self.memory_top = memory_top
+        self.memory_frames = memory_frames
+        self.running = False
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """开始分析；已有其他任务在分析时返回False"""
+        if not JobProfiler._active.acquire(blocking=False):
+            print("已有任务在进行性能分析，本次跳过")
+            return False
+        self.running = True
+        if self.memory:
+            self._started_tracemalloc = not tracemalloc.is_tracing()
+            if self._started_tracemalloc:
+                tracemalloc.start(self.memory_frames)
+            tracemalloc.reset_peak()
+            self._baseline = tracemalloc.take_snapshot()
+        if self.cpu:
+            profile = cProfile.Profile()
+            self._profiles = [profile]
+            _profiling.profiler = self
+            profile.enable()
+        return True
+
+    @contextmanager
+    def profile_thread(self):
+        """在当前线程中分析代码块（任务流水线启动的线程），退出时关闭该线程的分析器"""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        _profiling.profiler = self
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            _profiling.profiler = None
+
+    def stop(self, prefix: str) -> Dict[str, str]:
+        """
+        结束分析并写出报告
+
+        Args:
+            prefix: 报告文件路径前缀
+
+        Returns:
+            报告类型（cpu_stats 可用 pstats/snakeviz 打开、cpu 文本摘要、memory 内存报告）到文件路径的映射
+        """
+        if not self.running:
+            return {}
+        outputs = {}
+        try:
+            if self.cpu:
+                _profiling.profiler = None
+                self._profiles[0].disable()
+                outputs.update(self._write_cpu_report(prefix))
+            if self.memory:
+                outputs['memory'] = self._write_memory_report(prefix)
+        finally:
+            self.running = False
+            JobProfiler._active.release()
+        return outputs
+
+    def _write_cpu_report(self, prefix: str) -> Dict[str, str]:
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            try:
+                stats.add(profile)
+            except TypeError:
+                # 线程没有调用任何函数就结束时没有统计数据
+                continue
+        stats_path = f'{prefix}.prof'
+        stats.dump_stats(stats_path)
+
+        text_path = f'{prefix}.cpu.txt'
+        buffer = io.StringIO()
+        stats.stream = buffer
+        buffer.write(f"分析的线程数: {len(profiles)}\n")
+        stats.sort_stats('cumulative').print_stats(60)
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+        return {'cpu_stats': stats_path, 'cpu': text_path}
+
+    def _write_memory_report(self, prefix: str) -> str:
+        # 不统计分析工具自身的分配
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, module.__file__) for module in (cProfile, pstats, tracemalloc)
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        lines: List[str] = [
+            f"当前占用: {current / 1024 / 1024:.1f} MB",
+            f"峰值: {peak / 1024 / 1024:.1f} MB",
+            f"任务期间新增内存最多的 {self.memory_top} 个位置:"
+        ]
+        for stat in snapshot.compare_to(self._baseline, 'lineno')[:self.memory_top]:
+            lines.append(str(stat))
+        path = f'{prefix}.memory.txt'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
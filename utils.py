@@ -1,7 +1,14 @@
 import os
 import shutil
-from typing import Optional, List
+import math
+import json
+import hashlib
+from collections import Counter, deque
+from itertools import islice
+from typing import Optional, List, Iterable, Iterator, Sequence, Any, Callable
 import re
+import queue
+import threading
 
 def check_file_exists(file_path: str) -> bool:
     """检查文件是否存在"""
@@ -25,14 +32,140 @@ def backup_file(file_path: str) -> Optional[str]:
     shutil.copy2(file_path, backup_path)
     return backup_path
 
-def clean_temp_files(directory: str, pattern: str = "*_temp.*") -> None:
-    """清理临时文件"""
+def clean_temp_files(directory: str, pattern: str = "*_temp.*", max_age: Optional[float] = None) -> int:
+    """
+    清理临时文件
+    
+    Args:
+        directory: 目录
+        pattern: 文件名通配符
+        max_age: 只删除修改时间早于此秒数之前的文件，为None时删除全部匹配的文件
+        
+    Returns:
+        删除的文件数
+    """
     import glob
+    import time
+    expire_before = time.time() - max_age if max_age is not None else None
+    removed = 0
     for temp_file in glob.glob(os.path.join(directory, pattern)):
         try:
+            if not os.path.isfile(temp_file):
+                continue
+            if expire_before is not None and os.path.getmtime(temp_file) >= expire_before:
+                continue
             os.remove(temp_file)
+            removed += 1
         except OSError:
             pass
+    return removed
+
+def sweep_directory(directory: str, max_age: float, max_size: int, pattern: str = "*") -> int:
+    """
+    按时间和总大小清理目录中的文件：先删除超过保留时间的文件，总大小仍超过上限时从最旧的开始删除
+    
+    Args:
+        directory: 目录
+        max_age: 保留时间（秒）
+        max_size: 总大小上限（字节）
+        pattern: 文件名通配符
+        
+    Returns:
+        删除的文件数
+    """
+    import glob
+    import time
+    removed = clean_temp_files(directory, pattern, max_age=max_age)
+    entries = []
+    for path in glob.glob(os.path.join(directory, pattern)):
+        try:
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            pass
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+    return removed
+
+# clean_markdown_format 使用的正则（模块加载时编译一次）
+# 三种代码块标记按顺序分别替换：前一次删除后相连的反引号可能组成新的标记（如 '``````\n'），
+# 合并为一次扫描会漏删
+_CODE_FENCE_PATTERNS = [re.compile(r'```\s*markdown\s*\n'), re.compile(r'```\s*\n'), re.compile(r'```\s*$')]
+_BLANK_LINES_PATTERN = re.compile(r'\n{3,}')
+_HEADER_SPACING_PATTERN = re.compile(r'(#+\s+.+)\n([^#\n])')
+# 列表标记和标题标记的规范化合并为一次扫描（文本前补一个换行，两种模式都以换行开头，
+# 正则引擎只在换行处尝试匹配，比 MULTILINE 的 ^ 在每个位置尝试快得多）；
+# 列表标记后的空白可以跨行，紧接着的下一行若又是列表标记，两者各自替换；
+# 已经是 '- ' 加正文的行替换后不变，不匹配，省去回调
+_LINE_MARKUP_PATTERN = re.compile(r'\n(?:(?!- \S)(\s*[-*+](?:\s*\n[-*+](?=\s))*\s+)|(#+)(?=[^#\s]))')
+# 同上，但匹配不跨行，用于逐行清理
+_LINE_MARKUP_IN_LINE_PATTERN = re.compile(r'\n(?:(?!- \S)([^\S\n]*[-*+][^\S\n]+)|(#+)(?=[^#\s]))')
+_TRAILING_SPACES_PATTERN = re.compile(r' +\n')
+_CODE_FENCE_LINE_PATTERN = re.compile(r'\s*```\s*(?:markdown\s*)?')
+_HEADER_LINE_PATTERN = re.compile(r'#+\s+\S')
+
+def _replace_line_markup(match: re.Match) -> str:
+    """列表标记统一为 '- '，标题的 # 后补空格"""
+    items, header = match.groups()
+    if header is not None:
+        return '\n' + header + ' '
+    return '\n' + '- ' * len(items.split())
+
+def iter_line_blocks(lines: Iterable[str], block_lines: int = 1024) -> Iterator[str]:
+    """
+    把文本行按固定行数合并为文本块，逐行清理时每块执行一次正则替换，而不是每行一次
+    
+    Args:
+        lines: 文本行迭代器
+        block_lines: 每块的行数
+        
+    Returns:
+        以 '\n' 连接的文本块迭代器（去掉了各行的换行符）
+    """
+    iterator = iter(lines)
+    while True:
+        block = list(islice(iterator, block_lines))
+        if not block:
+            return
+        yield '\n'.join(line.rstrip('\r\n') for line in block)
+
+def iter_paragraph_blocks(lines: Iterable[str], max_chars: int) -> Iterator[str]:
+    """
+    把文本行按段落合并为大小约为 max_chars 的文本块（如分块翻译大文件）
+
+    达到 max_chars 后在下一个空行处切分；长时间没有空行时，超过两倍 max_chars 在行尾切分
+
+    Args:
+        lines: 文本行迭代器（如打开的文件对象）
+        max_chars: 每块的目标字符数
+
+    Returns:
+        文本块迭代器（去掉首尾空行，不含空块）
+    """
+    block = []
+    size = 0
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if size >= max_chars and (not line.strip() or size >= 2 * max_chars):
+            text = '\n'.join(block).strip('\n')
+            if text:
+                yield text
+            block = []
+            size = 0
+        block.append(line)
+        size += len(line) + 1
+    text = '\n'.join(block).strip('\n')
+    if text:
+        yield text
 
 def clean_markdown_format(text: str) -> str:
     """
@@ -45,73 +178,554 @@ def clean_markdown_format(text: str) -> str:
         清理后的Markdown文本
     """
     # 移除代码块标记和语言标识
-    text = re.sub(r'```\s*markdown\s*\n', '', text)
-    text = re.sub(r'```\s*\n', '', text)
-    text = re.sub(r'```\s*$', '', text)
+    for pattern in _CODE_FENCE_PATTERNS:
+        text = pattern.sub('', text)
     
     # 统一换行符
     text = text.replace('\r\n', '\n')
     
     # 合并多个空行
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = _BLANK_LINES_PATTERN.sub('\n\n', text)
     
     # 确保标题和正文之间有空行
-    text = re.sub(r'(#+\s+.+)\n([^#\n])', r'\1\n\n\2', text)
-    
-    # 规范化列表格式
-    text = re.sub(r'^\s*[-*+]\s+', '- ', text, flags=re.MULTILINE)
+    text = _HEADER_SPACING_PATTERN.sub(r'\1\n\n\2', text)
     
-    # 规范化标题格式
-    text = re.sub(r'^(#+)([^#\s])', r'\1 \2', text, flags=re.MULTILINE)
+    # 规范化列表和标题格式（补的换行最后随首尾空白去除）
+    text = _LINE_MARKUP_PATTERN.sub(_replace_line_markup, '\n' + text)
     
-    # 移除多余的空格
-    text = re.sub(r' +$', '', text, flags=re.MULTILINE)
+    # 移除行尾多余的空格（文末的空格由 strip 去除）
+    text = _TRAILING_SPACES_PATTERN.sub('\n', text)
     
     # 确保文档以换行符结尾
     text = text.strip() + '\n'
     
     return text
 
-def merge_markdown_chunks(chunks: List[str]) -> str:
+def iter_clean_markdown_lines(lines: Iterable[str]) -> Iterator[str]:
     """
-    合并Markdown文本块，处理重复的标题等问题
+    逐行清理Markdown格式，适用于不便整体载入内存的大文件
+    
+    与 clean_markdown_format 规则相同，但只在行内及相邻行之间生效：
+    列表标记不会跨行合并，连续空行合并为一个，首尾空行被去除
     
     Args:
-        chunks: Markdown文本块列表
+        lines: Markdown文本行迭代器（如打开的文件对象）
         
     Returns:
-        合并后的Markdown文本
+        清理后的文本行迭代器（不含换行符）
     """
-    merged = []
-    seen_headers = set()
-    current_level = 0  # 跟踪当前标题级别
+    pending_blank = False
+    started = False
+    previous_is_header = False
     
-    for chunk in chunks:
+    for block in iter_line_blocks(lines):
+        # 整块规范化列表和标题格式，匹配不跨行，结果与逐行替换相同
+        block = _LINE_MARKUP_IN_LINE_PATTERN.sub(_replace_line_markup, '\n' + block)
+        for line in block[1:].split('\n'):
+            # 移除代码块标记和语言标识
+            if '```' in line and _CODE_FENCE_LINE_PATTERN.fullmatch(line):
+                continue
+            
+            line = line.rstrip(' ')
+            if not line.strip():
+                pending_blank = started
+                continue
+            
+            # 确保标题和正文之间有空行
+            if pending_blank or (previous_is_header and not line.startswith('#')):
+                yield ''
+                pending_blank = False
+            
+            started = True
+            previous_is_header = _HEADER_LINE_PATTERN.match(line) is not None
+            yield line
+
+class MarkdownChunkMerger:
+    """
+    增量合并Markdown文本块，跨块去除重复的标题
+
+    与 merge_markdown_chunks 规则一致，但每次只处理一个块，
+    便于边转换边写入输出文件
+    """
+
+    def __init__(self):
+        self.seen_headers = set()
+
+    def add(self, chunk: str) -> str:
+        """
+        清理并去重一个文本块
+
+        Args:
+            chunk: Markdown文本块
+
+        Returns:
+            处理后的文本块，若块内无有效内容则返回空字符串
+        """
         # 清理当前块的格式
         chunk = clean_markdown_format(chunk)
-        
+
         # 提取所有标题
         headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
-        
+
         # 处理标题
         for level, title in headers:
-            level_num = len(level)
             header = f"{level} {title}"
-            
+
             # 如果标题已存在，移除该标题
-            if header in seen_headers:
+            if header in self.seen_headers:
                 chunk = re.sub(f"^{re.escape(header)}$\n+", '', chunk, flags=re.MULTILINE)
             else:
-                seen_headers.add(header)
-                # 更新当前标题级别
-                current_level = level_num
+                self.seen_headers.add(header)
+
+        return chunk if chunk.strip() else ''
+
+def merge_markdown_chunks(chunks: List[str]) -> str:
+    """
+    合并Markdown文本块，处理重复的标题等问题
+    
+    Args:
+        chunks: Markdown文本块列表
         
-        # 添加处理后的块
-        if chunk.strip():
-            merged.append(chunk)
+    Returns:
+        合并后的Markdown文本
+    """
+    merger = MarkdownChunkMerger()
+    merged = [chunk for chunk in map(merger.add, chunks) if chunk]
     
     # 合并所有块
     merged_text = '\n'.join(merged)
     
     # 最终清理
-    return clean_markdown_format(merged_text) 
\ No newline at end of file
+    return clean_markdown_format(merged_text)
+
+def iter_in_background(iterable: Iterable, maxsize: int = 4) -> Iterator:
+    """
+    在后台线程中消费迭代器，通过有界队列把元素交给调用方
+    
+    生产者最多领先消费者 maxsize 个元素，使上游阶段（如OCR）与下游阶段
+    （如LLM转换）并行执行，同时内存占用保持有界。生产者抛出的异常会在
+    消费端重新抛出；消费端提前退出时生产者线程随之停止。
+    
+    Args:
+        iterable: 要在后台消费的迭代器
+        maxsize: 队列容量
+        
+    Returns:
+        按原顺序产出元素的迭代器
+    """
+    items = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+    done = object()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        error = None
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            # 包括 KeyboardInterrupt 等不属于 Exception 的异常，交给消费端重新抛出
+            error = e
+        finally:
+            # 无论以何种方式结束都发送结束标记，消费端不会一直等待
+            put((done, error))
+
+    from tracing import profiled_in_thread
+    threading.Thread(target=profiled_in_thread(produce), daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+def iter_parallel_map(func: Callable, items: Iterable, workers: int = 0, threads: bool = False) -> Iterator:
+    """
+    在进程池中并行执行 func(item)，按输入顺序产出结果
+    
+    同时提交的任务数限制为进程数的两倍，下游消费较慢时
+    不会把全部结果积压在内存中；items 可以是生成器，按需读取
+    
+    Args:
+        func: 可在子进程中执行的函数（模块级函数或其 functools.partial）
+        items: 参数序列或迭代器
+        workers: 进程数，0 表示使用CPU核数，1 表示在当前进程中顺序执行
+        threads: 使用线程池代替进程池，适用于主要等待外部程序（如tesseract）的任务
+        
+    Returns:
+        结果迭代器，顺序与 items 一致
+    """
+    workers = workers or os.cpu_count() or 1
+    if isinstance(items, Sequence):
+        workers = min(workers, len(items))
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    if threads:
+        from tracing import profiled_in_thread
+        func = profiled_in_thread(func)
+    executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with executor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def format_table_cell(value: Any) -> str:
+    """把单元格的值转换为可放入Markdown表格的文本"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).replace('\r', '').replace('\n', ' ').replace('|', '\\|').strip()
+
+def format_table_row(cells: Sequence[Any], width: Optional[int] = None) -> str:
+    """
+    渲染Markdown表格的一行
+    
+    Args:
+        cells: 单元格的值
+        width: 列数，不足时补空单元格
+    """
+    cells = [format_table_cell(value) for value in cells]
+    if width is not None and len(cells) < width:
+        cells += [''] * (width - len(cells))
+    return '| ' + ' | '.join(cells) + ' |'
+
+def rows_to_markdown_table(rows: Sequence[Sequence[Any]]) -> str:
+    """把表格行渲染为Markdown表格，第一行作为表头"""
+    rows = [row for row in rows if row]
+    if not rows:
+        return ''
+    width = max(len(row) for row in rows)
+    lines = [format_table_row(rows[0], width), '|' + '---|' * width]
+    lines.extend(format_table_row(row, width) for row in rows[1:])
+    return '\n'.join(lines)
+
+# 中日韩字符，估算token数时每个字符约计一个token
+_CJK_CHAR_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数
+    
+    中日韩字符约一个字符一个token，其他字符约四个字符一个token
+    """
+    cjk = len(_CJK_CHAR_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def join_ocr_words(words: Iterable[str]) -> str:
+    """以空格连接OCR识别出的词，相邻的中日韩字符之间不加空格"""
+    parts = []
+    for word in words:
+        if parts and not (_CJK_CHAR_PATTERN.match(parts[-1][-1]) and _CJK_CHAR_PATTERN.match(word[0])):
+            parts.append(' ')
+        parts.append(word)
+    return ''.join(parts)
+
+def ocr_data_to_text(data: dict) -> tuple:
+    """
+    把 pytesseract.image_to_data 的识别结果还原为文本，并计算平均置信度
+    
+    同一行的词以空格连接（相邻的中日韩字符之间不加空格），
+    行之间换行，段落之间空一行
+    
+    Args:
+        data: image_to_data(output_type=Output.DICT) 的结果
+        
+    Returns:
+        (文本, 平均词置信度, 词数)；没有识别到词时置信度为0
+    """
+    paragraphs = []
+    lines = []
+    words = []
+    current_line = current_paragraph = None
+    confidences = []
+    
+    for i, word in enumerate(data['text']):
+        word = (word or '').strip()
+        conf = float(data['conf'][i])
+        if not word or conf < 0:
+            continue
+        confidences.append(conf)
+        
+        paragraph_key = (data['page_num'][i], data['block_num'][i], data['par_num'][i])
+        line_key = paragraph_key + (data['line_num'][i],)
+        if line_key != current_line:
+            if words:
+                lines.append(join_ocr_words(words))
+            words = []
+            current_line = line_key
+        if paragraph_key != current_paragraph:
+            if lines:
+                paragraphs.append('\n'.join(lines))
+            lines = []
+            current_paragraph = paragraph_key
+        
+        words.append(word)
+    
+    if words:
+        lines.append(join_ocr_words(words))
+    if lines:
+        paragraphs.append('\n'.join(lines))
+    
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return '\n\n'.join(paragraphs), mean_confidence, len(confidences)
+
+class BoilerplateStripper:
+    """
+    去除跨页重复出现的页眉、页脚和页码
+    
+    对每页开头和结尾的若干行做归一化（数字替换为#、忽略大小写和空白），
+    在相邻页面范围内统计出现频率。某页边缘的行如果在相邻页中反复出现，
+    就从页面边缘逐行剥离；正文中间的行不受影响。
+    
+    页面以流的方式处理，只需缓存前瞻窗口内的页面
+    """
+    
+    def __init__(self, edge_lines: int = 3, min_ratio: float = 0.5,
+                 window: int = 8, min_pages: int = 3):
+        """
+        Args:
+            edge_lines: 每页开头和结尾各检查的非空行数
+            min_ratio: 行在相邻页中出现的最小比例
+            window: 前后各参考的页数
+            min_pages: 参考页数少于此值时不做剥离
+        """
+        self.edge_lines = edge_lines
+        self.min_ratio = min_ratio
+        self.window = window
+        self.min_pages = min_pages
+        self.stats = {'pages': 0, 'lines': 0, 'chars': 0, 'tokens': 0}
+    
+    @staticmethod
+    def normalize_line(line: str) -> str:
+        """归一化一行文本，使仅页码不同的页眉页脚得到相同的键"""
+        line = line.strip().lstrip('#').strip().lower()
+        line = re.sub(r'\d+', '#', line)
+        return re.sub(r'\s+', ' ', line)
+    
+    def _edge_keys(self, lines: List[str]) -> set:
+        """取页面开头和结尾的非空行的归一化键"""
+        non_empty = [line for line in lines if line.strip()]
+        edges = non_empty[:self.edge_lines] + non_empty[-self.edge_lines:]
+        return {self.normalize_line(line) for line in edges}
+    
+    def strip(self, pages: Iterable[str]) -> Iterator[str]:
+        """
+        逐页剥离重复的页眉页脚
+        
+        Args:
+            pages: 页面文本迭代器
+            
+        Returns:
+            剥离后的页面文本迭代器，页数与输入相同
+        """
+        counts = Counter()
+        pending = deque()   # 尚未输出的页面：(行列表, 键集合)
+        history = deque()   # 已输出页面的键集合
+        
+        def emit():
+            lines, keys = pending.popleft()
+            population = len(pending) + len(history) + 1
+            threshold = max(2, math.ceil(self.min_ratio * population))
+            if population >= self.min_pages:
+                lines = self._strip_edges(lines, counts, threshold)
+            
+            history.append(keys)
+            if len(history) > self.window:
+                counts.subtract(history.popleft())
+            return '\n'.join(lines)
+        
+        for page_text in pages:
+            lines = page_text.split('\n')
+            keys = self._edge_keys(lines)
+            counts.update(keys)
+            pending.append((lines, keys))
+            if len(pending) > self.window:
+                yield emit()
+        
+        while pending:
+            yield emit()
+    
+    def _strip_edges(self, lines: List[str], counts: Counter, threshold: int) -> List[str]:
+        """从页面开头和结尾逐行剥离重复行，遇到第一个非重复行即停止"""
+        def is_boilerplate(line: str) -> bool:
+            return counts[self.normalize_line(line)] >= threshold
+        
+        start, end = 0, len(lines)
+        checked = 0
+        while start < end and checked < self.edge_lines:
+            if lines[start].strip():
+                if not is_boilerplate(lines[start]):
+                    break
+                checked += 1
+            start += 1
+        
+        checked = 0
+        while end > start and checked < self.edge_lines:
+            if lines[end - 1].strip():
+                if not is_boilerplate(lines[end - 1]):
+                    break
+                checked += 1
+            end -= 1
+        
+        removed = [line for line in lines[:start] + lines[end:] if line.strip()]
+        if removed:
+            removed_text = '\n'.join(removed)
+            self.stats['pages'] += 1
+            self.stats['lines'] += len(removed)
+            self.stats['chars'] += len(removed_text)
+            self.stats['tokens'] += estimate_tokens(removed_text)
+        
+        return lines[start:end]
+
+def parse_page_range(spec: str, page_count: int) -> List[int]:
+    """
+    解析页码范围
+    
+    Args:
+        spec: 页码范围，从1开始，如 "1-50"、"3,5-9"、"10-"（到最后一页）
+        page_count: 文档总页数
+        
+    Returns:
+        排序去重后的页码列表（从0开始）
+    """
+    pages = set()
+    for part in spec.replace('，', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        try:
+            first = int(start) if start.strip() else 1
+            last = (int(end) if end.strip() else page_count) if sep else first
+        except ValueError:
+            raise ValueError(f"无效的页码范围: {part}") from None
+        if first < 1 or last < first:
+            raise ValueError(f"无效的页码范围: {part}")
+        pages.update(range(first - 1, min(last, page_count)))
+    if not pages:
+        raise ValueError(f"页码范围 {spec} 不在文档的 {page_count} 页之内")
+    return sorted(pages)
+
+def format_page_range(pages: Sequence[int]) -> str:
+    """把页码列表（从0开始）格式化为页码范围字符串，连续的页码合并为 a-b"""
+    parts = []
+    for page in sorted(pages):
+        if parts and page == parts[-1][1] + 1:
+            parts[-1][1] = page
+        else:
+            parts.append([page, page])
+    return ','.join(
+        f"{first + 1}-{last + 1}" if last > first else str(first + 1)
+        for first, last in parts
+    )
+
+class ConversionManifest:
+    """
+    增量转换清单
+    
+    记录两级缓存，用于文档修订后只重新处理变化的页面：
+    - 页面指纹（文本层哈希或缩略图哈希）到提取文本的映射，跳过渲染和OCR
+    - 清理后页面文本的哈希到Markdown的映射，跳过API转换
+    
+    处理设置（语言、清理级别、模型等）变化时清单失效；保存时只保留本次用到的条目
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, path: str, settings: dict):
+        """
+        Args:
+            path: 清单文件路径
+            settings: 影响输出结果的处理设置，与上次不同时不复用
+        """
+        self.path = path
+        self.settings = settings
+        self.pages = {}
+        self.segments = {}
+        self.stats = {'pages_reused': 0, 'pages_processed': 0, 'segments_reused': 0, 'segments_converted': 0}
+        self._previous_pages = {}
+        self._previous_segments = {}
+        self._lock = threading.Lock()
+        
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == self.VERSION and data.get('settings') == settings:
+                    self._previous_pages = data.get('pages', {})
+                    self._previous_segments = data.get('segments', {})
+            except (OSError, ValueError) as e:
+                print(f"读取增量转换清单失败，将完整处理: {str(e)}")
+    
+    @staticmethod
+    def digest(data) -> str:
+        """计算文本或二进制数据的指纹"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return hashlib.sha1(data).hexdigest()
+    
+    def get_page(self, fingerprint: str) -> Optional[str]:
+        """查找上次提取的页面文本，未命中返回None（跳过的页面记录为空字符串）"""
+        with self._lock:
+            text = self._previous_pages.get(fingerprint)
+            if text is not None:
+                self.pages[fingerprint] = text
+                self.stats['pages_reused'] += 1
+            return text
+    
+    def put_page(self, fingerprint: str, text: str) -> None:
+        """记录页面的提取文本"""
+        with self._lock:
+            self.pages[fingerprint] = text
+            self.stats['pages_processed'] += 1
+    
+    def get_segment(self, text: str) -> Optional[str]:
+        """查找页面文本上次转换得到的Markdown"""
+        key = self.digest(text)
+        with self._lock:
+            markdown = self._previous_segments.get(key)
+            if markdown is not None:
+                self.segments[key] = markdown
+                self.stats['segments_reused'] += 1
+            return markdown
+    
+    def put_segment(self, text: str, markdown: str) -> None:
+        """记录页面文本转换得到的Markdown"""
+        with self._lock:
+            self.segments[self.digest(text)] = markdown
+            self.stats['segments_converted'] += 1
+    
+    def save(self) -> None:
+        """写入清单（先写临时文件再替换，避免中断时损坏）"""
+        ensure_directory_exists(self.path)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': self.VERSION,
+                'settings': self.settings,
+                'pages': self.pages,
+                'segments': self.segments
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
@@ -0,0 +1,186 @@
+"""
+转换器池与启动预热
+
+每个任务新建 PDFToMarkdown 会重复编译清理规则、创建结果缓存索引连接；部署或工作进程
+重启后的第一个请求还要加载 langdetect 的语言模型、初始化 OpenCV，并首次从磁盘读取
+Tesseract 的语言数据，比后续请求慢几秒。
+
+ConverterPool 在进程内保留若干个转换器，任务取用时重置任务相关的状态，用完放回；
+Warmup 在应用启动时于后台线程中填充转换器池并预先完成上述加载，完成后 /ready 报告就绪。
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class ConverterPool:
+    """可复用的转换器实例，后进先出（最近用过的实例优先复用）"""
+
+    def __init__(self, factory: Callable, size: int):
+        """
+        Args:
+            factory: 创建转换器的函数
+            size: 池中保留的实例数，超出的实例用完后丢弃
+        """
+        self.factory = factory
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self.created = 0
+        self._lock = threading.Lock()
+
+    def _create(self):
+        converter = self.factory()
+        with self._lock:
+            self.created += 1
+        return converter
+
+    def fill(self) -> int:
+        """创建实例直到池满，返回新建的实例数"""
+        added = 0
+        while not self._idle.full():
+            try:
+                self._idle.put_nowait(self._create())
+            except queue.Full:
+                break
+            added += 1
+        return added
+
+    @contextmanager
+    def converter(self, **reset_kwargs):
+        """
+        取用一个转换器，池为空时新建；取出时重置任务相关的状态
+
+        Args:
+            reset_kwargs: 传给 PDFToMarkdown.reset 的参数（如进度回调）
+        """
+        try:
+            converter = self._idle.get_nowait()
+        except queue.Empty:
+            converter = self._create()
+        converter.reset(**reset_kwargs)
+        try:
+            yield converter
+        finally:
+            # 不保留上一个任务的回调和跟踪数据
+            converter.reset()
+            try:
+                self._idle.put_nowait(converter)
+            except queue.Full:
+                pass
+
+    def stats(self) -> Dict:
+        return {'size': self.size, 'idle': self._idle.qsize(), 'created': self.created}
+
+
+def warm_langdetect() -> None:
+    """加载 langdetect 的语言模型（首次检测时才从磁盘读取全部语言的模型）"""
+    import langdetect
+    langdetect.detect('This sentence loads the language profiles.')
+
+
+def warm_opencv() -> None:
+    """导入 NumPy 和 OpenCV，并执行一遍图像预处理用到的操作"""
+    import numpy as np
+    import cv2
+
+    image = np.full((64, 64), 255, np.uint8)
+    image = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 8)
+    image = cv2.morphologyEx(image, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    cv2.HoughLines(cv2.Canny(image, 50, 150, apertureSize=3), 1, np.pi / 180, threshold=100)
+
+
+def warm_tesseract(languages: Sequence[str], configs: Dict[str, str]) -> None:
+    """
+    识别一张空白图片，使 Tesseract 的程序和语言数据进入系统文件缓存
+
+    Args:
+        languages: 要预热的OCR语言
+        configs: 各语言的 tesseract 参数（OCR_CONFIG）
+    """
+    import pytesseract
+    from PIL import Image
+
+    image = Image.new('L', (200, 60), 255)
+    for language in languages:
+        pytesseract.image_to_string(image, lang=language, config=configs.get(language, ''))
+
+
+class Warmup:
+    """启动预热：依次执行各步骤，记录耗时或错误；全部完成（无论成败）后视为就绪"""
+
+    def __init__(self, steps: List):
+        """
+        Args:
+            steps: (步骤名, 函数) 列表
+        """
+        self.steps = steps
+        self.state = 'pending'
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def run(self) -> None:
+        """执行预热（阻塞）"""
+        self.state = 'warming'
+        self.started_at = time.time()
+        for name, func in self.steps:
+            start = time.perf_counter()
+            try:
+                func()
+                self.results[name] = {'seconds': round(time.perf_counter() - start, 3)}
+            except Exception as e:
+                # 预热失败不影响服务，首个请求时再按需加载
+                print(f"预热步骤 {name} 失败: {str(e)}")
+                self.results[name] = {'seconds': round(time.perf_counter() - start, 3), 'error': str(e)}
+        self.finished_at = time.time()
+        self.state = 'ready'
+        self._ready.set()
+        print(f"预热完成，用时 {self.finished_at - self.started_at:.2f} 秒")
+
+    def start(self) -> threading.Thread:
+        """在后台线程中执行预热，重复调用时返回已启动的线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待预热完成，返回是否已就绪"""
+        return self._ready.wait(timeout)
+
+    def status(self) -> Dict:
+        status = {'ready': self.ready, 'state': self.state, 'steps': dict(self.results)}
+        if self.finished_at is not None:
+            status['seconds'] = round(self.finished_at - self.started_at, 3)
+        return status
+
+
+def create_warmup(pool: ConverterPool, config: Dict, ocr_configs: Dict[str, str]) -> Warmup:
+    """
+    根据配置创建启动预热
+
+    Args:
+        pool: 要预先填充的转换器池
+        config: WARMUP_CONFIG
+        ocr_configs: 各语言的 tesseract 参数（OCR_CONFIG）
+
+    Returns:
+        Warmup；未启用时不含任何步骤，执行后立即就绪
+    """
+    if not config['ENABLED']:
+        return Warmup([])
+    # 先创建转换器（其中设置 tesseract 路径），再预热OCR
+    return Warmup([
+        ('converters', pool.fill),
+        ('langdetect', warm_langdetect),
+        ('opencv', warm_opencv),
+        ('tesseract', lambda: warm_tesseract(config['OCR_LANGUAGES'], ocr_configs))
+    ])
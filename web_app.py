@@ -1,23 +1,34 @@
 from flask import Flask, request, jsonify, render_template, send_file, Response
-from flask_socketio import SocketIO  # 用于实时进度反馈
+from flask_socketio import SocketIO, emit, join_room, leave_room  # 用于实时进度反馈
 import redis  # 用于缓存
 from werkzeug.utils import secure_filename
 import os
-import fitz  # PyMuPDF用于PDF预览
-from PIL import Image
-import io
-import base64
-from pdf_to_markdown import PDFToMarkdown
+from pdf_to_markdown import PDFToMarkdown, result_cache_key
 from pathlib import Path
 from datetime import datetime, timedelta
 import json
 import hashlib
-from config import LANGUAGE_DISPLAY_NAMES
+import uuid
+from config import (
+    LANGUAGE_DISPLAY_NAMES, JOB_QUEUE_CONFIG, RESULT_CACHE_CONFIG, ARTIFACT_CONFIG, PREVIEW_CONFIG,
+    RESULT_API_CONFIG, RESUMABLE_UPLOAD_CONFIG, TRACE_CONFIG, WARMUP_CONFIG, OCR_CONFIG
+)
+from jobs import create_job_queue, QueueFullError
+from result_cache import create_result_cache, save_stream_with_hash, hash_file
+from artifacts import create_artifact_store, new_file_id
+from previews import create_preview_service
+from resumable import create_upload_store, UploadOffsetError, UploadTooLargeError
+from metrics import REGISTRY
+from tracing import ChromeTraceExporter, JobProfiler
+from warmup import ConverterPool, create_warmup
+from results import (
+    SECTION_KINDS, available_encodings, compressed_path, read_sections, section_offsets, write_section_index
+)
 
 app = Flask(__name__)
 socketio = SocketIO(app)
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB 最大文件大小
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB 单次请求的最大大小（更大的文件使用 /uploads 分块上传）
 
 # Redis缓存配置
 redis_client = redis.Redis(
@@ -26,7 +37,9 @@ redis_client = redis.Redis(
     db=0,
     decode_responses=True
 )
-CACHE_EXPIRE_TIME = 3600 * 24  # 缓存24小时
+
+# 转换结果缓存（与命令行共用配置；redis后端使用上面的连接）
+result_cache = create_result_cache(RESULT_CACHE_CONFIG, redis_client)
 
 # 批量处理配置
 MAX_BATCH_FILES = 10  # 最大批量文件数
@@ -41,6 +54,15 @@ SUPPORTED_FORMATS = {
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 上传文件的缩略图预览（按内容哈希缓存）
+preview_service = create_preview_service(PREVIEW_CONFIG)
+
+# 大文件的分块断点续传
+upload_store = create_upload_store(RESUMABLE_UPLOAD_CONFIG)
+
+# 上传文件索引，后台定期清理过期文件、缩略图缓存和未完成的分块上传
+artifact_store = create_artifact_store(app.config['UPLOAD_FOLDER'], ARTIFACT_CONFIG, redis_client)
+
 ALLOWED_EXTENSIONS = {
     'pdf', 'png', 'jpg', 'jpeg', 'tiff', 'bmp', 'gif', 'webp',
     'doc', 'docx', 'txt', 'csv', 'json', 'xml', 'html', 'md', 'rst'
@@ -54,74 +76,287 @@ def allowed_file(filename):
             return True
     return ext in SUPPORTED_TEXT_FORMATS
 
-def get_file_preview(file_path: str) -> dict:
-    """获取文件预览内容"""
-    ext = Path(file_path).suffix.lower()
+def get_file_preview(file_id: str, file_path: str) -> dict:
+    """
+    获取上传响应中的预览信息：图片和PDF只返回缩略图地址，文本只返回开头部分
     
-    try:
-        if ext == '.pdf':
-            # PDF预览：获取第一页转为图片
-            doc = fitz.open(file_path)
-            page = doc[0]
-            pix = page.get_pixmap()
-            img_data = pix.tobytes()
-            img = Image.frombytes("RGB", [pix.width, pix.height], img_data)
-            
-            # 转换为base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            return {
-                'type': 'image',
-                'data': f'data:image/png;base64,{img_base64}'
-            }
-            
-        elif ext in {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}:
-            # 图片预览
-            with open(file_path, 'rb') as f:
-                img_data = base64.b64encode(f.read()).decode()
-            return {
-                'type': 'image',
-                'data': f'data:image/{ext[1:]};base64,{img_data}'
-            }
-            
-        elif ext in {'.txt', '.md', '.csv', '.json', '.xml', '.html', '.rst'}:
-            # 文本预览
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return {
-                'type': 'text',
-                'data': content
-            }
-            
-        elif ext in {'.doc', '.docx'}:
-            # Word文档预览：提取文本
-            import docx
-            doc = docx.Document(file_path)
-            content = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
-            return {
-                'type': 'text',
-                'data': content
-            }
-            
-        else:
-            return {
-                'type': 'unsupported',
-                'data': '不支持预览此类型文件'
-            }
-    except Exception as e:
-        return {
-            'type': 'error',
-            'data': f'预览生成失败: {str(e)}'
-        }
+    Args:
+        file_id: 文件ID
+        file_path: 上传的文件路径
+        
+    Returns:
+        预览信息
+    """
+    return preview_service.describe(file_path, f'/preview/{file_id}')
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def job_rooms(params: dict) -> list:
+    """任务的进度事件发送到的Socket.IO房间：任务本身，批量任务还包括所在批次"""
+    rooms = [f"job:{params['job_id']}"]
+    if 'batch_id' in params:
+        rooms.append(f"batch:{params['batch_id']}")
+    return rooms
+
+def emit_job_event(name: str, data: dict, rooms: list):
+    """只向订阅了该任务（或批次）的客户端发送事件"""
+    for room in rooms:
+        socketio.emit(name, data, to=room)
+
+def run_upload_job(params: dict, report_progress) -> dict:
+    """
+    在后台执行上传文件的转换
+    
+    Args:
+        params: save_upload 生成的任务参数（附带 job_id）
+        report_progress: 进度回调，参数为总进度（0-100）和进度详情
+        
+    Returns:
+        转换结果，格式与原 /upload 响应相同
+    """
+    # 批量任务的进度事件使用批次ID，单文件任务使用文件ID
+    event = {
+        'task_id': params.get('batch_id', params['file_id']),
+        'job_id': params['job_id'],
+        'index': params.get('index', 0),
+        'filename': params['original_name']
+    }
+    rooms = job_rooms(params)
+    
+    def progress_event_callback(detail: dict):
+        # 转换器已按 PROGRESS_CONFIG['MAX_EMIT_RATE'] 合并进度事件
+        report_progress(detail['progress'], detail)
+        emit_job_event('progress', dict(event, **detail), rooms)
+    
+    try:
+        response_data = convert_upload(params, progress_event_callback)
+    except Exception as e:
+        emit_job_event('file_done', dict(event, status='failed', error=str(e)), rooms)
+        raise
+    
+    emit_job_event('file_done', dict(event, status='done'), rooms)
+    return response_data
+
+def need_translation(ocr_language: str) -> bool:
+    """根据OCR语言判断是否需要翻译"""
+    return not ocr_language.startswith(('chi_sim', 'chi_tra'))
+
+def convert_upload(params: dict, progress_event_callback) -> dict:
+    """转换上传的文件，返回 /upload 格式的结果"""
+    with converter_pool.converter(progress_event_callback=progress_event_callback) as converter:
+        converter.set_ocr_language(params['ocr_language'])
+        converter.set_need_translation(need_translation(params['ocr_language']))
+        # 跟踪的任务不使用结果缓存，否则命中缓存时没有可分析的内容
+        converter.set_result_cache(None if params.get('trace') else result_cache)
+        
+        trace_exporter = None
+        profiler = None
+        if params.get('trace'):
+            trace_exporter = ChromeTraceExporter()
+            converter.add_trace_hook(trace_exporter)
+        if params.get('profile'):
+            profiler = JobProfiler(memory_top=TRACE_CONFIG['MEMORY_TOP'], memory_frames=TRACE_CONFIG['MEMORY_FRAMES'])
+            profiler.start()
+        
+        # 处理文件（命中结果缓存时直接写出缓存的文件）
+        try:
+            result = converter.process_file(
+                file_path=params['file_path'],
+                output_path=params['output_path'],
+                clean_level=params['clean_level'],
+                content_hash=params['content_hash']
+            )
+        finally:
+            reports = write_trace_reports(params, trace_exporter, profiler)
+    if not result:
+        raise RuntimeError('处理文件失败')
+    
+    response_data = build_upload_response(params, result)
+    if reports:
+        artifact_store.register(params['file_id'], reports, completed=True)
+        response_data['files'].update(reports)
+        response_data['diagnostics'] = {
+            report_type: f"/download/{params['file_id']}/{report_type}" for report_type in reports
+        }
+    return response_data
+
+def write_trace_reports(params: dict, trace_exporter, profiler) -> dict:
+    """
+    把跟踪数据和性能分析报告写入上传目录
+    
+    Returns:
+        报告类型（trace、profile_cpu_stats、profile_cpu、profile_memory）到文件名的映射
+    """
+    prefix = os.path.join(app.config['UPLOAD_FOLDER'], f"{params['file_id']}_{params['base_name']}")
+    reports = {}
+    if trace_exporter is not None:
+        trace_exporter.write(f'{prefix}_trace.json')
+        reports['trace'] = os.path.basename(f'{prefix}_trace.json')
+    if profiler is not None:
+        for report_type, path in profiler.stop(f'{prefix}_profile').items():
+            reports[f'profile_{report_type}'] = os.path.basename(path)
+    return reports
+
+def build_upload_response(params: dict, result: dict) -> dict:
+    """
+    根据 process_file 的结果构建 /upload 格式的响应
+    
+    响应中不包含结果内容，只包含各结果文件的大小和读取地址，内容通过 /results 接口分段获取
+    """
+    timestamp = params['file_id']
+    base_name = params['base_name']
+    response_data = {
+        'success': True,
+        'language': LANGUAGE_DISPLAY_NAMES.get(params['ocr_language'], params['ocr_language']),
+        'file_id': timestamp,
+        'original_name': params['original_name'],
+        'files': {
+            'source': os.path.basename(params['file_path']),
+            'raw': f"{timestamp}_{base_name}_raw.txt",
+            'markdown': f"{timestamp}_{base_name}.md"
+        }
+    }
+    
+    if result.get('translated'):
+        response_data['files']['translated'] = f"{timestamp}_{base_name}_zh.md"
+    if result.get('cached'):
+        response_data['cached'] = True
+    
+    # 原始文本的分页索引，用于按原文页面分段读取
+    if result.get('raw_pages'):
+        write_section_index(params['raw_path'], result['raw_pages'])
+    
+    response_data['results'] = {}
+    for file_type in ('raw', 'markdown', 'translated'):
+        if file_type not in response_data['files']:
+            continue
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], response_data['files'][file_type])
+        response_data['results'][file_type] = {
+            'url': f'/results/{timestamp}/{file_type}',
+            'sections_url': f'/results/{timestamp}/{file_type}/sections',
+            'size': os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        }
+    if result.get('raw_pages'):
+        response_data['results']['raw']['pages'] = len(result['raw_pages'])
+    
+    artifact_store.register(timestamp, response_data['files'], completed=True)
+    return response_data
+
+# 可复用的转换器实例，数量与同时执行的任务数相同
+converter_pool = ConverterPool(PDFToMarkdown, WARMUP_CONFIG['POOL_SIZE'] or JOB_QUEUE_CONFIG['WORKERS'])
+
+# 启动预热：填充转换器池并加载语言模型、OpenCV和OCR语言数据，完成后 /ready 报告就绪
+warmup = create_warmup(converter_pool, WARMUP_CONFIG, OCR_CONFIG)
+
+# 后台转换任务队列
+job_queue = create_job_queue(run_upload_job, JOB_QUEUE_CONFIG, redis_client)
+
+def start_background_services():
+    """
+    启动后台服务：上传文件清理、启动预热和任务队列的工作线程
+
+    导入本模块时不启动任何线程；由WSGI服务器加载时，应在每个工作进程中调用一次
+    """
+    artifact_store.start_sweeper(
+        ARTIFACT_CONFIG['SWEEP_INTERVAL'], extra_tasks=[preview_service.sweep, upload_store.sweep]
+    )
+    warmup.start()
+    job_queue.start()
+
+def upload_paths(file_id: str, original_filename: str) -> dict:
+    """上传文件及其转换结果的保存路径"""
+    base_name = os.path.splitext(original_filename)[0]
+    safe_filename = secure_filename(original_filename)
+    
+    # 确保上传目录存在
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    
+    return {
+        'file_path': os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{safe_filename}"),
+        'output_path': os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{base_name}.md"),
+        'raw_path': os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{base_name}_raw.txt"),
+        'file_id': file_id,
+        'base_name': base_name,
+        'original_name': original_filename
+    }
+
+def save_upload(file, file_id: str) -> dict:
+    """
+    保存上传的文件，返回转换任务参数
+    
+    Args:
+        file: 上传的文件对象
+        file_id: 文件ID，作为所有相关文件名的前缀
+        
+    Returns:
+        任务参数
+    """
+    params = upload_paths(file_id, file.filename)
+    
+    # 保存上传的文件，同时计算内容哈希
+    content_hash = save_stream_with_hash(file.stream, params['file_path'])
+    
+    print(f"文件已保存到: {params['file_path']}")
+    artifact_store.register(file_id, {'source': os.path.basename(params['file_path'])}, content_hash=content_hash)
+    
+    params.update({
+        'clean_level': int(request.form.get('cleanLevel', 1)),
+        'ocr_language': request.form.get('language', 'chi_sim'),
+        'content_hash': content_hash
+    })
+    params.update(trace_options(request.form))
+    return params
+
+def trace_options(values) -> dict:
+    """请求中的跟踪选项：trace 生成Chrome trace，profile 另外开启cProfile和tracemalloc"""
+    if not TRACE_CONFIG['WEB_ENABLED']:
+        return {}
+    profile = str(values.get('profile', '')).lower() in ('1', 'true')
+    trace = profile or str(values.get('trace', '')).lower() in ('1', 'true')
+    return {'trace': trace, 'profile': profile} if trace else {}
+
+def start_conversion(params: dict):
+    """
+    命中结果缓存时直接返回结果，否则提交转换任务
+    
+    Args:
+        params: 任务参数
+        
+    Returns:
+        (响应内容, HTTP状态码)
+    """
+    if result_cache is not None and not params.get('trace'):
+        cache_key = result_cache_key(
+            params['content_hash'], params['clean_level'], params['ocr_language'],
+            need_translation(params['ocr_language'])
+        )
+        cached_result = result_cache.restore(cache_key, params['output_path'], record_miss=False)
+        if cached_result is not None:
+            response_data = build_upload_response(params, cached_result)
+            response_data['preview'] = get_file_preview(params['file_id'], params['file_path'])
+            return response_data, 200
+    
+    # 提交转换任务
+    try:
+        job_id = job_queue.submit(params)
+    except QueueFullError as e:
+        artifact_store.remove(params['file_id'])
+        return {'error': str(e)}, 503
+    
+    return {
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/jobs/{job_id}',
+        'result_url': f'/jobs/{job_id}/result',
+        'preview': get_file_preview(params['file_id'], params['file_path'])
+    }, 202
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    """保存上传的文件并提交转换任务，立即返回任务ID"""
     if 'file' not in request.files:
         return jsonify({'error': '没有文件被上传'}), 400
     
@@ -130,122 +365,309 @@ def upload_file():
         return jsonify({'error': '没有选择文件'}), 400
     
     try:
-        # 获取原始文件名和扩展名
-        original_filename = file.filename
-        file_ext = os.path.splitext(original_filename)[1].lower()
-        base_name = os.path.splitext(original_filename)[0]
-        
-        # 生成时间戳
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        response_data, status = start_conversion(save_upload(file, new_file_id()))
+        return jsonify(response_data), status
         
-        # 构建文件路径
-        safe_filename = secure_filename(original_filename)
-        file_path = os.path.join(
-            app.config['UPLOAD_FOLDER'], 
-            f"{timestamp}_{safe_filename}"
-        )
-        
-        output_path = os.path.join(
-            app.config['UPLOAD_FOLDER'], 
-            f"{timestamp}_{base_name}.md"
-        )
-        
-        raw_path = os.path.join(
-            app.config['UPLOAD_FOLDER'], 
-            f"{timestamp}_{base_name}_raw.txt"
-        )
-        
-        # 确保上传目录存在
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        
-        # 保存上传的文件
-        file.save(file_path)
-        
-        print(f"文件已保存到: {file_path}")
-        
-        # 获取文件预览
-        preview = get_file_preview(file_path)
-        
-        # 获取参数
-        clean_level = int(request.form.get('cleanLevel', 1))
-        ocr_language = request.form.get('language', 'chi_sim')
-        display_language = LANGUAGE_DISPLAY_NAMES.get(ocr_language, ocr_language)
-        
-        # 设置语言相关配置
-        converter = PDFToMarkdown()
-        converter.set_ocr_language(ocr_language)
-        
-        # 根据OCR语言设置是否需要翻译
-        need_translation = not ocr_language.startswith(('chi_sim', 'chi_tra'))
-        converter.set_need_translation(need_translation)
-        
-        # 处理文件
-        result = converter.process_file(
-            file_path=file_path,
-            output_path=output_path,
-            clean_level=clean_level
+    except Exception as e:
+        print(f"处理上传文件时出错: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def upload_status_headers(upload: dict) -> dict:
+    """分块上传的状态响应头"""
+    return {
+        'Upload-Offset': str(upload['offset']),
+        'Upload-Length': str(upload['length']),
+        'Cache-Control': 'no-store'
+    }
+
+@app.route('/uploads', methods=['POST'])
+def create_resumable_upload():
+    """
+    创建分块上传会话
+    
+    参数（表单或JSON）：filename 原文件名，length 文件总大小（字节），cleanLevel，language，
+    trace/profile（需开启 TRACE_CONFIG['WEB_ENABLED']）
+    """
+    data = request.get_json(silent=True) or request.form
+    filename = data.get('filename', '')
+    if filename == '':
+        return jsonify({'error': '没有提供文件名'}), 400
+    try:
+        length = int(data.get('length', request.headers.get('Upload-Length', '')))
+        upload = upload_store.create(filename, length, dict({
+            'clean_level': int(data.get('cleanLevel', 1)),
+            'ocr_language': data.get('language', 'chi_sim')
+        }, **trace_options(data)))
+    except ValueError:
+        return jsonify({'error': '文件大小无效'}), 400
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    
+    upload['offset'] = 0
+    location = f"/uploads/{upload['id']}"
+    response = jsonify({
+        'upload_id': upload['id'],
+        'upload_url': location,
+        'offset': 0,
+        'length': length,
+        'chunk_size': RESUMABLE_UPLOAD_CONFIG['CHUNK_MB'] * 1024 * 1024
+    })
+    response.headers.update(upload_status_headers(upload))
+    response.headers['Location'] = location
+    return response, 201
+
+@app.route('/uploads/<upload_id>', methods=['HEAD', 'GET'])
+def get_resumable_upload(upload_id):
+    """查询分块上传已接收的字节数，断线后从 Upload-Offset 处继续发送"""
+    upload = upload_store.get(upload_id)
+    if upload is None:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    response = jsonify({'upload_id': upload_id, 'offset': upload['offset'], 'length': upload['length']})
+    response.headers.update(upload_status_headers(upload))
+    return response
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def append_resumable_upload(upload_id):
+    """
+    追加一块数据，请求头 Upload-Offset 为这一块在文件中的起始位置
+    
+    未接收完时返回204和新的 Upload-Offset；最后一块到达后保存文件并提交转换，
+    返回与 /upload 相同的响应
+    """
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return jsonify({'error': '缺少或无效的 Upload-Offset 请求头'}), 400
+    
+    upload = upload_store.get(upload_id)
+    if upload is None:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    if request.content_length is not None and offset + request.content_length > upload['length']:
+        return jsonify({'error': '数据超过声明的文件大小'}), 413
+    
+    try:
+        upload = upload_store.append(upload_id, offset, request.stream)
+    except KeyError:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    except UploadOffsetError as e:
+        response = jsonify({'error': str(e), 'offset': e.expected})
+        response.headers['Upload-Offset'] = str(e.expected)
+        return response, 409
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    
+    if upload['offset'] < upload['length']:
+        return '', 204, upload_status_headers(upload)
+    
+    # 最后一块已到达：哈希已随数据块算好，文件直接移动到上传目录
+    try:
+        file_id = new_file_id()
+        params = upload_paths(file_id, upload['filename'])
+        params.update(upload['metadata'])
+        params['content_hash'] = upload_store.complete(upload_id, params['file_path'])
+        print(f"文件已保存到: {params['file_path']}")
+        artifact_store.register(
+            file_id, {'source': os.path.basename(params['file_path'])}, content_hash=params['content_hash']
         )
-        
-        if result:
-            # 读取原始文本
-            try:
-                with open(raw_path, 'r', encoding='utf-8') as f:
-                    raw_content = f.read()
-            except FileNotFoundError:
-                raw_content = "无法读取原始文本"
-            except Exception as e:
-                raw_content = f"读取原始文本时出错: {str(e)}"
-            
-            response_data = {
-                'success': True,
-                'preview': preview,
-                'raw_text': raw_content,
-                'markdown': result['original'],
-                'language': display_language,
-                'file_id': timestamp,
-                'original_name': original_filename,
-                'files': {
-                    'source': f"{timestamp}_{safe_filename}",
-                    'raw': f"{timestamp}_{base_name}_raw.txt",
-                    'markdown': f"{timestamp}_{base_name}.md"
-                }
-            }
-            
-            if result.get('translated'):
-                response_data['translated'] = result['translated']
-                response_data['files']['translated'] = f"{timestamp}_{base_name}_zh.md"
-            
-            return jsonify(response_data)
-        else:
-            return jsonify({'error': '处理文件失败'}), 500
-            
+        response_data, status = start_conversion(params)
+        response = jsonify(response_data)
+        response.headers.update(upload_status_headers(upload))
+        return response, status
     except Exception as e:
         print(f"处理上传文件时出错: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_resumable_upload(upload_id):
+    """取消分块上传"""
+    if upload_store.get(upload_id) is None:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    upload_store.delete(upload_id)
+    return '', 204
+
+def job_status(job: dict) -> dict:
+    """任务状态（不含结果内容）"""
+    status = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'progress_detail': job.get('progress_detail'),
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at']
+    }
+    if job['status'] == 'done':
+        status['result_url'] = f"/jobs/{job['id']}/result"
+    elif job['status'] == 'failed':
+        status['error'] = job['error']
+    return status
+
+@app.route('/jobs')
+def list_jobs():
+    """任务队列的整体状态"""
+    return jsonify(job_queue.stats())
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """查询任务状态"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job_status(job))
+
+@app.route('/jobs/<job_id>/result')
+def get_job_result(job_id):
+    """获取任务结果；任务未完成时返回202和当前状态"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job['status'] == 'done':
+        return jsonify(job['result'])
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error']}), 500
+    return jsonify(job_status(job)), 202
+
+@app.route('/cache/stats')
+def cache_stats():
+    """结果缓存的命中率、条目数和占用空间"""
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(result_cache.stats(), enabled=True))
+
+@app.route('/ready')
+def ready():
+    """就绪检查：启动预热完成后返回200，之前返回503（可用作负载均衡的就绪探针）"""
+    status = dict(warmup.status(), converters=converter_pool.stats())
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics')
+def metrics():
+    """各处理阶段的耗时分布和页数、token、重试、缓存命中等计数（Prometheus文本格式，按进程统计）"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # 添加文件下载路由
 @app.route('/download/<file_id>/<file_type>')
 def download_file(file_id, file_type):
     """下载处理后的文件"""
     try:
-        files = os.listdir(app.config['UPLOAD_FOLDER'])
-        target_file = next((f for f in files if f.startswith(file_id) and f.endswith(file_type)), None)
+        # file_type 可以是文件类型（source、raw、markdown、translated）或完整文件名
+        target_path = artifact_store.find(file_id, file_type)
         
-        if target_file:
+        if target_path:
             return send_file(
-                os.path.join(app.config['UPLOAD_FOLDER'], target_file),
+                target_path,
                 as_attachment=True,
-                download_name=target_file.replace(file_id + '_', '')
+                download_name=os.path.basename(target_path).replace(file_id + '_', '')
             )
         return jsonify({'error': '文件不存在'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/preview/<file_id>')
+def preview_file(file_id):
+    """上传文件的缩略图（首次请求时生成，之后按内容哈希从缓存返回）"""
+    try:
+        file_path = artifact_store.find(file_id, 'source')
+        if file_path is None:
+            return jsonify({'error': '文件不存在'}), 404
+
+        content_hash = artifact_store.get(file_id).get('content_hash') or hash_file(file_path)
+        thumbnail_path = preview_service.thumbnail_path(file_path, content_hash)
+        if thumbnail_path is None:
+            return jsonify({'error': '不支持预览此类型文件'}), 404
+
+        # 内容哈希决定缩略图内容，浏览器可凭ETag复用（未变化时返回304）
+        return send_file(
+            os.path.abspath(thumbnail_path),
+            mimetype=preview_service.mime_type,
+            etag=preview_service.etag(content_hash),
+            max_age=PREVIEW_CONFIG['HTTP_MAX_AGE'],
+            conditional=True
+        )
+    except Exception as e:
+        return jsonify({'error': f'预览生成失败: {str(e)}'}), 500
+
+# 可通过 /results 读取的结果文件类型
+RESULT_FILE_TYPES = ('raw', 'markdown', 'translated')
+
+@app.route('/results/<file_id>/<file_type>')
+def get_result_file(file_id, file_type):
+    """
+    读取整个结果文件
+    
+    按 Accept-Encoding 返回 brotli 或 gzip 压缩的副本；带 Range 请求头时返回未压缩文件的指定字节范围
+    """
+    if file_type not in RESULT_FILE_TYPES:
+        return jsonify({'error': '不支持的结果类型'}), 400
+    file_path = artifact_store.find(file_id, file_type)
+    if file_path is None:
+        return jsonify({'error': '文件不存在'}), 404
+    
+    mimetype = 'text/plain' if file_type == 'raw' else 'text/markdown'
+    encoding = None
+    if 'Range' not in request.headers and os.path.getsize(file_path) >= RESULT_API_CONFIG['COMPRESS_MIN_BYTES']:
+        encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding:
+        level = RESULT_API_CONFIG['BROTLI_QUALITY'] if encoding == 'br' else RESULT_API_CONFIG['GZIP_LEVEL']
+        file_path = compressed_path(file_path, encoding, level)
+    
+    response = send_file(file_path, mimetype=f'{mimetype}; charset=utf-8', conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/results/<file_id>/<file_type>/sections')
+def get_result_sections(file_id, file_type):
+    """
+    分段读取结果文件
+    
+    查询参数：
+        by: page（按原文页面，仅原始文本）或 chunk（按大约固定大小的文本块，默认）
+        start: 第一个分段的序号（从0开始）
+        count: 分段数
+    """
+    if file_type not in RESULT_FILE_TYPES:
+        return jsonify({'error': '不支持的结果类型'}), 400
+    by = request.args.get('by', 'chunk')
+    if by not in SECTION_KINDS:
+        return jsonify({'error': f'不支持的分段方式: {by}'}), 400
+    try:
+        start = max(int(request.args.get('start', 0)), 0)
+        count = min(max(int(request.args.get('count', 1)), 1), RESULT_API_CONFIG['MAX_SECTIONS'])
+    except ValueError:
+        return jsonify({'error': 'start 和 count 必须是整数'}), 400
+    
+    file_path = artifact_store.find(file_id, file_type)
+    if file_path is None:
+        return jsonify({'error': '文件不存在'}), 404
+    offsets = section_offsets(file_path, by, RESULT_API_CONFIG['CHUNK_KB'] * 1024)
+    if offsets is None:
+        return jsonify({'error': '该结果没有分页信息，请按 chunk 分段读取'}), 404
+    
+    sections = read_sections(file_path, offsets, start, count)
+    next_start = start + len(sections)
+    return jsonify({
+        'by': by,
+        'total': len(offsets),
+        'start': start,
+        'sections': sections,
+        'next_start': next_start if next_start < len(offsets) else None
+    })
+
 @app.route('/batch_upload', methods=['POST'])
 def batch_upload():
-    """批量文件上传处理"""
+    """
+    批量文件上传处理
+    
+    每个文件作为一个任务提交到后台队列，由工作线程并发转换；
+    通过 /batches/<batch_id> 按上传顺序查询各文件的状态和已完成的结果，
+    或监听 Socket.IO 的 progress 和 file_done 事件
+    """
     if 'files[]' not in request.files:
         return jsonify({'error': '没有文件被上传'}), 400
         
@@ -253,66 +675,59 @@ def batch_upload():
     if len(files) > MAX_BATCH_FILES:
         return jsonify({'error': f'最多支持{MAX_BATCH_FILES}个文件同时处理'}), 400
     
-    results = []
-    task_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    batch_id = uuid.uuid4().hex
     
-    for file in files:
-        try:
-            # 处理单个文件
-            result = process_single_file(file, task_id)
-            results.append(result)
-        except Exception as e:
-            results.append({
-                'filename': file.filename,
-                'error': str(e)
-            })
+    params_list = []
+    try:
+        for index, file in enumerate(files):
+            params = save_upload(file, new_file_id())
+            params.update({'batch_id': batch_id, 'index': index})
+            params_list.append(params)
+        
+        job_ids = job_queue.submit_batch(batch_id, params_list)
+    except Exception as e:
+        for params in params_list:
+            artifact_store.remove(params['file_id'])
+        if isinstance(e, QueueFullError):
+            return jsonify({'error': str(e)}), 503
+        print(f"处理批量上传时出错: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'task_id': batch_id,
+        'status_url': f'/batches/{batch_id}',
+        'jobs': [
+            {'index': index, 'filename': file.filename, 'job_id': job_id, 'status_url': f'/jobs/{job_id}'}
+            for index, (file, job_id) in enumerate(zip(files, job_ids))
+        ]
+    }), 202
+
+@app.route('/batches/<batch_id>')
+def get_batch(batch_id):
+    """按上传顺序返回批次中各文件的状态，已完成的文件附带结果"""
+    jobs = job_queue.get_batch(batch_id)
+    if jobs is None:
+        return jsonify({'error': '批次不存在或已过期'}), 404
     
+    results = []
+    for index, job in enumerate(jobs):
+        if job is None:
+            results.append({'index': index, 'status': 'expired'})
+            continue
+        item = dict(job_status(job), index=index, filename=job['params']['original_name'])
+        if job['status'] == 'done':
+            item['result'] = job['result']
+        results.append(item)
+    
+    finished = sum(1 for item in results if item['status'] in ('done', 'failed', 'expired'))
     return jsonify({
-        'task_id': task_id,
+        'task_id': batch_id,
+        'status': 'done' if finished == len(results) else 'running',
+        'total': len(results),
+        'finished': finished,
         'results': results
     })
 
-def process_single_file(file, task_id):
-    """处理单个文件，支持进度反馈"""
-    try:
-        original_filename = file.filename
-        file_ext = os.path.splitext(original_filename)[1].lower()
-        
-        # 检查缓存
-        params = {
-            'clean_level': request.form.get('cleanLevel', 1),
-            'language': request.form.get('language', 'chi_sim')
-        }
-        
-        # 保存文件并获取缓存键
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{task_id}_{secure_filename(original_filename)}")
-        file.save(temp_path)
-        cache_key = get_cache_key(temp_path, params)
-        
-        # 检查缓存
-        cached_result = redis_client.get(cache_key)
-        if cached_result:
-            os.remove(temp_path)
-            return json.loads(cached_result)
-        
-        # 实际处理文件
-        converter = PDFToMarkdown(progress_callback=lambda p: socketio.emit('progress', {
-            'task_id': task_id,
-            'filename': original_filename,
-            'progress': p
-        }))
-        
-        result = converter.process_file(temp_path, params)
-        
-        # 保存缓存
-        redis_client.setex(cache_key, CACHE_EXPIRE_TIME, json.dumps(result))
-        
-        os.remove(temp_path)
-        return result
-        
-    except Exception as e:
-        raise Exception(f"处理文件 {file.filename} 时出错: {str(e)}")
-
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
@@ -321,5 +736,33 @@ def handle_connect():
 def handle_disconnect():
     print('Client disconnected')
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """
+    订阅任务或批次的进度事件（progress、file_done）
+    
+    Args:
+        data: {'job_id': ...} 或 {'batch_id': ...}
+    """
+    if data.get('job_id'):
+        join_room(f"job:{data['job_id']}")
+        # 订阅前已有的进度立即发给该客户端
+        job = job_queue.get(data['job_id'])
+        if job is not None:
+            emit('job_status', job_status(job))
+    elif data.get('batch_id'):
+        join_room(f"batch:{data['batch_id']}")
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """取消订阅任务或批次的进度事件"""
+    if data.get('job_id'):
+        leave_room(f"job:{data['job_id']}")
+    elif data.get('batch_id'):
+        leave_room(f"batch:{data['batch_id']}")
+
 if __name__ == '__main__':
+    # 自动重载时父进程只监视文件变化并重启子进程，后台服务只在处理请求的子进程中启动
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     app.run(debug=True, port=5000, use_reloader=True) 
\ No newline at end of file